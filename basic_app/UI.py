@@ -1,65 +1,73 @@
 import gradio as gr
-import time  
-import tcm_agent, query_fix, west_agent
+import os
+import sys
+import uuid
 import dotenv
 dotenv.load_dotenv()
-import os
-from langchain_neo4j import Neo4jGraph
-from langchain_community.chat_models import ChatTongyi
-from langchain_chroma import Chroma
-from langchain_community.embeddings import DashScopeEmbeddings
-
-
-graph = Neo4jGraph(database=os.environ['DB_NAME'])
-llm = ChatTongyi(
-        model="qwen-max",        
-        temperature=0,
-        # max_tokens=2048,
-)
-embedding = DashScopeEmbeddings(model="text-embedding-v2")
-vectorstore = Chroma(
-    persist_directory="basic_app/chroma_db_embedding",
-    embedding_function=embedding
-)
-def process_query_streaming(user_input):
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.agents.session_manager import SessionManager
+from src.agents.stream_events import StreamEventType
+
+
+_session_manager = None
+
+
+def get_session_manager() -> SessionManager:
+    """获取多会话管理器（首次调用时创建；批量分词的子进程会重新导入本模块，不在导入时创建）
+
+    各浏览器会话共享知识库、模型和缓存，对话记忆和问诊状态按会话隔离。
+    """
+    global _session_manager
+    if _session_manager is None:
+        _session_manager = SessionManager()
+    return _session_manager
+
+
+def new_session_id() -> str:
+    """为每个浏览器会话生成独立的会话ID（页面加载时调用）"""
+    return uuid.uuid4().hex
+
+def process_query_streaming(user_input, session_id):
     """
-    模拟分阶段处理，并在每个阶段结束后 yield 当前状态和结果。
-    返回格式: (top_k, graphrag, flow_state)
-    flow_state: 0=初始, 1=中医完成, 2=西医完成, 3=整合完成, 4=全部完成
+    按集成诊断Agent的流式事件分阶段处理，每个事件后 yield 当前状态和结果。
+    返回格式: (chat, top_k, graphrag, flow_state)
+    flow_state: 0=初始, 1=首个知识分支完成, 2=中西医均完成, 3=整合中, 4=全部完成
     """
 
     # 初始状态
     yield "", "", "", 0
 
-    query_tuple = query_fix.fix_query(user_input,llm,vectorstore,10)
-    fixed_query = query_tuple['query']
-    #WST
-    west_ret = west_agent.medical_qa_pipeline(llm_choice="qwen-max",
-                                   vector_db_path="./chroma_db_dash_w",
-                                   user_query=user_input)
-    # top_k_result = f"西医分析中... 基于症状 '{user_input}'，初步建议：\n- 疏肝理气\n- 养心安神"
-    top_k_result = f"searched content:\n{west_ret['retrieved_docs']}"
-    # final_topk = west_ret['answer']
-    yield "", top_k_result,"", 1
-
-    # TCM
-    graph_rag_res = tcm_agent.rag_query(graph,llm,fixed_query)
-    # graphrag_result = f"西医知识图谱匹配：\n- ICD-10: F51.0 (失眠)\n- 相关检查: 睡眠监测, 甲状腺功能"
-    graphrag_result = graph_rag_res['result']
-    yield "", top_k_result, graphrag_result, 2
-
-    # 模拟信息整合
-    time.sleep(2)
-    integrated_topk = f"【综合建议】\n{top_k_result}\n\n补充：{graphrag_result}"
-    yield "", integrated_topk, graphrag_result, 3
-
-    # 最终输出
-    time.sleep(2)
-    # final_topk = f"✅ 最终诊断建议：\n{integrated_topk}"
-    
-    final_graphrag = f"✅ 知识图谱确认：\n{graphrag_result}"
-    final_topk = west_ret['answer'] + final_graphrag
-    yield final_topk, top_k_result, final_graphrag, 4
+    top_k_result = ""
+    graphrag_result = ""
+    answer = ""
+    branches_done = 0
+    has_citation = False
+    for event in get_session_manager().stream_query(session_id, user_input):
+        if event.type == StreamEventType.WM_DONE:
+            top_k_result = event.content
+            branches_done += 1
+            yield answer, top_k_result, graphrag_result, branches_done
+        elif event.type == StreamEventType.TCM_DONE:
+            graphrag_result = event.content
+            branches_done += 1
+            yield answer, top_k_result, graphrag_result, branches_done
+        elif event.type == StreamEventType.INTEGRATION_TOKEN:
+            answer += event.content
+            yield answer, top_k_result, graphrag_result, 3
+        elif event.type == StreamEventType.INTEGRATION_DONE:
+            # 结构化模式等未逐字输出时，直接显示完整整合结果
+            if not answer:
+                answer = event.content
+                yield answer, top_k_result, graphrag_result, 3
+        elif event.type == StreamEventType.CITATION_TOKEN:
+            if not has_citation:
+                answer += "\n\n【医学依据】\n"
+                has_citation = True
+            answer += event.content
+            yield answer, top_k_result, graphrag_result, 3
+        elif event.type == StreamEventType.DONE:
+            yield event.content, top_k_result, graphrag_result, 4
 
 
 # ==========================
@@ -117,7 +125,7 @@ def render_flow_chart(state):
 # ==========================
 # 主处理函数（generator，支持流式更新）
 # ==========================
-def respond_streaming(message, chat_history):
+def respond_streaming(message, chat_history, session_id):
     if not message.strip():
         yield "", chat_history, "", "", gr.HTML(value=render_flow_chart(0))
         return
@@ -130,7 +138,7 @@ def respond_streaming(message, chat_history):
     final_topk = ""
     final_graphrag = ""
 
-    for chat, topk, graphrag, state in process_query_streaming(message):
+    for chat, topk, graphrag, state in process_query_streaming(message, session_id):
         final_topk = topk if topk else final_topk
         final_graphrag = graphrag if graphrag else final_graphrag
 
@@ -158,6 +166,8 @@ def respond_streaming(message, chat_history):
 # ==========================
 with gr.Blocks(title="中医问诊辅助系统 - 流程可视化") as demo:
     gr.Markdown("## 🩺 中医问诊辅助系统（带实时流程图）")
+    # 每个浏览器会话一个会话ID，对话记忆和问诊状态不在用户之间共享
+    session_id = gr.State(new_session_id)
 
     with gr.Row(equal_height=False):
         with gr.Column(scale=1, min_width=350):
@@ -172,12 +182,13 @@ with gr.Blocks(title="中医问诊辅助系统 - 流程可视化") as demo:
     # 使用 queue=True 启用流式输出
     msg.submit(
         respond_streaming,
-        inputs=[msg, chatbot],
+        inputs=[msg, chatbot, session_id],
         outputs=[msg, chatbot, topk_output, graphrag_output, flow_chart_display],
         queue=True  # 关键：启用队列以支持 yield
     )
 
 # 启动
 if __name__ == "__main__":
+    get_session_manager()
     demo.queue()  # 启用队列
     demo.launch(inbrowser=True)
\ No newline at end of file
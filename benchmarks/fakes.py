@@ -0,0 +1,226 @@
+"""
+基准测试用的本地替身：固定延迟的聊天模型、确定性嵌入模型和内存图数据库
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_neo4j.graphs.graph_document import GraphDocument
+from langchain_neo4j.graphs.graph_store import GraphStore
+from src.utils.tracing import traced
+
+
+# 内存图数据：皮肤病 -> 证型、主症、方剂
+TCM_GRAPH_DATA = {
+    "湿疹": {"证型": ["湿热浸淫证", "脾虚湿蕴证", "血虚风燥证"], "症状": ["皮疹潮红", "瘙痒剧烈", "渗出"], "方剂": ["龙胆泻肝汤", "除湿胃苓汤", "当归饮子"]},
+    "荨麻疹": {"证型": ["风寒束表证", "风热犯表证"], "症状": ["风团", "瘙痒"], "方剂": ["麻黄桂枝各半汤", "消风散"]},
+    "扁平疣": {"证型": ["风热蕴结证", "热瘀互结证"], "症状": ["扁平丘疹", "淡褐色"], "方剂": ["马齿苋合剂", "桃红四物汤"]},
+    "白癜风": {"证型": ["气血不和证", "肝肾不足证"], "症状": ["白斑"], "方剂": ["白驳丸", "六味地黄丸"]},
+    "带状疱疹": {"证型": ["肝经郁热证", "脾虚湿蕴证", "气滞血瘀证"], "症状": ["簇集水疱", "疼痛"], "方剂": ["龙胆泻肝汤", "除湿胃苓汤", "桃红四物汤"]},
+    "痤疮": {"证型": ["肺经风热证", "肠胃湿热证", "痰湿瘀滞证"], "症状": ["粉刺", "丘疹", "脓疱"], "方剂": ["枇杷清肺饮", "茵陈蒿汤", "二陈汤"]}
+}
+
+# 西医向量库文档
+WM_DOCUMENTS = [
+    f"{name}是常见的皮肤病，诊断主要依据典型皮损表现和病史，治疗包括外用药物、口服抗组胺药及必要时的系统治疗。"
+    for name in TCM_GRAPH_DATA
+]
+
+STRUCTURED_ANSWER = {
+    "diagnosis": "湿疹（湿热浸淫证）",
+    "reasoning": ["中医辨证为湿热浸淫", "西医表现符合急性湿疹", "中西医诊断一致"],
+    "tcm_analysis": "湿热内蕴，外发肌肤",
+    "wm_analysis": "变态反应性炎症",
+    "recommendation": "清热利湿，外用糖皮质激素",
+    "confidence": "8",
+    "reference": "《中医外科学》；湿疹诊疗指南"
+}
+
+
+def scripted_response(prompt: str) -> str:
+    """按提示内容生成确定性的回复：Cypher生成返回Cypher，结构化模式返回JSON，其余返回固定长度的文本"""
+    if "Cypher" in prompt and "schema" in prompt:
+        question = prompt.rsplit("问题：", 1)[-1]
+        disease = next((name for name in TCM_GRAPH_DATA if name in question), "湿疹")
+        return f'MATCH (d:皮肤病 {{id: "{disease}"}})-[:辨证为]->(s:证型)-[:治法为]->(f:方剂) RETURN s.id, f.id'
+    if "JSON格式" in prompt:
+        return json.dumps(STRUCTURED_ANSWER, ensure_ascii=False, indent=2)
+    seed = hashlib.md5(prompt.encode("utf-8")).hexdigest()[:6]
+    sentence = f"综合分析，诊断倾向于湿热证候（样本{seed}），建议清热利湿并外用药物治疗，必要时就医复诊。"
+    return sentence * 6
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """固定延迟的本地聊天模型
+
+    按首个Token延迟和逐Token延迟模拟OpenAI兼容接口的生成耗时，
+    回复内容由responder按提示文本确定性生成，并返回Token用量。
+    """
+
+    responder: Callable[[str], str] = scripted_response
+    first_token_latency: float = 0.3   # 首个Token延迟（秒）
+    token_latency: float = 0.01        # 每个Token的生成延迟（秒）
+    chars_per_token: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency-chat"
+
+    def _respond(self, messages: List[BaseMessage], kwargs: Dict[str, Any]) -> List[str]:
+        """生成回复并按Token切分，遵守max_tokens限制"""
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.responder(prompt)
+        tokens = [text[i:i + self.chars_per_token] for i in range(0, len(text), self.chars_per_token)]
+        max_tokens = kwargs.get("max_tokens")
+        return tokens[:max_tokens] if max_tokens else tokens
+
+    def _usage(self, messages: List[BaseMessage], tokens: List[str]) -> Dict[str, int]:
+        input_tokens = sum(len(str(message.content)) for message in messages) // self.chars_per_token
+        return {"input_tokens": input_tokens, "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens)}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._respond(messages, kwargs)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._respond(messages, kwargs)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._respond(messages, kwargs)
+        time.sleep(self.first_token_latency)
+        for token in tokens:
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._respond(messages, kwargs)
+        await asyncio.sleep(self.first_token_latency)
+        for token in tokens:
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
+
+
+class FakeEmbeddings(Embeddings):
+    """确定性的本地嵌入模型：按字符二元组哈希到固定维度并归一化"""
+
+    def __init__(self, dimension: int = 256, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for i in range(max(1, len(text) - 1)):
+            digest = hashlib.md5(text[i:i + 2].encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+class InMemoryGraph(GraphStore):
+    """内存图数据库：按Cypher中皮肤病的id字面量（或id参数、id列表参数）返回对应皮肤病的证型和方剂
+
+    数据以皮肤病为中心保存（皮肤病 -> 证型、症状、方剂列表），可通过add_graph_documents追加。
+    """
+
+    FIELDS = ("证型", "症状", "方剂")
+
+    def __init__(self, data: Optional[Dict[str, Dict[str, List[str]]]] = None, latency: float = 0.02):
+        # 复制一份，追加图文档时不修改传入的数据和模块级默认数据
+        self.data = {disease: {field: list(entry.get(field, [])) for field in self.FIELDS}
+                     for disease, entry in (data or TCM_GRAPH_DATA).items()}
+        self.latency = latency
+
+    @property
+    def get_schema(self) -> str:
+        return ("Node properties:\n皮肤病 {id: STRING}\n证型 {id: STRING}\n症状 {id: STRING}\n方剂 {id: STRING}\n"
+                "The relationships:\n(:皮肤病)-[:辨证为]->(:证型)\n(:证型)-[:主症包括]->(:症状)\n"
+                "(:证型)-[:治法为]->(:方剂)\n(:方剂)-[:用于治疗]->(:皮肤病)")
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        labels = ["皮肤病", "证型", "症状", "方剂"]
+        return {
+            "node_props": {label: [{"property": "id", "type": "STRING"}] for label in labels},
+            "rel_props": {},
+            "relationships": [
+                {"start": "皮肤病", "type": "辨证为", "end": "证型"},
+                {"start": "证型", "type": "主症包括", "end": "症状"},
+                {"start": "证型", "type": "治法为", "end": "方剂"},
+                {"start": "方剂", "type": "用于治疗", "end": "皮肤病"}
+            ],
+            "metadata": {"constraint": [], "index": []}
+        }
+
+    @traced("graph.cypher_execute")
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        match = re.search(r'id:\s*(?:"([^"]+)"|\$(\w+))', query)
+        diseases = [match.group(1) or (params or {}).get(match.group(2))] if match else []
+        match = re.search(r'd\.id\s+IN\s+\$(\w+)', query)
+        if match:
+            diseases = (params or {}).get(match.group(1), [])
+        entry = next((self.data[disease] for disease in diseases if disease in self.data), None)
+        if entry is None:
+            return []
+        return [{"s.id": syndrome, "f.id": formula} for syndrome, formula in zip(entry["证型"], entry["方剂"])]
+
+    def refresh_schema(self) -> None:
+        pass
+
+    def add_graph_documents(self, graph_documents: List[GraphDocument], include_source: bool = False) -> None:
+        """将图文档中的皮肤病节点及schema中的四种关系并入内存数据，其他节点和关系忽略，不记录来源文档"""
+        for document in graph_documents:
+            for node in document.nodes:
+                if node.type == "皮肤病":
+                    self._entry(node.id)
+            for rel in document.relationships:
+                source, target = rel.source, rel.target
+                if rel.type == "辨证为" and source.type == "皮肤病":
+                    self._add(self._entry(source.id), "证型", target.id)
+                elif rel.type == "用于治疗" and target.type == "皮肤病":
+                    self._add(self._entry(target.id), "方剂", source.id)
+                elif rel.type in ("主症包括", "治法为"):
+                    # 证型的主症和方剂归入辨证为该证型的所有皮肤病
+                    field = "症状" if rel.type == "主症包括" else "方剂"
+                    for entry in self.data.values():
+                        if source.id in entry["证型"]:
+                            self._add(entry, field, target.id)
+
+    def _entry(self, disease: str) -> Dict[str, List[str]]:
+        return self.data.setdefault(disease, {field: [] for field in self.FIELDS})
+
+    @staticmethod
+    def _add(entry: Dict[str, List[str]], field: str, value: str):
+        if value not in entry[field]:
+            entry[field].append(value)
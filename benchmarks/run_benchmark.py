@@ -0,0 +1,231 @@
+"""
+端到端延迟/吞吐基准测试
+
+使用本地替身（固定延迟的聊天模型、确定性嵌入模型、内存图数据库）按多轮对话脚本驱动
+IntegratedDiagnosticAgent，无需网络和外部服务。输出各阶段的p50/p95/p99耗时、
+不同并发度下的吞吐，并与保存的基线比较，出现性能回退时以非零状态码退出。
+任一轮回答出错或降级时测得的耗时不可信，同样以非零状态码退出（不保存基线）。
+
+用法（在仓库根目录运行）：
+    python -m benchmarks.run_benchmark                      # 运行并与基线比较
+    python -m benchmarks.run_benchmark --concurrency 1,8    # 指定并发度
+    python -m benchmarks.run_benchmark --save-baseline      # 保存当前结果为基线
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+from langchain_chroma import Chroma
+from benchmarks.fakes import FakeLatencyChatModel, FakeEmbeddings, InMemoryGraph, WM_DOCUMENTS
+from benchmarks.scenarios import SCENARIOS
+from src.agents.integrated_agent import IntegratedDiagnosticAgent
+from src.agents.knowledge_agents import TCMKnowledgeAgent, WMKnowledgeAgent
+from src.agents.session_manager import SessionManager
+from src.agents.stream_events import StreamEventType
+from src.utils.llm_registry import LLMRegistry
+from src.utils.tracing import tracer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 报告和基线比较中使用的分位数指标
+REPORT_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+COMPARED_METRICS = ("p50_ms", "p95_ms")
+
+# 回答中表示出错或降级的文字（解释类请求等不经过降级事件的路径以说明文字返回错误）
+FAILURE_MARKERS = ("出错", "出现错误", "超时", "暂时不可用", "已降级")
+
+
+class ScenarioFailure(Exception):
+    """脚本中有回答出错或降级"""
+
+
+def build_agent(args: argparse.Namespace, work_dir: str) -> IntegratedDiagnosticAgent:
+    """使用本地替身构建Agent"""
+    LLMRegistry.set_model_factory(lambda model, temperature: FakeLatencyChatModel(
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency
+    ))
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    persist_dir = os.path.join(work_dir, "chroma_db")
+    Chroma.from_texts(WM_DOCUMENTS, embeddings, persist_directory=persist_dir)
+
+    agent = IntegratedDiagnosticAgent(
+        tcm_agent=TCMKnowledgeAgent(graph=InMemoryGraph(latency=args.graph_latency)),
+        wm_agent=WMKnowledgeAgent(persist_dir, embedding_function=embeddings)
+    )
+    if not args.with_cache:
+        # 默认关闭缓存，避免重复脚本命中缓存掩盖真实耗时
+        agent.response_cache = None
+        agent.semantic_cache = None
+    return agent
+
+
+def run_scenario(manager: SessionManager, session_id: str, turns: List[str]) -> int:
+    """在独立会话中按顺序执行一个脚本，返回轮数；任一轮产出DEGRADED事件或回答含错误说明时抛出ScenarioFailure"""
+    try:
+        for user_input in turns:
+            events = list(manager.stream_query(session_id, user_input))
+            answer = events[-1].content if events else ""
+            degraded = [event.content for event in events if event.type == StreamEventType.DEGRADED]
+            if degraded or any(marker in answer for marker in FAILURE_MARKERS):
+                raise ScenarioFailure(f"[{session_id}] {user_input}: {degraded[0] if degraded else answer[:200]}")
+    finally:
+        manager.close_session(session_id)
+    return len(turns)
+
+
+def run_level(manager: SessionManager, concurrency: int, sessions: int) -> Dict[str, Any]:
+    """以指定并发度执行若干会话，返回吞吐和各阶段耗时分布"""
+    tracer.reset()
+    jobs = [
+        (f"c{concurrency}-s{i}", turns)
+        for i, (_, turns) in enumerate(itertools.islice(itertools.cycle(SCENARIOS.items()), sessions))
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        total_turns = sum(pool.map(lambda job: run_scenario(manager, *job), jobs))
+    elapsed = time.perf_counter() - start
+
+    summary = tracer.summary()
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "turns": total_turns,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_tps": round(total_turns / elapsed, 3),
+        "stages": {
+            name: {"count": stats["count"], **{metric: round(stats[metric], 3) for metric in REPORT_METRICS}}
+            for name, stats in summary["stages"].items()
+        }
+    }
+
+
+def format_level(result: Dict[str, Any]) -> str:
+    """格式化单个并发度的结果"""
+    lines = [
+        f"\n== 并发度 {result['concurrency']}: {result['sessions']}个会话 / {result['turns']}轮, "
+        f"耗时 {result['elapsed_s']:.2f}s, 吞吐 {result['throughput_tps']:.2f} 轮/秒",
+        f"{'stage':<28}{'count':>7}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}"
+    ]
+    for name, stats in sorted(result["stages"].items()):
+        lines.append(f"{name:<28}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    return "\n".join(lines)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            min_delta_ms: float) -> Tuple[List[str], List[str]]:
+    """与基线比较，返回(比较明细, 回退项)
+
+    吞吐低于基线(1-tolerance)倍、或阶段耗时高于基线(1+tolerance)倍且差值超过min_delta_ms时视为回退。
+    """
+    lines, regressions = [], []
+    for level, result in current["levels"].items():
+        base = baseline.get("levels", {}).get(level)
+        if base is None:
+            continue
+        change = result["throughput_tps"] / base["throughput_tps"] - 1 if base["throughput_tps"] else 0.0
+        regressed = result["throughput_tps"] < base["throughput_tps"] * (1 - tolerance)
+        item = f"[c={level}] throughput {base['throughput_tps']:.2f} -> {result['throughput_tps']:.2f} 轮/秒 ({change:+.1%})"
+        lines.append(("回退 " if regressed else "     ") + item)
+        if regressed:
+            regressions.append(item)
+
+        for name, stats in sorted(result["stages"].items()):
+            base_stats = base["stages"].get(name)
+            if base_stats is None:
+                continue
+            for metric in COMPARED_METRICS:
+                before, after = base_stats[metric], stats[metric]
+                regressed = after > before * (1 + tolerance) and after - before > min_delta_ms
+                change = after / before - 1 if before else 0.0
+                item = f"[c={level}] {name} {metric} {before:.1f} -> {after:.1f} ({change:+.1%})"
+                lines.append(("回退 " if regressed else "     ") + item)
+                if regressed:
+                    regressions.append(item)
+    return lines, regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="中西医结合诊疗系统端到端基准测试")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发度列表，逗号分隔")
+    parser.add_argument("--sessions", type=int, default=0, help="每个并发度执行的会话数，默认取max(4, 2×并发度)")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="模拟LLM首个Token延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="模拟LLM每个Token延迟（秒）")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="模拟Cypher执行延迟（秒）")
+    parser.add_argument("--embedding-latency", type=float, default=0.005, help="模拟嵌入计算延迟（秒）")
+    parser.add_argument("--with-cache", action="store_true", help="启用响应缓存和语义缓存")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对波动")
+    parser.add_argument("--min-delta-ms", type=float, default=25.0, help="阶段耗时回退的最小绝对差值（毫秒）")
+    parser.add_argument("--output", help="将本次结果写入JSON文件")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    config = {key: getattr(args, key) for key in
+              ("first_token_latency", "token_latency", "graph_latency", "embedding_latency", "with_cache")}
+
+    with tempfile.TemporaryDirectory(prefix="tcm-bench-") as work_dir:
+        tracer.trace_file = os.path.join(work_dir, "traces.jsonl")
+        try:
+            # 组件初始化和链的日志输出较多，测试期间屏蔽
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                agent = build_agent(args, work_dir)
+                manager = SessionManager(agent)
+                run_level(manager, 1, len(SCENARIOS))  # 预热（分词词典加载等）
+                results = {"config": config, "levels": {}}
+                for level in levels:
+                    sessions = args.sessions or max(4, 2 * level)
+                    results["levels"][str(level)] = run_level(manager, level, sessions)
+        except ScenarioFailure as e:
+            print(f"❌ 回答出错或降级，本次结果无效: {e}")
+            return 1
+        finally:
+            LLMRegistry.set_model_factory(None)
+
+    for result in results["levels"].values():
+        print(format_level(result))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n未找到基线文件 {args.baseline}，可使用 --save-baseline 生成")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"\n⚠️ 基线的测试配置与本次不同，比较结果仅供参考: {baseline.get('config')}")
+    lines, regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    print(f"\n== 与基线比较 (容差 {args.tolerance:.0%})")
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n❌ 发现{len(regressions)}项性能回退")
+        return 1
+    print("\n✅ 未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
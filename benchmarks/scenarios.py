@@ -0,0 +1,33 @@
+"""
+基准测试的多轮对话脚本
+"""
+
+# 场景名 -> 按顺序发送的用户输入
+SCENARIOS = {
+    # 详细模式的普通咨询，第三轮为基于上一轮诊断的追问
+    "detailed_consultation": [
+        "湿疹用什么药膏",
+        "荨麻疹和湿疹有什么区别",
+        "为什么湿疹会反复发作"
+    ],
+    # 简洁模式和Chain-of-Thought模式
+    "brief_and_cot": [
+        "/explain brief",
+        "扁平疣吃什么中药",
+        "/explain cot",
+        "白癜风用什么药"
+    ],
+    # 结构化输出，第三轮为反事实查询
+    "structured_counterfactual": [
+        "/explain structured",
+        "带状疱疹用什么药",
+        "假如同时发烧会怎样"
+    ],
+    # 逐步问诊（不调用LLM，衡量本地路由和记忆开销）
+    "guided_diagnosis": [
+        "我想问诊",
+        "手背起红疹三天",
+        "晚上加重",
+        "没有用过药"
+    ]
+}
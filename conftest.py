@@ -0,0 +1,21 @@
+"""
+测试共用的fixture：使用基准测试的本地替身构建离线Agent（无需网络、Neo4j和LLM服务）
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from src.utils.llm_registry import LLMRegistry
+
+
+@pytest.fixture(scope="session")
+def offline_agent(tmp_path_factory):
+    """无延迟替身构建的Agent，默认关闭缓存；各测试通过spawn_session获取独立会话"""
+    from benchmarks.run_benchmark import build_agent
+    args = argparse.Namespace(first_token_latency=0.0, token_latency=0.0, graph_latency=0.0,
+                              embedding_latency=0.0, with_cache=False)
+    agent = build_agent(args, str(tmp_path_factory.mktemp("offline-agent")))
+    yield agent
+    LLMRegistry.set_model_factory(None)
@@ -8,9 +8,48 @@
 5. 提供可解释AI功能（Chain-of-Thought推理、反事实解释、追问式解释等）
 """
 import os
+import json
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 from src.agents.integrated_agent import IntegratedDiagnosticAgent
+from src.agents.stream_events import StreamEventType
+from src.utils.tracing import tracer
+from src.utils.resilience import format_resilience_metrics
+
+
+def print_streaming_response(agent: IntegratedDiagnosticAgent, user_input: str):
+    """流式输出系统回复"""
+    has_output = False
+    has_citation = False
+    for event in agent.stream_query(user_input):
+        if event.type == StreamEventType.TCM_DONE:
+            print("✅ 中医知识查询完成")
+        elif event.type == StreamEventType.WM_DONE:
+            print("✅ 西医知识查询完成")
+        elif event.type == StreamEventType.INTEGRATION_TOKEN:
+            if not has_output:
+                print("\n系统回复: ", end="")
+                has_output = True
+            print(event.content, end="", flush=True)
+        elif event.type == StreamEventType.INTEGRATION_DONE:
+            # 结构化模式等未逐字输出时，直接输出完整整合结果
+            if not has_output:
+                print(f"\n系统回复: {event.content}", end="")
+                has_output = True
+        elif event.type == StreamEventType.CITATION_TOKEN:
+            if not has_citation:
+                print("\n\n【医学依据】")
+                has_citation = True
+            print(event.content, end="", flush=True)
+        elif event.type == StreamEventType.DEGRADED:
+            stages = "、".join(f"{agent.STAGE_LABELS[stage]}（{reason}）"
+                              for stage, reason in json.loads(event.content).items())
+            print(f"\n\n⚠️ 以下环节未能正常完成，本次回答已降级：{stages}", end="")
+        elif event.type == StreamEventType.DONE:
+            if has_output:
+                print()
+            else:
+                print(f"\n系统回复: {event.content}")
 
 
 def main():
@@ -35,6 +74,8 @@ def main():
     print("输入 'quit' 或 'exit' 退出系统")
     print("输入 'history' 查看对话历史")
     print("输入 'reset' 重置对话")
+    print("输入 'stats' 查看各阶段耗时统计和LLM重试/对冲/熔断情况")
+    print("输入 'refresh schema' 重新读取图数据库schema")
     print("=" * 60)
     
     while True:
@@ -54,12 +95,22 @@ def main():
                 agent.reset_conversation()
                 print("对话已重置")
                 continue
+            elif user_input.lower() == 'stats':
+                print(f"\n各阶段耗时统计 (追踪记录: {tracer.trace_file or '未写入文件，设置TRACE_FILE环境变量开启'}):")
+                print(tracer.format_summary())
+                print(format_resilience_metrics())
+                continue
+            elif user_input.lower() == 'refresh schema':
+                if agent.tcm_agent.graph_manager.refresh_schema():
+                    print("图数据库schema已更新，快照已保存，中医及整合结果缓存已清除")
+                else:
+                    print("图数据库schema无变化")
+                continue
             elif not user_input:
                 continue
             
             print("正在分析中，请稍候...")
-            response = agent.query(user_input)
-            print(f"\n系统回复: {response}")
+            print_streaming_response(agent, user_input)
             
         except KeyboardInterrupt:
             print("\n\n程序被用户中断，再见！")
@@ -1,44 +1,116 @@
 """
 集成诊断代理 - 支持可解释AI
 """
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+import asyncio
+import contextvars
+import copy
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, AsyncIterator, Iterator, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from src.config.settings import API_CONFIG
-from src.agents.knowledge_agents import TCMKnowledgeAgent, WMKnowledgeAgent
+from src.config.settings import (CONCURRENCY_CONFIG, CACHE_CONFIG, SEMANTIC_CACHE_CONFIG, BATCH_CONFIG,
+                                 GENERATION_PROFILES, DEADLINE_CONFIG)
+from src.utils.llm_registry import get_chat_model
+from src.agents.knowledge_agents import KnowledgeQueryError, TCMKnowledgeAgent, WMKnowledgeAgent
 from src.components.conversation_memory import ConversationMemory
 from src.components.diagnostic_questioner import DiagnosticQuestioner
 from src.components.explanation_component import ExplanationComponent
+from src.agents.stream_events import StreamEvent, StreamEventType
+from src.utils.response_cache import ResponseCache
+from src.utils.semantic_cache import SemanticCache
+from src.utils.rate_limiter import AsyncRateLimiter
+from src.utils.json_stream import StreamingJsonParser
+from src.utils.tracing import tracer, traced
+from src.utils.single_flight import SingleFlight
+from src.utils.tokenizer import get_tokenizer
+from src.utils.deadline import (Deadline, DeadlineExceeded, call_with_deadline, iter_with_deadline,
+                                 aiter_with_deadline)
 import json
 
 
 class IntegratedDiagnosticAgent:
     """集成诊断Agent - 整合中西医agent"""
     
-    def __init__(self, tcm_database: str = None, wm_persist_dir: str = None):
-        self.tcm_agent = TCMKnowledgeAgent(tcm_database)
-        self.wm_agent = WMKnowledgeAgent(wm_persist_dir)
+    # 知识分支名称 -> (展示名称, 超时配置项)
+    KNOWLEDGE_BRANCHES = {
+        "tcm": ("中医知识查询", "tcm_timeout"),
+        "wm": ("西医知识查询", "wm_timeout")
+    }
+    
+    BRANCH_DONE_EVENTS = {
+        "tcm": StreamEventType.TCM_DONE,
+        "wm": StreamEventType.WM_DONE
+    }
+    
+    EXPLANATION_MODES = ['detailed', 'brief', 'cot', 'structured']
+    
+    # 可降级的阶段 -> 展示名称
+    STAGE_LABELS = {
+        "tcm": "中医知识查询",
+        "wm": "西医知识查询",
+        "integration": "结果整合",
+        "citation": "医学依据",
+        "explanation": "解释生成"
+    }
+    
+    # 依据溯源只使用整合结果的前缀
+    CITATION_PREFIX_LENGTH = 200
+    
+    # 知识库重建来源 -> 需失效的缓存命名空间
+    CACHE_SOURCES = {
+        "graph": ("tcm", "integration"),
+        "vector": ("wm", "integration")
+    }
+    
+    # 含有这些标记的降级结果不写入缓存
+    
+    def __init__(self, tcm_database: str = None, wm_persist_dir: str = None,
+                 concurrent_fanout: bool = None, tcm_agent: TCMKnowledgeAgent = None,
+                 wm_agent: WMKnowledgeAgent = None):
+        # 后台预加载分词词典，避免首轮对话时才加载
+        get_tokenizer().warm_up()
+        
+        # 可传入已构建的知识代理（如基准测试中使用本地替身）
+        self.tcm_agent = tcm_agent or TCMKnowledgeAgent(tcm_database)
+        self.wm_agent = wm_agent or WMKnowledgeAgent(wm_persist_dir)
         self.conversation_memory = ConversationMemory()
         self.diagnostic_questioner = DiagnosticQuestioner()
         self.explanation_component = ExplanationComponent()  # 新增解释组件
         self.is_in_diagnosis_mode = False
         
-        # 初始化LLM用于整合结果
-        self.integrator_llm = ChatOpenAI(
-            model=API_CONFIG["model_name"],
-            temperature=0.3,
-            base_url=API_CONFIG["base_url"],
-            api_key=API_CONFIG["api_key"]
+        # 中西医知识并发查询
+        if concurrent_fanout is None:
+            concurrent_fanout = CONCURRENCY_CONFIG["fanout_enabled"]
+        self.concurrent_fanout = concurrent_fanout
+        # spawn_session创建的会话共享同一线程池，按同时处理的轮数（每轮两个知识分支加医学依据）确定大小
+        self.executor = ThreadPoolExecutor(
+            max_workers=CONCURRENCY_CONFIG["max_workers"]
+                        or (len(self.KNOWLEDGE_BRANCHES) + 1) * CONCURRENCY_CONFIG["max_concurrent_turns"],
+            thread_name_prefix="knowledge-fanout"
         )
+        self._citation_tasks = set()
+        
+        # 响应缓存
+        self.response_cache = ResponseCache() if CACHE_CONFIG["enabled"] else None
+        # 图数据库schema变化后（后台核对或手动刷新）清除依赖图数据库的缓存
+        self.tcm_agent.graph_manager.add_schema_listener(lambda: self.invalidate_cache("graph"))
+        
+        # 并发的相同整合请求（相同问题、模式和上下文）共享同一个LLM流
+        self.integration_flights = SingleFlight("integration")
+        
+        # 语义缓存，复用西医向量库已加载的嵌入模型
+        self.semantic_cache = None
+        if SEMANTIC_CACHE_CONFIG["enabled"]:
+            self.semantic_cache = SemanticCache(self.wm_agent.vector_db.embedding_function)
+        
+        # 初始化LLM用于整合结果
+        self.integrator_llm = get_chat_model(temperature=0.3)
         
         # 初始化用于可解释性的LLM（更低的temperature以获得更一致的解释）
-        self.explanation_llm = ChatOpenAI(
-            model=API_CONFIG["model_name"],
-            temperature=0.1,
-            base_url=API_CONFIG["base_url"],
-            api_key=API_CONFIG["api_key"]
-        )
+        self.explanation_llm = get_chat_model(temperature=0.1)
         
         # 整合结果的提示模板
         self.integration_prompt = ChatPromptTemplate.from_messages([
@@ -79,11 +151,11 @@ class IntegratedDiagnosticAgent:
             )
         ])
         
-        # 结构化输出模板（JSON格式）
+        # 结构化输出模板（JSON格式，示例中的花括号需转义，否则会被当作模板变量）
         self.json_integration_prompt = ChatPromptTemplate.from_messages([
             ("system", 
              "你是一个专业的中西医结合诊断专家。请按照以下JSON格式输出诊断结果：\n"
-             "{\n"
+             "{{\n"
              "  \"diagnosis\": \"诊断结论\",\n"
              "  \"reasoning\": [\n"
              "    \"推理步骤1\",\n"
@@ -95,7 +167,7 @@ class IntegratedDiagnosticAgent:
              "  \"recommendation\": \"治疗建议\",\n"
              "  \"confidence\": \"置信度(1-10)\",\n"
              "  \"reference\": \"参考文献或依据\"\n"
-             "}"
+             "}}"
             ),
             ("human", 
              "中医诊断信息：\n{tcm_info}\n\n"
@@ -105,26 +177,146 @@ class IntegratedDiagnosticAgent:
             )
         ])
         
-        self.integration_chain = (self.integration_prompt
-            | self.integrator_llm
-            | StrOutputParser()
-        )
+        # 简洁模式提示模板（直接生成简短回答，而不是生成详细回答后截断）
+        self.brief_prompt = ChatPromptTemplate.from_messages([
+            ("system", 
+             "你是中西医结合诊疗专家，需要将中医和西医的诊断信息整合为简洁的结论。\n"
+             "请用不超过200字回答，只给出：中西医结合的判断、主要治疗建议，"
+             "以及必要时建议患者就医。不要展开推理过程，不要使用标题和列表。"
+            ),
+            ("human", 
+             "中医诊断信息：\n{tcm_info}\n\n"
+             "西医诊断信息：\n{wm_info}\n\n"
+             "上下文信息：\n{context}\n\n"
+             "请简要给出中西医结合的分析结果。"
+            )
+        ])
         
-        self.cot_chain = (self.cot_prompt
-            | self.integrator_llm
-            | StrOutputParser()
-        )
+        # 按解释模式的生成配置构建整合链
+        self.prompt_variants = {
+            "integration": self.integration_prompt,
+            "brief": self.brief_prompt,
+            "cot": self.cot_prompt,
+            "json": self.json_integration_prompt
+        }
+        self.integration_chain = self._build_profile_chain("detailed")
+        self.brief_chain = self._build_profile_chain("brief")
+        self.cot_chain = self._build_profile_chain("cot")
         
         # JSON输出解析器
         self.json_parser = JsonOutputParser()
-        self.json_integration_chain = (self.json_integration_prompt
-            | self.explanation_llm
-            | StrOutputParser()
-        )
+        self.json_integration_chain = self._build_profile_chain("structured")
         
         # 解释偏好设置
         self.explanation_preference = "detailed"  # 默认详细解释
     
+    def spawn_session(self) -> "IntegratedDiagnosticAgent":
+        """创建新会话
+        
+        新会话与当前Agent共享知识代理、LLM客户端、提示链、缓存和线程池，
+        只拥有独立的对话记忆、问诊状态和解释偏好，创建开销很小。
+        """
+        session = copy.copy(self)
+        session.conversation_memory = ConversationMemory()
+        session.diagnostic_questioner = DiagnosticQuestioner()
+        session.is_in_diagnosis_mode = False
+        session.explanation_preference = "detailed"
+        return session
+    
+    def batch_query(self, questions: List[str], max_concurrency: int = None, mode: str = None,
+                    sink_path: str = None, requests_per_second: float = None) -> List[Dict[str, Any]]:
+        """批量处理相互独立的问题（同步接口，在新事件循环中运行abatch_query）
+        
+        共享的异步HTTP连接池和Neo4j驱动按事件循环分别创建，可多次调用。
+        """
+        return asyncio.run(self.abatch_query(
+            questions, max_concurrency, mode, sink_path, requests_per_second
+        ))
+    
+    async def abatch_query(self, questions: List[str], max_concurrency: int = None, mode: str = None,
+                           sink_path: str = None, requests_per_second: float = None) -> List[Dict[str, Any]]:
+        """批量并发处理相互独立的问题
+        
+        每个问题在独立会话中以指定解释模式处理，同时处理的问题数和全局发起速率受限，
+        结果按输入顺序返回。每条结果的status为"ok"、"degraded"（有阶段出错或超时，
+        degraded字段为阶段名到原因）或"error"（抛出异常）。指定sink_path时每个问题完成即
+        追加一行JSONL；再次运行时只跳过文件中status为"ok"的问题，其余重新处理。
+        """
+        mode = mode or self.explanation_preference
+        if mode not in self.EXPLANATION_MODES:
+            raise ValueError(f"无效的解释模式: {mode}")
+        max_concurrency = max_concurrency or BATCH_CONFIG["max_concurrency"]
+        if requests_per_second is None:
+            requests_per_second = BATCH_CONFIG["requests_per_second"]
+        
+        results = self._load_batch_results(sink_path, questions, mode) if sink_path else {}
+        semaphore = asyncio.Semaphore(max_concurrency)
+        rate_limiter = AsyncRateLimiter(requests_per_second)
+        sink = self._open_batch_sink(sink_path) if sink_path else None
+        
+        async def run(index: int, question: str):
+            async with semaphore:
+                await rate_limiter.acquire()
+                session = self.spawn_session()
+                session.explanation_preference = mode
+                record = {"index": index, "question": question, "mode": mode, "status": "ok"}
+                try:
+                    async for event in session.astream_query(question):
+                        if event.type == StreamEventType.DEGRADED:
+                            record["status"] = "degraded"
+                            record["degraded"] = json.loads(event.content)
+                        elif event.type == StreamEventType.DONE:
+                            record["answer"] = event.content
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = str(e)
+            results[index] = record
+            if sink is not None:
+                sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+                sink.flush()
+        
+        try:
+            await asyncio.gather(*[
+                run(index, question) for index, question in enumerate(questions)
+                if index not in results
+            ])
+        finally:
+            if sink is not None:
+                sink.close()
+        return [results[index] for index in range(len(questions))]
+    
+    @staticmethod
+    def _load_batch_results(sink_path: str, questions: List[str], mode: str) -> Dict[int, Dict[str, Any]]:
+        """读取已有批量结果中成功完成（status为ok）的问题，用于中断后续跑"""
+        results = {}
+        if not os.path.exists(sink_path):
+            return results
+        with open(sink_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 中断时可能留下不完整的行
+                index = record.get("index")
+                if (isinstance(index, int) and 0 <= index < len(questions)
+                        and record.get("question") == questions[index]
+                        and record.get("mode") == mode and record.get("status") == "ok"):
+                    results[index] = record
+        return results
+    
+    @staticmethod
+    def _open_batch_sink(sink_path: str):
+        """以追加方式打开结果文件，确保新记录从新行开始"""
+        needs_newline = False
+        if os.path.exists(sink_path) and os.path.getsize(sink_path) > 0:
+            with open(sink_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        sink = open(sink_path, 'a', encoding='utf-8')
+        if needs_newline:
+            sink.write("\n")
+        return sink
+    
     def start_diagnosis_mode(self):
         """开始诊断模式"""
         self.is_in_diagnosis_mode = True
@@ -144,146 +336,784 @@ class IntegratedDiagnosticAgent:
         
         return next_question
     
-    def query(self, question: str) -> str:
-        """处理查询请求"""
+    def query(self, question: str, deadline: Optional[float] = None) -> str:
+        """处理查询请求，deadline为本次请求的时间预算（秒）"""
+        answer = ""
+        for event in self.stream_query(question, deadline):
+            if event.type == StreamEventType.DONE:
+                answer = event.content
+        return answer
+    
+    async def aquery(self, question: str, deadline: Optional[float] = None) -> str:
+        """异步处理查询请求，deadline为本次请求的时间预算（秒）"""
+        answer = ""
+        async for event in self.astream_query(question, deadline):
+            if event.type == StreamEventType.DONE:
+                answer = event.content
+        return answer
+    
+    @traced("turn")
+    def stream_query(self, question: str, deadline: Optional[float] = None) -> Iterator[StreamEvent]:
+        """流式处理查询请求，按发生顺序产出StreamEvent
+        
+        指令、问诊及解释类请求只产出一个DONE事件；普通查询依次产出
+        中西医知识查询完成、整合结果增量、医学依据增量及最终DONE事件。
+        deadline为本次请求的时间预算（秒），默认取DEADLINE_CONFIG；超时的阶段被取消或跳过，
+        普通查询在DONE之前产出DEGRADED事件说明降级的阶段。
+        """
+        deadline = self._turn_deadline(deadline)
+        route, params = self._route_query(question)
+        tracer.current_span().set("route", route)
+        if route == "consultation":
+            yield from self._stream_consultation(question, deadline)
+            return
+        
+        if route == "counterfactual":
+            result = self._explain_with_deadline(
+                deadline, self.explanation_component.generate_counterfactual_explanation,
+                counterfactual_condition=question, **params
+            )
+        elif route == "interactive":
+            result = self._explain_with_deadline(
+                deadline, self.explanation_component.generate_interactive_explanation,
+                user_question=question, **params
+            )
+        else:
+            result = self._handle_local_route(route, question)
+        yield StreamEvent(StreamEventType.DONE, self._record_explanation(route, result))
+    
+    @traced("turn")
+    async def astream_query(self, question: str, deadline: Optional[float] = None) -> AsyncIterator[StreamEvent]:
+        """stream_query的异步版本"""
+        deadline = self._turn_deadline(deadline)
+        route, params = self._route_query(question)
+        tracer.current_span().set("route", route)
+        if route == "consultation":
+            async for event in self._astream_consultation(question, deadline):
+                yield event
+            return
+        
+        if route == "counterfactual":
+            result = await self._aexplain_with_deadline(
+                deadline, self.explanation_component.agenerate_counterfactual_explanation,
+                counterfactual_condition=question, **params
+            )
+        elif route == "interactive":
+            result = await self._aexplain_with_deadline(
+                deadline, self.explanation_component.agenerate_interactive_explanation,
+                user_question=question, **params
+            )
+        else:
+            result = self._handle_local_route(route, question)
+        yield StreamEvent(StreamEventType.DONE, self._record_explanation(route, result))
+    
+    def _route_query(self, question: str) -> Tuple[str, Dict[str, str]]:
+        """判断请求类型，返回(类型, 生成解释所需参数)
+        
+        类型包括command、start_diagnosis、continue_diagnosis、counterfactual、
+        interactive和consultation（普通查询）。除指令外，用户问题会被记录到对话记忆。
+        """
         # 检查是否是解释偏好设置指令
         if question.startswith('/explain'):
-            return self.set_explanation_preference(question)
+            return "command", {}
         
         # 记录用户问题
         self.conversation_memory.add_message("user", question)
         
+        # 单次扫描识别消息中的全部意图触发词
+        intents = self.explanation_component.intent_router.classify(question)
+        
         # 检查是否需要启动诊断模式
-        if self.should_start_diagnosis(question):
-            response = self.start_diagnosis_mode()
-            next_question = self.diagnostic_questioner.get_next_question(self.conversation_memory)
-            self.conversation_memory.add_message("assistant", next_question)
-            return f"{response}\n{next_question}"
+        if intents.has("start_diagnosis"):
+            return "start_diagnosis", {}
         
         # 检查是否在诊断模式下
         if self.is_in_diagnosis_mode and not self.diagnostic_questioner.is_diagnosis_complete:
-            return self.continue_diagnosis(question)
+            return "continue_diagnosis", {}
+        
+        # 反事实查询和交互式追问都需要引用之前的诊断，未命中触发词时不必获取上下文
+        if not (intents.has("counterfactual") or intents.has("interactive")):
+            return "consultation", {}
+        context = self.conversation_memory.get_context()
+        context_intents = self.explanation_component.intent_router.classify_context(context)
         
         # 检查是否为反事实查询
-        if self.explanation_component.is_counterfactual_query(question):
-            # 需要获取之前的诊断信息
-            context = self.conversation_memory.get_context()
-            if "诊断" in context or "分析" in context:
-                # 提取之前的诊断信息
-                prev_diagnosis = self._extract_previous_diagnosis(context)
-                if prev_diagnosis:
-                    counterfactual_result = self.explanation_component.generate_counterfactual_explanation(
-                        original_symptoms="用户之前的症状描述",  # 实际应用中需要从上下文提取
-                        original_diagnosis=prev_diagnosis,
-                        counterfactual_condition=question
-                    )
-                    # 记录系统回复
-                    self.conversation_memory.add_message("assistant", counterfactual_result)
-                    return counterfactual_result
+        if intents.has("counterfactual") and context_intents.has("counterfactual"):
+            # 提取之前的诊断信息
+            prev_diagnosis = self._extract_previous_diagnosis(context)
+            if prev_diagnosis:
+                return "counterfactual", {
+                    "original_symptoms": "用户之前的症状描述",  # 实际应用中需要从上下文提取
+                    "original_diagnosis": prev_diagnosis
+                }
         
         # 检查是否为交互式追问
-        context = self.conversation_memory.get_context()
-        if self.explanation_component.is_interactive_query(question, context):
+        if intents.has("interactive") and context_intents.has("interactive"):
             # 提取之前的诊断和推理过程
             prev_diagnosis = self._extract_previous_diagnosis(context)
             reasoning_process = self._extract_reasoning_process(context)
             if prev_diagnosis or reasoning_process:
-                interactive_result = self.explanation_component.generate_interactive_explanation(
-                    original_diagnosis=prev_diagnosis or "未找到之前的诊断",
-                    reasoning_process=reasoning_process or "未找到推理过程",
-                    user_question=question
-                )
-                # 记录系统回复
-                self.conversation_memory.add_message("assistant", interactive_result)
-                return interactive_result
-        
-        # 正常查询模式 - 获取中西医信息
-        tcm_result = self.tcm_agent.query(question)
-        wm_result = self.wm_agent.query(question)
-        
-        # 整合结果
-        context = self.conversation_memory.get_context()
+                return "interactive", {
+                    "original_diagnosis": prev_diagnosis or "未找到之前的诊断",
+                    "reasoning_process": reasoning_process or "未找到推理过程"
+                }
+        
+        return "consultation", {}
+    
+    def _handle_local_route(self, route: str, question: str) -> str:
+        """处理无需调用LLM的请求（指令和问诊）"""
+        if route == "command":
+            return self.set_explanation_preference(question)
         
+        if route == "start_diagnosis":
+            response = self.start_diagnosis_mode()
+            next_question = self.diagnostic_questioner.get_next_question(self.conversation_memory)
+            self.conversation_memory.add_message("assistant", next_question)
+            return f"{response}\n{next_question}"
+        
+        return self.continue_diagnosis(question)
+    
+    def _record_explanation(self, route: str, result: str) -> str:
+        """记录反事实和追问解释的系统回复"""
+        if route in ["counterfactual", "interactive"]:
+            self.conversation_memory.add_message("assistant", result)
+        return result
+    
+    def _turn_deadline(self, deadline: Optional[float]) -> Deadline:
+        """本轮请求的截止时间，未指定时间预算时使用当前解释模式的默认值"""
+        if isinstance(deadline, Deadline):
+            return deadline
+        if deadline is None:
+            deadline = DEADLINE_CONFIG["mode_budgets"].get(self.explanation_preference,
+                                                            DEADLINE_CONFIG["default_budget"])
+        return Deadline(deadline)
+    
+    def _explain_with_deadline(self, deadline: Deadline, explain_func, **kwargs) -> str:
+        """在截止时间内生成解释，超时则放弃等待并返回说明"""
         try:
-            # 根据解释偏好选择不同的处理方式
-            if self.explanation_preference == "detailed":
-                integration_result = self.integration_chain.invoke({
-                    "tcm_info": tcm_result,
-                    "wm_info": wm_result,
-                    "context": context
-                })
-            elif self.explanation_preference == "cot":
-                # 使用Chain-of-Thought推理
-                integration_result = self.cot_chain.invoke({
-                    "tcm_info": tcm_result,
-                    "wm_info": wm_result,
-                    "context": context
-                })
-            elif self.explanation_preference == "structured":
-                # 使用结构化JSON输出
-                try:
-                    json_result = self.json_integration_chain.invoke({
-                        "tcm_info": tcm_result,
-                        "wm_info": wm_result,
-                        "context": context
-                    })
-                    # 尝试解析JSON并格式化输出
-                    parsed_result = self._parse_json_result(json_result)
-                    integration_result = self._format_structured_output(parsed_result)
-                except:
-                    # 如果JSON解析失败，回退到普通整合
-                    integration_result = self.integration_chain.invoke({
-                        "tcm_info": tcm_result,
-                        "wm_info": wm_result,
-                        "context": context
-                    })
-            elif self.explanation_preference == "brief":
-                # 简洁模式，直接整合结果
-                integration_result = self.integration_chain.invoke({
-                    "tcm_info": tcm_result,
-                    "wm_info": wm_result,
-                    "context": context
-                })
-                # 简化输出
-                integration_result = self._simplify_output(integration_result)
-            else:
-                # 默认模式
-                integration_result = self.integration_chain.invoke({
-                    "tcm_info": tcm_result,
-                    "wm_info": wm_result,
-                    "context": context
-                })
-        except Exception as e:
-            integration_result = f"整合结果时出现错误: {str(e)}\n\n中医信息: {tcm_result}\n\n西医信息: {wm_result}"
+            return call_with_deadline(explain_func, deadline, **kwargs)
+        except DeadlineExceeded:
+            return self._explanation_timeout_message(deadline)
+    
+    async def _aexplain_with_deadline(self, deadline: Deadline, explain_func, **kwargs) -> str:
+        """_explain_with_deadline的异步版本，超时时取消生成"""
+        try:
+            return await asyncio.wait_for(explain_func(**kwargs), deadline.timeout())
+        except asyncio.TimeoutError:
+            return self._explanation_timeout_message(deadline)
+    
+    def _explanation_timeout_message(self, deadline: Deadline) -> str:
+        """解释生成超时的说明文字"""
+        deadline.mark_degraded("explanation", "超时")
+        tracer.current_span().set("degraded", dict(deadline.degraded))
+        return f"生成解释超时（超过{deadline.budget:g}秒），请稍后重试。"
+    
+    def _stream_consultation(self, question: str, deadline: Deadline) -> Iterator[StreamEvent]:
+        """正常查询模式 - 获取中西医信息并流式整合
+        
+        需要医学依据时，整合结果一旦达到依据所需的前缀长度即在后台开始生成依据，
+        与剩余的整合生成并行；依据增量在整合完成后按顺序输出。
+        各阶段受deadline约束：超时的知识分支被取消，整合以已有信息继续；
+        剩余时间不足时跳过医学依据。
+        """
+        # 语义缓存：复述的问题直接复用之前的回答
+        cached_answer = self._semantic_lookup(question)
+        if cached_answer is not None:
+            yield from self._cached_answer_events(question, cached_answer)
+            return
+        
+        knowledge = {}
+        for branch, result in self._iter_knowledge(question, deadline):
+            knowledge[branch] = result
+            yield StreamEvent(self.BRANCH_DONE_EVENTS[branch], result)
+        
+        # 整合结果（相同问题、模式和上下文直接使用缓存）
+        inputs = self._integration_inputs(knowledge)
+        cache_key = self._integration_cache_key(question, inputs)
+        cached_answer = self._cache_get(cache_key, "integration")
+        if cached_answer is not None:
+            yield from self._cached_answer_events(question, cached_answer)
+            return
+        
+        integration_result = ""
+        integration_failed = False
+        citation_chunks = None
+        with tracer.span("integration", mode=self.explanation_preference) as integration_span:
+            try:
+                # 根据解释偏好选择不同的处理方式
+                structured = self.explanation_preference == "structured"
+                if structured:
+                    try:
+                        # 结构化JSON输出：增量解析，每个字段完成后立即输出格式化内容
+                        json_parser = StreamingJsonParser()
+                        json_chunks = iter_with_deadline(
+                            self._shared_integration_stream(cache_key, self.json_integration_chain, inputs), deadline
+                        )
+                        while True:
+                            chunk = next(json_chunks, None)
+                            fields = json_parser.feed(chunk) if chunk is not None else json_parser.close()
+                            for event in self._structured_field_events(json_parser, fields, integration_result):
+                                if event.type == StreamEventType.INTEGRATION_TOKEN:
+                                    integration_result += event.content
+                                    integration_span.mark("first_token_ms")
+                                yield event
+                            if citation_chunks is None and self._citation_prefix_ready(integration_result, deadline):
+                                citation_chunks = self._start_citation(integration_result, deadline)
+                            if chunk is None:
+                                break
+                    except Exception as e:
+                        if not self._structured_fallback(e, integration_result):
+                            raise
+                        structured = False
+                if not structured:
+                    chunks = self._shared_integration_stream(
+                        self._integration_flight_key(cache_key), self._integration_stream_chain(), inputs
+                    )
+                    for chunk in iter_with_deadline(chunks, deadline):
+                        integration_result += chunk
+                        integration_span.mark("first_token_ms")
+                        yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, chunk)
+                        if citation_chunks is None and self._citation_prefix_ready(integration_result, deadline):
+                            citation_chunks = self._start_citation(integration_result, deadline)
+                        if self._brief_limit_reached(integration_result):
+                            yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, "...(内容已简化)")
+                            break
+            except Exception as e:
+                integration_failed = True
+                error_note = self._integration_error(e, integration_result, inputs, deadline)
+                if integration_result:
+                    yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, error_note)
+                integration_result += error_note
+        
+        integration_result = self._finalize_integration(integration_result)
+        yield StreamEvent(StreamEventType.INTEGRATION_DONE, integration_result)
+        
+        # 生成依据溯源解释（如果需要且剩余时间足够）
+        # 整合失败时不再基于错误说明生成依据
+        citation_result = None
+        if not integration_failed and self._needs_citation() and self._citation_allowed(citation_chunks, deadline):
+            streamed_citation = ""
+            try:
+                if citation_chunks is None:
+                    citation_chunks = self._start_citation(integration_result, deadline)
+                while (chunk := citation_chunks.get(timeout=deadline.timeout())) is not None:
+                    streamed_citation += chunk
+                    yield StreamEvent(StreamEventType.CITATION_TOKEN, chunk)
+                citation_result = streamed_citation
+            except queue.Empty:
+                deadline.mark_degraded("citation", "超时")
+                citation_result = streamed_citation or None
+            except Exception:
+                # 如果生成依据失败，不影响主要结果
+                deadline.mark_degraded("citation", "出错")
+        
+        if not integration_failed and not deadline.degraded:
+            self._cache_answer(cache_key, question, integration_result, citation_result)
+        answer = self._compose_answer(integration_result, citation_result)
+        yield from self._degraded_events(deadline)
+        answer += self._degradation_note(deadline)
+        yield StreamEvent(StreamEventType.DONE, self._record_consultation(question, answer))
+    
+    async def _astream_consultation(self, question: str, deadline: Deadline) -> AsyncIterator[StreamEvent]:
+        """_stream_consultation的异步版本"""
+        cached_answer = await asyncio.to_thread(self._semantic_lookup, question)
+        if cached_answer is not None:
+            for event in self._cached_answer_events(question, cached_answer):
+                yield event
+            return
+        
+        knowledge = {}
+        async for branch, result in self._aiter_knowledge(question, deadline):
+            knowledge[branch] = result
+            yield StreamEvent(self.BRANCH_DONE_EVENTS[branch], result)
+        
+        inputs = self._integration_inputs(knowledge)
+        cache_key = self._integration_cache_key(question, inputs)
+        cached_answer = self._cache_get(cache_key, "integration")
+        if cached_answer is not None:
+            for event in self._cached_answer_events(question, cached_answer):
+                yield event
+            return
+        
+        integration_result = ""
+        integration_failed = False
+        citation_chunks = None
+        with tracer.span("integration", mode=self.explanation_preference) as integration_span:
+            try:
+                structured = self.explanation_preference == "structured"
+                if structured:
+                    try:
+                        json_parser = StreamingJsonParser()
+                        json_chunks = aiter_with_deadline(
+                            self._ashared_integration_stream(cache_key, self.json_integration_chain, inputs), deadline
+                        )
+                        while True:
+                            chunk = await anext(json_chunks, None)
+                            fields = json_parser.feed(chunk) if chunk is not None else json_parser.close()
+                            for event in self._structured_field_events(json_parser, fields, integration_result):
+                                if event.type == StreamEventType.INTEGRATION_TOKEN:
+                                    integration_result += event.content
+                                    integration_span.mark("first_token_ms")
+                                yield event
+                            if citation_chunks is None and self._citation_prefix_ready(integration_result, deadline):
+                                citation_chunks = self._astart_citation(integration_result, deadline)
+                            if chunk is None:
+                                break
+                    except Exception as e:
+                        if not self._structured_fallback(e, integration_result):
+                            raise
+                        structured = False
+                if not structured:
+                    chunks = self._ashared_integration_stream(
+                        self._integration_flight_key(cache_key), self._integration_stream_chain(), inputs
+                    )
+                    async for chunk in aiter_with_deadline(chunks, deadline):
+                        integration_result += chunk
+                        integration_span.mark("first_token_ms")
+                        yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, chunk)
+                        if citation_chunks is None and self._citation_prefix_ready(integration_result, deadline):
+                            citation_chunks = self._astart_citation(integration_result, deadline)
+                        if self._brief_limit_reached(integration_result):
+                            yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, "...(内容已简化)")
+                            break
+            except Exception as e:
+                integration_failed = True
+                error_note = self._integration_error(e, integration_result, inputs, deadline)
+                if integration_result:
+                    yield StreamEvent(StreamEventType.INTEGRATION_TOKEN, error_note)
+                integration_result += error_note
+        
+        integration_result = self._finalize_integration(integration_result)
+        yield StreamEvent(StreamEventType.INTEGRATION_DONE, integration_result)
         
-        # 生成依据溯源解释（如果需要）
-        if self.explanation_preference in ["detailed", "structured"]:
+        citation_result = None
+        if not integration_failed and self._needs_citation() and self._citation_allowed(citation_chunks, deadline):
             try:
-                citation_result = self.explanation_component.generate_citation_explanation(
-                    diagnosis=integration_result[:200],  # 限制长度
+                if citation_chunks is None:
+                    citation_chunks = self._astart_citation(integration_result, deadline)
+                streamed_citation = ""
+                # 后台任务超时后自行结束，队列以None收尾
+                while (chunk := await citation_chunks.get()) is not None:
+                    streamed_citation += chunk
+                    yield StreamEvent(StreamEventType.CITATION_TOKEN, chunk)
+                citation_result = streamed_citation or None
+            except Exception:
+                deadline.mark_degraded("citation", "出错")
+        
+        if not integration_failed and not deadline.degraded:
+            self._cache_answer(cache_key, question, integration_result, citation_result)
+        answer = self._compose_answer(integration_result, citation_result)
+        for event in self._degraded_events(deadline):
+            yield event
+        answer += self._degradation_note(deadline)
+        yield StreamEvent(StreamEventType.DONE, self._record_consultation(question, answer))
+    
+    def _compose_answer(self, integration_result: str, citation_result: Optional[str]) -> str:
+        """拼接整合结果和医学依据"""
+        if citation_result is None:
+            return integration_result
+        return f"{integration_result}\n\n【医学依据】\n{citation_result}"
+    
+    def _needs_citation(self) -> bool:
+        """当前解释偏好是否需要生成依据溯源解释"""
+        return self.explanation_preference in ["detailed", "structured"]
+    
+    def _citation_prefix_ready(self, streamed_text: str, deadline: Deadline) -> bool:
+        """流式整合结果是否已达到依据所需的前缀长度，且剩余时间足够生成依据"""
+        return (self._needs_citation() and len(streamed_text) >= self.CITATION_PREFIX_LENGTH
+                and deadline.remaining() >= DEADLINE_CONFIG["min_citation_budget"])
+    
+    def _citation_allowed(self, citation_chunks, deadline: Deadline) -> bool:
+        """整合完成后是否继续输出依据：已提前开始生成，或剩余时间足够；否则记录跳过"""
+        if citation_chunks is not None or deadline.remaining() >= DEADLINE_CONFIG["min_citation_budget"]:
+            return True
+        deadline.mark_degraded("citation", "剩余时间不足，已跳过")
+        return False
+    
+    def _start_citation(self, integration_result: str, deadline: Deadline) -> queue.Queue:
+        """在后台线程中流式生成依据，返回增量文本队列（以None结束），超过截止时间后停止生成"""
+        citation_chunks = queue.Queue()
+        
+        def produce():
+            try:
+                for chunk in self.explanation_component.stream_citation_explanation(
+                    diagnosis=integration_result[:self.CITATION_PREFIX_LENGTH],  # 限制长度
                     treatment="治疗建议部分"
-                )
-                integration_result += f"\n\n【医学依据】\n{citation_result}"
-            except:
-                pass  # 如果生成依据失败，不影响主要结果
+                ):
+                    if deadline.expired():
+                        deadline.mark_degraded("citation", "超时")
+                        break
+                    citation_chunks.put(chunk)
+            except Exception:
+                # 依据可能已输出一部分，记录降级使本次回答不写入缓存
+                deadline.mark_degraded("citation", "出错")
+            finally:
+                citation_chunks.put(None)
+        
+        self.executor.submit(contextvars.copy_context().run, produce)
+        return citation_chunks
+    
+    def _astart_citation(self, integration_result: str, deadline: Deadline) -> asyncio.Queue:
+        """_start_citation的异步版本，依据在后台任务中生成，超过截止时间后取消"""
+        citation_chunks = asyncio.Queue()
+        
+        async def produce():
+            try:
+                async for chunk in aiter_with_deadline(self.explanation_component.astream_citation_explanation(
+                    diagnosis=integration_result[:self.CITATION_PREFIX_LENGTH],
+                    treatment="治疗建议部分"
+                ), deadline):
+                    citation_chunks.put_nowait(chunk)
+            except DeadlineExceeded:
+                deadline.mark_degraded("citation", "超时")
+            except Exception:
+                deadline.mark_degraded("citation", "出错")
+            finally:
+                citation_chunks.put_nowait(None)
+        
+        self._citation_tasks.add(asyncio.ensure_future(produce()))
+        for task in [t for t in self._citation_tasks if t.done()]:
+            self._citation_tasks.discard(task)
+        return citation_chunks
+    
+    def _integration_inputs(self, knowledge: Dict[str, str]) -> Dict[str, str]:
+        """构建整合链的输入"""
+        return {
+            "tcm_info": knowledge["tcm"],
+            "wm_info": knowledge["wm"],
+            "context": self.conversation_memory.get_context()
+        }
+    
+    def _build_profile_chain(self, mode: str):
+        """按GENERATION_PROFILES中的配置构建指定解释模式的整合链"""
+        profile = GENERATION_PROFILES[mode]
+        llm = get_chat_model(temperature=profile["temperature"], model=profile["model"])
+        generation_kwargs = {key: profile[key] for key in ("max_tokens", "stop") if profile.get(key)}
+        if generation_kwargs:
+            llm = llm.bind(**generation_kwargs)
+        return self.prompt_variants[profile["prompt"]] | llm | StrOutputParser()
+    
+    def _integration_stream_chain(self):
+        """获取非结构化模式下用于流式整合的链：cot使用Chain-of-Thought推理，brief使用简洁整合，其余使用普通整合"""
+        if self.explanation_preference == "cot":
+            return self.cot_chain
+        if self.explanation_preference == "brief":
+            return self.brief_chain
+        return self.integration_chain
+    
+    def _shared_integration_stream(self, cache_key: str, chain, inputs: Dict[str, str]) -> Iterator[str]:
+        """流式执行整合链，缓存键相同的并发请求共享同一个LLM流"""
+        return self.integration_flights.stream(cache_key, lambda: chain.stream(inputs))
+    
+    def _ashared_integration_stream(self, cache_key: str, chain, inputs: Dict[str, str]) -> AsyncIterator[str]:
+        """_shared_integration_stream的异步版本"""
+        return self.integration_flights.astream(cache_key, lambda: chain.astream(inputs))
+    
+    def _integration_flight_key(self, cache_key: str) -> str:
+        """普通整合流的请求合并键：结构化模式回退到普通整合时与结构化输出的流区分开"""
+        if self.explanation_preference == "structured":
+            return f"{cache_key}:fallback"
+        return cache_key
+    
+    def _structured_fallback(self, error: Exception, streamed_text: str) -> bool:
+        """结构化输出出错且尚未输出任何内容时回退到普通整合，返回是否回退（超时不回退）"""
+        if isinstance(error, DeadlineExceeded) or streamed_text:
+            return False
+        print(f"⚠️ 结构化输出失败，回退到普通整合: {str(error)}")
+        return True
+    
+    def _structured_field_events(self, json_parser: StreamingJsonParser, fields: List[Tuple[str, Any]],
+                                 streamed_text: str) -> List[StreamEvent]:
+        """将新解析完成的结构化字段转换为事件：字段值事件和格式化后的整合增量文本
         
-        # 记录思考过程
+        输出结束时若未解析出任何字段，原样输出模型回复。
+        """
+        events = []
+        for key, value in fields:
+            events.append(StreamEvent(StreamEventType.STRUCTURED_FIELD,
+                                      json.dumps(value, ensure_ascii=False), name=key))
+            section = self._format_structured_field(key, value)
+            if section:
+                separator = "\n\n" if streamed_text else ""
+                events.append(StreamEvent(StreamEventType.INTEGRATION_TOKEN, separator + section))
+                streamed_text += separator + section
+        raw_output = json_parser.result().get("raw_output")
+        if json_parser.closed and raw_output and not streamed_text:
+            events.append(StreamEvent(StreamEventType.INTEGRATION_TOKEN, raw_output))
+        return events
+    
+    def _brief_limit_reached(self, text: str) -> bool:
+        """简洁模式下超出长度后停止生成"""
+        return self.explanation_preference == "brief" and len(text) > 500
+    
+    def _integration_error(self, error: Exception, partial_result: str, inputs: Dict[str, str],
+                           deadline: Deadline) -> str:
+        """整合出错或超时时的说明：已有部分结果时追加提示，否则返回原始中西医信息"""
+        if isinstance(error, DeadlineExceeded):
+            deadline.mark_degraded("integration", "超时")
+            note = "整合结果超时，输出可能不完整"
+        else:
+            deadline.mark_degraded("integration", "出错")
+            note = f"整合结果时出现错误: {str(error)}"
+        if partial_result:
+            return f"\n\n{note}"
+        return f"{note}\n\n中医信息: {inputs['tcm_info']}\n\n西医信息: {inputs['wm_info']}"
+    
+    def _degraded_events(self, deadline: Deadline) -> List[StreamEvent]:
+        """有阶段降级时产出DEGRADED事件（内容为阶段名到原因的JSON），并标注在追踪记录上"""
+        if not deadline.degraded:
+            return []
+        tracer.current_span().set("degraded", dict(deadline.degraded))
+        return [StreamEvent(StreamEventType.DEGRADED, json.dumps(deadline.degraded, ensure_ascii=False))]
+    
+    def _degradation_note(self, deadline: Deadline) -> str:
+        """附在回复末尾的降级说明"""
+        if not deadline.degraded:
+            return ""
+        stages = "、".join(f"{self.STAGE_LABELS[stage]}（{reason}）" for stage, reason in deadline.degraded.items())
+        return f"\n\n（注：以下环节未能正常完成，本次回答已降级：{stages}）"
+    
+    def _finalize_integration(self, integration_result: str) -> str:
+        """按解释偏好对整合结果做最终处理"""
+        if self.explanation_preference == "brief":
+            return self._simplify_output(integration_result)
+        return integration_result
+    
+    def _record_consultation(self, question: str, answer: str) -> str:
+        """记录思考过程和系统回复"""
         self.conversation_memory.add_diagnosis_step(
             step="信息整合",
             thought=f"整合中西医诊断信息，生成综合建议",
             action=f"查询问题: {question}"
         )
+        self.conversation_memory.add_message("assistant", answer)
+        return answer
+    
+    def _cache_get(self, key: str, cache_name: str) -> Optional[str]:
+        """读取响应缓存并记录命中情况，未启用缓存时返回None"""
+        if self.response_cache is None:
+            return None
+        result = self.response_cache.get(key)
+        tracer.record_cache(cache_name, result is not None)
+        return result
+    
+    def _knowledge_cache_key(self, branch: str, question: str) -> str:
+        """知识分支的缓存键，西医分支附带向量库数据版本，中医分支附带图数据库schema哈希
+        
+        磁盘缓存在重启后仍然有效，schema在两次运行之间变化时旧条目不会被命中。
+        """
+        if branch == "wm":
+            data_version = self.wm_agent.vector_db.data_version()
+        else:
+            data_version = self.tcm_agent.graph_manager.schema_hash or ""
+        return ResponseCache.make_key(branch, question, context=data_version)
+    
+    def _cache_knowledge(self, branch: str, question: str, result: str) -> str:
+        """缓存查询成功的知识分支结果并原样返回"""
+        if self.response_cache is not None:
+            self.response_cache.set(self._knowledge_cache_key(branch, question), result, branch)
+        return result
+    
+    def _cached_knowledge(self, branch_queries: Dict[str, Any], question: str) -> Dict[str, str]:
+        """从缓存中取出已缓存的分支结果，并从待查询分支中移除"""
+        cached = {}
+        for branch in list(branch_queries):
+            result = self._cache_get(self._knowledge_cache_key(branch, question), branch)
+            if result is not None:
+                cached[branch] = result
+                del branch_queries[branch]
+        return cached
+    
+    def _integration_cache_key(self, question: str, inputs: Dict[str, str]) -> str:
+        """整合结果的缓存键：规范化问题、解释模式及中西医信息和上下文的哈希"""
+        context = json.dumps(inputs, ensure_ascii=False, sort_keys=True)
+        return ResponseCache.make_key("integration", question, self.explanation_preference, context)
+    
+    def _cache_answer(self, key: str, question: str, integration_result: str, citation_result: Optional[str]):
+        """缓存整合结果和医学依据
         
-        # 记录系统回复
-        self.conversation_memory.add_message("assistant", integration_result)
+        调用方只在整合成功且没有任何阶段降级（知识分支、依据出错或超时）时调用，
+        以免缓存（尤其是语义缓存）把降级的回答复用到相似问题上。
+        """
+        value = json.dumps({"integration": integration_result, "citation": citation_result},
+                           ensure_ascii=False)
+        if self.response_cache is not None:
+            self.response_cache.set(key, value, "integration")
+        if self._semantic_cache_applicable():
+            self.semantic_cache.add(question, value, self.explanation_preference)
+    
+    def _semantic_cache_applicable(self) -> bool:
+        """语义缓存只用于会话首轮、未收集患者个人信息的通用问答
         
-        return integration_result
+        之前有过对话时，问题可能依赖上下文（如"平时需要注意什么"），其他会话的回答不能复用。
+        对话记忆中此时只有当前问题。
+        """
+        return (self.semantic_cache is not None and not self.conversation_memory.patient_info
+                and len(self.conversation_memory.history) <= 1)
+    
+    def _semantic_lookup(self, question: str) -> Optional[str]:
+        """在当前解释模式的命名空间中查找语义相近问题的回答"""
+        if not self._semantic_cache_applicable():
+            return None
+        answer = self.semantic_cache.lookup(question, self.explanation_preference)
+        tracer.record_cache("semantic", answer is not None)
+        return answer
+    
+    def _cached_answer_events(self, question: str, cached_answer: str) -> List[StreamEvent]:
+        """将缓存的回复转换为流式事件，并记录到对话记忆"""
+        cached = json.loads(cached_answer)
+        events = [
+            StreamEvent(StreamEventType.INTEGRATION_TOKEN, cached["integration"]),
+            StreamEvent(StreamEventType.INTEGRATION_DONE, cached["integration"])
+        ]
+        if cached["citation"] is not None:
+            events.append(StreamEvent(StreamEventType.CITATION_TOKEN, cached["citation"]))
+        answer = self._compose_answer(cached["integration"], cached["citation"])
+        events.append(StreamEvent(StreamEventType.DONE, self._record_consultation(question, answer)))
+        return events
+    
+    def _iter_knowledge(self, question: str, deadline: Deadline) -> Iterator[Tuple[str, str]]:
+        """按完成顺序产出(分支名, 结果)
+        
+        并发模式下两个分支同时执行，各自只能使用请求剩余时间预算的一部分（且不超过配置的超时）；
+        单个分支失败或超时不影响另一分支，失败分支以说明文字代替结果，并记录为降级阶段。
+        """
+        branch_queries = {
+            "tcm": self.tcm_agent.fetch,
+            "wm": self.wm_agent.fetch
+        }
+        yield from self._cached_knowledge(branch_queries, question).items()
+        
+        if not self.concurrent_fanout:
+            for branch, query_func in branch_queries.items():
+                try:
+                    if deadline.expired():
+                        raise DeadlineExceeded()
+                    result = call_with_deadline(query_func, deadline, question)
+                except DeadlineExceeded:
+                    self._branch_agents()[branch].forget(question)
+                    yield branch, self._branch_timeout_message(branch, deadline, deadline.budget)
+                    continue
+                except Exception as e:
+                    yield branch, self._branch_error(branch, e, deadline)
+                    continue
+                yield branch, self._cache_knowledge(branch, question, result)
+            return
+        
+        budgets = self._branch_budgets(deadline)
+        start = time.monotonic()
+        deadlines = {branch: start + budget for branch, budget in budgets.items()}
+        futures = {
+            self.executor.submit(contextvars.copy_context().run, query_func, question): branch
+            for branch, query_func in branch_queries.items()
+        }
+        
+        pending = set(futures)
+        while pending:
+            nearest = min(deadlines[futures[f]] for f in pending)
+            done, pending = wait(pending, timeout=max(0, nearest - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                branch = futures[future]
+                yield branch, self._branch_result(branch, question, future, deadline)
+            
+            # 取消已超时的分支；已在执行的查询无法中断，释放其合并键，之后的相同问题不再等待它
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[futures[f]] <= now]:
+                pending.discard(future)
+                branch = futures[future]
+                if not future.cancel():
+                    self._branch_agents()[branch].forget(question)
+                yield branch, self._branch_timeout_message(branch, deadline, budgets[branch])
+    
+    async def _aiter_knowledge(self, question: str, deadline: Deadline) -> AsyncIterator[Tuple[str, str]]:
+        """_iter_knowledge的异步版本，超时分支的任务会被取消"""
+        branch_queries = {
+            "tcm": self.tcm_agent.afetch,
+            "wm": self.wm_agent.afetch
+        }
+        for branch, result in self._cached_knowledge(branch_queries, question).items():
+            yield branch, result
+        
+        if not self.concurrent_fanout:
+            for branch, query_func in branch_queries.items():
+                try:
+                    result = await asyncio.wait_for(query_func(question), deadline.timeout())
+                except asyncio.TimeoutError:
+                    yield branch, self._branch_timeout_message(branch, deadline, deadline.budget)
+                    continue
+                except Exception as e:
+                    yield branch, self._branch_error(branch, e, deadline)
+                    continue
+                yield branch, self._cache_knowledge(branch, question, result)
+            return
+        
+        budgets = self._branch_budgets(deadline)
+        start = time.monotonic()
+        deadlines = {branch: start + budget for branch, budget in budgets.items()}
+        tasks = {
+            asyncio.ensure_future(query_func(question)): branch
+            for branch, query_func in branch_queries.items()
+        }
+        
+        pending = set(tasks)
+        try:
+            while pending:
+                nearest = min(deadlines[tasks[t]] for t in pending)
+                done, pending = await asyncio.wait(pending, timeout=max(0, nearest - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    branch = tasks[task]
+                    yield branch, self._branch_result(branch, question, task, deadline)
+                
+                now = time.monotonic()
+                for task in [t for t in pending if deadlines[tasks[t]] <= now]:
+                    pending.discard(task)
+                    task.cancel()
+                    branch = tasks[task]
+                    yield branch, self._branch_timeout_message(branch, deadline, budgets[branch])
+        finally:
+            # 调用方提前结束时取消未完成的分支
+            for task in pending:
+                task.cancel()
+    
+    def _branch_agents(self) -> Dict[str, Any]:
+        """分支名到知识代理的映射"""
+        return {"tcm": self.tcm_agent, "wm": self.wm_agent}
+    
+    def _branch_budgets(self, deadline: Deadline) -> Dict[str, float]:
+        """计算各知识分支可用的时间（秒）：请求剩余预算的配置比例，且不超过分支超时配置"""
+        remaining = deadline.remaining()
+        return {
+            branch: min(CONCURRENCY_CONFIG[timeout_key],
+                        remaining * DEADLINE_CONFIG["knowledge_share"][branch])
+            for branch, (_, timeout_key) in self.KNOWLEDGE_BRANCHES.items()
+        }
+    
+    def _branch_result(self, branch: str, question: str, future, deadline: Deadline) -> str:
+        """读取已完成分支的结果：成功时写入缓存，异常时返回错误说明并记录降级"""
+        try:
+            result = future.result()
+        except Exception as e:
+            return self._branch_error(branch, e, deadline)
+        return self._cache_knowledge(branch, question, result)
+    
+    def _branch_error(self, branch: str, error: Exception, deadline: Deadline) -> str:
+        """失败分支的说明文字，并记录降级"""
+        deadline.mark_degraded(branch, "出错")
+        if isinstance(error, KnowledgeQueryError):
+            return str(error)
+        return f"{self.KNOWLEDGE_BRANCHES[branch][0]}出错: {str(error)}"
+    
+    def _branch_timeout_message(self, branch: str, deadline: Deadline, budget: float) -> str:
+        """超时分支的说明文字，并记录降级"""
+        deadline.mark_degraded(branch, "超时")
+        return f"{self.KNOWLEDGE_BRANCHES[branch][0]}超时（超过{budget:.3g}秒），已跳过该部分信息"
     
     def should_start_diagnosis(self, question: str) -> bool:
         """判断是否应该启动诊断模式"""
         # 检查是否是诊断相关问题
-        diagnosis_keywords = ['诊断', '看病', '症状', '不适', '哪里不舒服', '疼', '痒', '治疗', '病', '问诊']
-        return any(keyword in question for keyword in diagnosis_keywords)
+        return self.explanation_component.intent_router.classify(question).has("start_diagnosis")
     
     def set_explanation_preference(self, command: str) -> str:
         """设置解释偏好"""
@@ -292,7 +1122,7 @@ class IntegratedDiagnosticAgent:
             return f"当前解释模式: {self.explanation_preference}\n可用模式: detailed, brief, cot (Chain-of-Thought), structured"
         
         mode = command_parts[1].lower()
-        if mode in ['detailed', 'brief', 'cot', 'structured']:
+        if mode in self.EXPLANATION_MODES:
             self.explanation_preference = mode
             return f"解释模式已设置为: {mode}\n- detailed: 详细解释\n- brief: 简洁解释\n- cot: Chain-of-Thought推理\n- structured: 结构化JSON输出"
         else:
@@ -319,56 +1149,50 @@ class IntegratedDiagnosticAgent:
         return ' '.join(reasoning_lines) if reasoning_lines else ""
     
     def _parse_json_result(self, json_str: str) -> dict:
-        """解析JSON结果"""
-        try:
-            # 尝试从代码块中提取JSON
-            if "```json" in json_str:
-                start = json_str.find("```json") + 7
-                end = json_str.find("```", start)
-                json_str = json_str[start:end].strip()
-            elif "```" in json_str:
-                start = json_str.find("```") + 3
-                end = json_str.find("```", start)
-                json_str = json_str[start:end].strip()
-            
-            return json.loads(json_str)
-        except:
-            # 如果解析失败，尝试直接解析原始字符串
-            try:
-                return json.loads(json_str)
-            except:
-                # 如果还是失败，返回原始字符串
-                return {"raw_output": json_str}
+        """解析JSON结果（容错解析，无法解析时返回{"raw_output": 原始字符串}）"""
+        json_parser = StreamingJsonParser()
+        json_parser.feed(json_str)
+        json_parser.close()
+        return json_parser.result()
     
-    def _format_structured_output(self, parsed_result: dict) -> str:
-        """格式化结构化输出"""
-        if "raw_output" in parsed_result:
-            return parsed_result["raw_output"]
+    def _format_structured_field(self, key: str, value: Any) -> Optional[str]:
+        """格式化结构化输出的单个字段，未知字段返回None"""
+        if key == "diagnosis":
+            return f"【诊断结论】\n{value}"
         
-        formatted_parts = []
+        if key == "reasoning":
+            steps = value if isinstance(value, list) else [value]
+            formatted_parts = [f"【推理过程】"]
+            for i, step in enumerate(steps, 1):
+                formatted_parts.append(f"  步骤{i}: {step}")
+            return "\n\n".join(formatted_parts)
         
-        if "diagnosis" in parsed_result:
-            formatted_parts.append(f"【诊断结论】\n{parsed_result['diagnosis']}")
+        if key == "tcm_analysis":
+            return f"【中医分析】\n{value}"
         
-        if "reasoning" in parsed_result:
-            formatted_parts.append(f"【推理过程】")
-            for i, step in enumerate(parsed_result['reasoning'], 1):
-                formatted_parts.append(f"  步骤{i}: {step}")
+        if key == "wm_analysis":
+            return f"【西医分析】\n{value}"
         
-        if "tcm_analysis" in parsed_result:
-            formatted_parts.append(f"【中医分析】\n{parsed_result['tcm_analysis']}")
+        if key == "recommendation":
+            return f"【治疗建议】\n{value}"
         
-        if "wm_analysis" in parsed_result:
-            formatted_parts.append(f"【西医分析】\n{parsed_result['wm_analysis']}")
+        if key == "confidence":
+            return f"【置信度】\n{value}/10"
         
-        if "recommendation" in parsed_result:
-            formatted_parts.append(f"【治疗建议】\n{parsed_result['recommendation']}")
+        if key == "reference":
+            return f"【参考依据】\n{value}"
         
-        if "confidence" in parsed_result:
-            formatted_parts.append(f"【置信度】\n{parsed_result['confidence']}/10")
+        return None
+    
+    def _format_structured_output(self, parsed_result: dict) -> str:
+        """格式化结构化输出"""
+        if "raw_output" in parsed_result:
+            return parsed_result["raw_output"]
         
-        if "reference" in parsed_result:
-            formatted_parts.append(f"【参考依据】\n{parsed_result['reference']}")
+        formatted_parts = []
+        for key in ["diagnosis", "reasoning", "tcm_analysis", "wm_analysis", "recommendation", "confidence", "reference"]:
+            if key in parsed_result:
+                formatted_parts.append(self._format_structured_field(key, parsed_result[key]))
         
         return "\n\n".join(formatted_parts)
     
@@ -399,6 +1223,21 @@ class IntegratedDiagnosticAgent:
         self.diagnostic_questioner = DiagnosticQuestioner()
         self.is_in_diagnosis_mode = False
     
+    def invalidate_cache(self, source: str = None):
+        """知识库重建后使相关缓存失效
+        
+        source为"graph"（中医图数据库）或"vector"（西医向量库），不指定时清空全部缓存。
+        语义缓存中的回答同时依赖两类知识库，总是整体清空。
+        """
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate()
+        if self.response_cache is None:
+            return
+        if source is None:
+            self.response_cache.invalidate()
+        else:
+            self.response_cache.invalidate(*self.CACHE_SOURCES[source])
+    
     def reset_diagnosis(self):
         """重置诊断模式"""
         self.diagnostic_questioner.reset()
@@ -1,112 +1,182 @@
 """
 中西医知识代理
 """
-import json
-import jieba
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+import os
+import threading
+from typing import Any, Dict, List, Mapping, Sequence
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from src.config.settings import API_CONFIG
-from src.utils.graph_db import GraphDBManager
+from src.config.settings import DISEASE_STORE_CONFIG
+from src.utils.llm_registry import get_chat_model
+from src.utils.graph_db import GraphDBManager, GraphQueryError
 from src.utils.vector_db import VectorDBManager
+from src.utils.tracing import tracer, traced
+from src.utils.response_cache import ResponseCache
+from src.utils.single_flight import SingleFlight
+from src.utils.disease_index import DiseaseIndex
+from src.utils.disease_store import DiseaseStore, read_disease_records
+
+
+class KnowledgeQueryError(Exception):
+    """知识查询失败（知识库不可用或查询出错），异常信息为面向用户的说明文字"""
 
 
 class TCMKnowledgeAgent:
     """中医知识Agent"""
     
-    def __init__(self, database: str = None):
-        # 初始化图数据库连接
-        self.graph_manager = GraphDBManager(database)
+    def __init__(self, database: str = None, graph=None):
+        # 初始化图数据库连接（graph为已有的图存储对象时直接使用）
+        self.graph_manager = GraphDBManager(database, graph)
         self.neo4j_available = self.graph_manager.is_available()
         
         # 初始化LLM
-        self.llm = ChatOpenAI(
-            model=API_CONFIG["model_name"],
-            temperature=0,
-            base_url=API_CONFIG["base_url"],
-            api_key=API_CONFIG["api_key"]
-        )
+        self.llm = get_chat_model(temperature=0)
+        
+        # 合并并发的相同问题（如多个终端同时提交同一问题）
+        self.inflight = SingleFlight("tcm")
+        
+        # 疾病数据及其检索索引：Neo4j不可用时作为备用知识库，批量检索时按需加载
+        self.disease_data = None
+        self.disease_index = None
+        self._disease_index_lock = threading.Lock()
         
         if not self.neo4j_available:
             # 如果Neo4j不可用，使用备用方案
             # 从文件加载中医知识
-            self.disease_data = self._load_disease_data()
+            self._ensure_disease_index()
     
-    def _load_disease_data(self) -> List[Dict]:
-        """加载疾病数据作为备用"""
+    def _ensure_disease_index(self) -> DiseaseIndex:
+        """加载疾病数据并建立检索索引（只建立一次）"""
+        if self.disease_index is None:
+            with self._disease_index_lock:
+                if self.disease_index is None:
+                    self.disease_data = self._load_disease_data()
+                    if isinstance(self.disease_data, DiseaseStore):
+                        # 二进制存储的检索索引持久化在其旁边，启动时以内存映射方式打开
+                        self.disease_index = DiseaseIndex(self.disease_data,
+                                                          index_dir=DISEASE_STORE_CONFIG["index_dir"],
+                                                          source_version=self.disease_data.version)
+                    else:
+                        self.disease_index = DiseaseIndex(self.disease_data)
+        return self.disease_index
+    
+    def _load_disease_data(self) -> Sequence[Mapping[str, str]]:
+        """加载疾病数据作为备用：优先使用编译好的二进制存储（字段按需解码），否则解析原始JSON文件"""
         try:
-            disease_file = "/workspace/tools/disease.jsonl"
-            diseases = []
-            with open(disease_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        disease = json.loads(line.strip())
-                        diseases.append(disease)
-                    except:
-                        continue
-            return diseases
-        except:
+            store_file = DISEASE_STORE_CONFIG["store_file"]
+            if os.path.exists(store_file):
+                return DiseaseStore(store_file)
+            return read_disease_records(DISEASE_STORE_CONFIG["source_file"])
+        except Exception as e:
+            print(f"⚠️ 疾病数据加载失败: {str(e)}")
             return []
     
     def query(self, question: str) -> str:
+        """查询中医知识，失败时返回说明文字"""
+        try:
+            return self.fetch(question)
+        except KnowledgeQueryError as e:
+            return str(e)
+    
+    @traced("knowledge.tcm")
+    def fetch(self, question: str) -> str:
+        """查询中医知识，失败时抛出KnowledgeQueryError；并发的相同问题（规范化后）共享同一次查询"""
+        return self.inflight.do(ResponseCache.normalize_question(question), self._query, question)
+    
+    def _query(self, question: str) -> str:
         """查询中医知识"""
         if self.neo4j_available:
             try:
-                return self.graph_manager.query(question)
+                return self.graph_manager.fetch(question)
+            except GraphQueryError as e:
+                raise KnowledgeQueryError(str(e)) from e
             except Exception as e:
-                return f"中医知识查询出错: {str(e)}"
+                raise KnowledgeQueryError(f"中医知识查询出错: {str(e)}") from e
         else:
             # 使用备用查询方法
             return self._query_from_disease_data(question)
     
+    async def aquery(self, question: str) -> str:
+        """异步查询中医知识，失败时返回说明文字"""
+        try:
+            return await self.afetch(question)
+        except KnowledgeQueryError as e:
+            return str(e)
+    
+    @traced("knowledge.tcm")
+    async def afetch(self, question: str) -> str:
+        """异步查询中医知识，失败时抛出KnowledgeQueryError；并发的相同问题共享同一次查询"""
+        return await self.inflight.ado(ResponseCache.normalize_question(question), self._aquery, question)
+    
+    def forget(self, question: str):
+        """放弃正在进行的相同问题的同步查询（如调用方已超时）：之后的相同问题重新查询，不再等待它"""
+        self.inflight.forget(ResponseCache.normalize_question(question))
+    
+    async def _aquery(self, question: str) -> str:
+        """异步查询中医知识"""
+        if self.neo4j_available:
+            try:
+                return await self.graph_manager.afetch(question)
+            except GraphQueryError as e:
+                raise KnowledgeQueryError(str(e)) from e
+            except Exception as e:
+                raise KnowledgeQueryError(f"中医知识查询出错: {str(e)}") from e
+        else:
+            # 备用查询为本地计算，直接执行
+            return self._query_from_disease_data(question)
+    
     def _query_from_disease_data(self, question: str) -> str:
         """从疾病数据中查询信息"""
         if not self.disease_data:
-            return "中医知识库暂时不可用，将使用通用模型进行回答。"
-        
-        # 简单的关键字匹配
-        keywords = jieba.lcut(question)
-        # 过滤掉常用词
-        keywords = [w for w in keywords if len(w) > 1 and w not in ['的', '了', '在', '是', '我', '有', '和', '就', '都', '而', '及', '与', '或']]
+            raise KnowledgeQueryError("中医知识库暂时不可用，将使用通用模型进行回答。")
         
+        # 按BM25F从倒排索引中取最相关的疾病
         results = []
-        for disease in self.disease_data:
-            # 检查是否包含关键词
-            text = f"{disease.get('name', '')} {disease.get('name_exp', '')} {disease.get('cause', '')} {disease.get('key_point', '')} {disease.get('solution', '')} {disease.get('after', '')}"
-            if any(keyword in text for keyword in keywords[:3]):  # 只检查前3个关键词
-                results.append({
-                    'name': disease.get('name', ''),
-                    'description': disease.get('name_exp', '')[:500],  # 限制长度
-                    'treatment': disease.get('solution', '')[:500]   # 限制长度
-                })
+        for disease, _ in self.disease_index.search(question):
+            results.append({
+                'name': disease.get('name', ''),
+                'description': disease.get('name_exp', '')[:500],  # 限制长度
+                'treatment': disease.get('solution', '')[:500]   # 限制长度
+            })
         
         if results:
             response = "根据中医知识库找到以下相关信息：\n\n"
-            for i, result in enumerate(results[:3]):  # 只返回前3个结果
+            for result in results:
                 response += f"疾病: {result['name']}\n"
                 response += f"描述: {result['description']}\n"
                 response += f"治疗: {result['treatment']}\n\n"
             return response
         else:
             return "在中医知识库中未找到相关疾病信息，建议咨询中医专业医师。"
+    
+    @traced("knowledge.tcm_batch_search")
+    def batch_search(self, queries: List[str], k: int = None) -> List[List[Dict[str, Any]]]:
+        """批量检索疾病数据（如分诊积压、统计分析），每个查询返回得分最高的k个疾病
+        
+        不经过图数据库和LLM，直接在疾病数据的索引上用一次稀疏矩阵乘法为所有查询打分。
+        """
+        index = self._ensure_disease_index()
+        return [
+            [{
+                'name': disease.get('name', ''),
+                'score': score,
+                'description': disease.get('name_exp', '')[:500],  # 限制长度
+                'treatment': disease.get('solution', '')[:500]   # 限制长度
+            } for disease, score in hits]
+            for hits in index.batch_search(queries, k)
+        ]
 
 
 class WMKnowledgeAgent:
     """西医知识Agent"""
     
-    def __init__(self, persist_directory: str = None):
+    def __init__(self, persist_directory: str = None, embedding_function=None):
         # 初始化西医向量数据库
-        self.vector_db = VectorDBManager(persist_directory)
+        self.vector_db = VectorDBManager(persist_directory, embedding_function=embedding_function)
         
         # 初始化LLM
-        self.llm = ChatOpenAI(
-            model=API_CONFIG["model_name"],
-            temperature=0.3,
-            base_url=API_CONFIG["base_url"],
-            api_key=API_CONFIG["api_key"]
-        )
+        self.llm = get_chat_model(temperature=0.3)
         
         # 西医回答模板
         self.wm_prompt = ChatPromptTemplate.from_messages([
@@ -130,8 +200,42 @@ class WMKnowledgeAgent:
             | self.llm
             | StrOutputParser()
         )
+        
+        # 无检索器时使用的通用模型提示模板
+        general_prompt = ChatPromptTemplate.from_messages([
+            ("system", 
+             "你是一位经验丰富的皮肤科临床辅助诊疗专家，正在辅助不同背景的用户理解皮肤病相关知识。"
+             "用户可能是医学生、住院医师、资深中医、普通患者或医学爱好者。"
+             "\n- 若问题包含专业术语或机制探讨，可使用规范医学术语，并简要解释关键概念；"
+             "\n- 若问题偏向症状描述或日常护理，请用通俗易懂的语言，避免 jargon；"
+             "\n- 始终保持尊重、耐心与同理心，不假设、不标签用户身份；"
+             "\n- 回答需简洁，聚焦核心信息，避免冗长；"
+             "\n- 在回答末尾，用开放式提问引导用户深入探讨（如：‘你是否还想了解其鉴别诊断？’ 或 ‘需要我解释治疗方案的细节吗？’）"
+            ),
+            ("human", "用户问题：{question}")
+        ])
+        
+        self.general_chain = (general_prompt
+            | self.llm
+            | StrOutputParser()
+        )
+        
+        # 合并并发的相同问题
+        self.inflight = SingleFlight("wm")
     
     def query(self, question: str) -> str:
+        """查询西医知识，失败时返回说明文字"""
+        try:
+            return self.fetch(question)
+        except KnowledgeQueryError as e:
+            return str(e)
+    
+    @traced("knowledge.wm")
+    def fetch(self, question: str) -> str:
+        """查询西医知识，失败时抛出KnowledgeQueryError；并发的相同问题（规范化后）共享同一次查询"""
+        return self.inflight.do(ResponseCache.normalize_question(question), self._query, question)
+    
+    def _query(self, question: str) -> str:
         """查询西医知识"""
         try:
             if self.vector_db.retriever is None:
@@ -142,35 +246,64 @@ class WMKnowledgeAgent:
             context = result["context"]
             
             input_data = {"context": context, "question": question}
-            response = self.wm_chain.invoke(input_data)
+            with tracer.span("wm.answer"):
+                response = self.wm_chain.invoke(input_data)
             
             return response
+        except KnowledgeQueryError:
+            raise
         except Exception as e:
-            return f"西医知识查询出错: {str(e)}"
+            raise KnowledgeQueryError(f"西医知识查询出错: {str(e)}") from e
     
+    @traced("wm.answer")
     def _query_with_general_model(self, question: str) -> str:
         """使用通用模型回答问题"""
-        # 创建一个简单的提示模板
-        simple_prompt = ChatPromptTemplate.from_messages([
-            ("system", 
-             "你是一位经验丰富的皮肤科临床辅助诊疗专家，正在辅助不同背景的用户理解皮肤病相关知识。"
-             "用户可能是医学生、住院医师、资深中医、普通患者或医学爱好者。"
-             "\n- 若问题包含专业术语或机制探讨，可使用规范医学术语，并简要解释关键概念；"
-             "\n- 若问题偏向症状描述或日常护理，请用通俗易懂的语言，避免 jargon；"
-             "\n- 始终保持尊重、耐心与同理心，不假设、不标签用户身份；"
-             "\n- 回答需简洁，聚焦核心信息，避免冗长；"
-             "\n- 在回答末尾，用开放式提问引导用户深入探讨（如：‘你是否还想了解其鉴别诊断？’ 或 ‘需要我解释治疗方案的细节吗？’）"
-            ),
-            ("human", "用户问题：{question}")
-        ])
-        
-        simple_chain = (simple_prompt
-            | self.llm
-            | StrOutputParser()
-        )
-        
         try:
-            result = simple_chain.invoke({"question": question})
+            result = self.general_chain.invoke({"question": question})
             return result
         except Exception as e:
-            return f"西医知识查询出错: {str(e)}"
\ No newline at end of file
+            raise KnowledgeQueryError(f"西医知识查询出错: {str(e)}") from e
+    
+    async def aquery(self, question: str) -> str:
+        """异步查询西医知识，失败时返回说明文字"""
+        try:
+            return await self.afetch(question)
+        except KnowledgeQueryError as e:
+            return str(e)
+    
+    @traced("knowledge.wm")
+    async def afetch(self, question: str) -> str:
+        """异步查询西医知识，失败时抛出KnowledgeQueryError；并发的相同问题共享同一次查询"""
+        return await self.inflight.ado(ResponseCache.normalize_question(question), self._aquery, question)
+    
+    def forget(self, question: str):
+        """放弃正在进行的相同问题的同步查询（如调用方已超时）：之后的相同问题重新查询，不再等待它"""
+        self.inflight.forget(ResponseCache.normalize_question(question))
+    
+    async def _aquery(self, question: str) -> str:
+        """异步查询西医知识"""
+        try:
+            if self.vector_db.retriever is None:
+                # 如果没有可用的检索器，使用通用模型回答
+                return await self._aquery_with_general_model(question)
+            
+            result = await self.vector_db.aquery(question)
+            context = result["context"]
+            
+            input_data = {"context": context, "question": question}
+            with tracer.span("wm.answer"):
+                response = await self.wm_chain.ainvoke(input_data)
+            
+            return response
+        except KnowledgeQueryError:
+            raise
+        except Exception as e:
+            raise KnowledgeQueryError(f"西医知识查询出错: {str(e)}") from e
+    
+    @traced("wm.answer")
+    async def _aquery_with_general_model(self, question: str) -> str:
+        """异步使用通用模型回答问题"""
+        try:
+            return await self.general_chain.ainvoke({"question": question})
+        except Exception as e:
+            raise KnowledgeQueryError(f"西医知识查询出错: {str(e)}") from e
\ No newline at end of file
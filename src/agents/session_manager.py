@@ -0,0 +1,148 @@
+"""
+多会话管理器 - 多个患者会话共享同一套知识库、模型和缓存
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Iterator, AsyncIterator, List
+from src.config.settings import SESSION_CONFIG
+from src.agents.integrated_agent import IntegratedDiagnosticAgent
+from src.agents.stream_events import StreamEvent
+
+
+class _SessionEntry:
+    """单个会话的状态和访问锁"""
+
+    def __init__(self, agent: IntegratedDiagnosticAgent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self._async_lock = None
+        self._async_lock_loop = None
+        self.last_access = time.monotonic()
+
+    def async_lock(self) -> asyncio.Lock:
+        """获取当前事件循环上的异步锁
+
+        asyncio.Lock绑定首次等待它的事件循环，会话可能先后在不同事件循环中使用
+        （如多次调用batch_query），因此在运行中的事件循环上按需创建，事件循环变化时重新创建。
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_lock_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_lock_loop = loop
+        return self._async_lock
+
+    def busy(self) -> bool:
+        """会话是否正在处理请求"""
+        return self.lock.locked() or (self._async_lock is not None and self._async_lock.locked())
+
+
+class SessionManager:
+    """多会话管理器
+
+    共享资源（知识代理、向量库、图数据库、LLM客户端、缓存）只创建一次，
+    每个会话只保存对话记忆、问诊状态和解释偏好。同一会话的请求按顺序执行，
+    不同会话可并发；同一会话应统一使用同步接口或异步接口。
+    """
+
+    def __init__(self, agent: Optional[IntegratedDiagnosticAgent] = None,
+                 idle_timeout: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.agent = agent or IntegratedDiagnosticAgent()
+        self.idle_timeout = idle_timeout or SESSION_CONFIG["idle_timeout"]
+        self.max_sessions = max_sessions or SESSION_CONFIG["max_sessions"]
+        self._sessions = OrderedDict()  # session_id -> _SessionEntry，按最近访问排序
+        self._lock = threading.Lock()
+
+    def _get_entry(self, session_id: str) -> _SessionEntry:
+        """获取或创建会话，并清理空闲会话"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _SessionEntry(self.agent.spawn_session())
+                self._sessions[session_id] = entry
+                self._evict_overflow(session_id)
+            else:
+                self._sessions.move_to_end(session_id)
+            entry.last_access = now
+            return entry
+
+    def _evict_idle(self, now: float) -> int:
+        """清理空闲超时的会话（调用方需持有锁），返回清理数量"""
+        expired = []
+        for session_id, entry in self._sessions.items():
+            if now - entry.last_access < self.idle_timeout:
+                break
+            # 正在处理请求的会话不清理
+            if not entry.busy():
+                expired.append(session_id)
+        for session_id in expired:
+            del self._sessions[session_id]
+        return len(expired)
+
+    def _evict_overflow(self, keep: str):
+        """会话数超过上限时按最久未活动淘汰（调用方需持有锁）
+
+        正在处理请求的会话和刚创建的会话keep不淘汰，此时会话数可能暂时超过上限。
+        """
+        excess = len(self._sessions) - self.max_sessions
+        victims = []
+        for session_id, entry in self._sessions.items():
+            if len(victims) >= excess:
+                break
+            if session_id != keep and not entry.busy():
+                victims.append(session_id)
+        for session_id in victims:
+            del self._sessions[session_id]
+
+    def get_session(self, session_id: str) -> IntegratedDiagnosticAgent:
+        """获取会话对应的Agent，不存在时创建"""
+        return self._get_entry(session_id).agent
+
+    def query(self, session_id: str, question: str, deadline: Optional[float] = None) -> str:
+        """在指定会话中处理查询，deadline为本次请求的时间预算（秒）"""
+        entry = self._get_entry(session_id)
+        with entry.lock:
+            return entry.agent.query(question, deadline)
+
+    def stream_query(self, session_id: str, question: str,
+                     deadline: Optional[float] = None) -> Iterator[StreamEvent]:
+        """在指定会话中流式处理查询"""
+        entry = self._get_entry(session_id)
+        with entry.lock:
+            yield from entry.agent.stream_query(question, deadline)
+
+    async def aquery(self, session_id: str, question: str, deadline: Optional[float] = None) -> str:
+        """在指定会话中异步处理查询"""
+        entry = self._get_entry(session_id)
+        async with entry.async_lock():
+            return await entry.agent.aquery(question, deadline)
+
+    async def astream_query(self, session_id: str, question: str,
+                            deadline: Optional[float] = None) -> AsyncIterator[StreamEvent]:
+        """在指定会话中异步流式处理查询"""
+        entry = self._get_entry(session_id)
+        async with entry.async_lock():
+            async for event in entry.agent.astream_query(question, deadline):
+                yield event
+
+    def close_session(self, session_id: str):
+        """关闭会话"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self) -> int:
+        """清理空闲超时的会话，返回清理数量"""
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def list_sessions(self) -> List[str]:
+        """获取当前会话ID列表"""
+        with self._lock:
+            return list(self._sessions)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,25 @@
+"""
+流式查询事件定义
+"""
+from dataclasses import dataclass
+from enum import Enum
+
+
+class StreamEventType(str, Enum):
+    """流式查询事件类型"""
+    TCM_DONE = "tcm_done"                      # 中医知识查询完成
+    WM_DONE = "wm_done"                        # 西医知识查询完成
+    INTEGRATION_TOKEN = "integration_token"    # 整合结果增量文本
+    STRUCTURED_FIELD = "structured_field"      # 结构化模式下一个字段解析完成（name为字段名，内容为字段值的JSON）
+    INTEGRATION_DONE = "integration_done"      # 整合结果完成（内容为最终整合文本）
+    CITATION_TOKEN = "citation_token"          # 医学依据增量文本
+    DEGRADED = "degraded"                      # 有阶段因超时或出错被降级（内容为阶段名到原因的JSON）
+    DONE = "done"                              # 全部完成（内容为最终回复）
+
+
+@dataclass
+class StreamEvent:
+    """流式查询事件"""
+    type: StreamEventType
+    content: str = ""
+    name: str = ""
@@ -1,9 +1,12 @@
 from .conversation_memory import ConversationMemory
 from .diagnostic_questioner import DiagnosticQuestioner
 from .explanation_component import ExplanationComponent
+from .intent_router import IntentRouter, IntentMatches
 
 __all__ = [
     "ConversationMemory",
     "DiagnosticQuestioner", 
-    "ExplanationComponent"
+    "ExplanationComponent",
+    "IntentRouter",
+    "IntentMatches"
 ]
\ No newline at end of file
@@ -6,13 +6,31 @@ from datetime import datetime
 
 
 class ConversationMemory:
-    """对话记忆类"""
+    """对话记忆类
+    
+    上下文按患者信息、诊断过程、最近对话三部分分别缓存渲染结果：诊断过程只追加渲染
+    新增步骤，其余部分在数据变化时重新渲染，get_context在无变化时直接返回缓存。
+    """
+    
+    # 上下文中保留的最近消息数
+    RECENT_MESSAGE_COUNT = 5
     
     def __init__(self):
         self.history = []
         self.patient_info = {}
         self.diagnosis_process = []
-        
+        self._reset_render_cache()
+    
+    def _reset_render_cache(self):
+        """重置上下文渲染缓存"""
+        self._patient_text = ""
+        self._patient_dirty = False
+        self._diagnosis_text = ""
+        self._rendered_steps = 0
+        self._history_text = ""
+        self._rendered_history_length = 0
+        self._context = ""
+    
     def add_message(self, role: str, content: str):
         """添加对话记录"""
         self.history.append({
@@ -24,6 +42,7 @@ class ConversationMemory:
     def update_patient_info(self, info: Dict):
         """更新患者信息"""
         self.patient_info.update(info)
+        self._patient_dirty = True
     
     def add_diagnosis_step(self, step: str, thought: str, action: str):
         """添加诊断步骤"""
@@ -34,34 +53,58 @@ class ConversationMemory:
             "timestamp": datetime.now().isoformat()
         })
     
+    def _render_patient_info(self) -> bool:
+        """重新渲染患者信息部分，返回是否有变化"""
+        if not self._patient_dirty:
+            return False
+        lines = ["患者信息:"] if self.patient_info else []
+        for key, value in self.patient_info.items():
+            lines.append(f"  {key}: {value}")
+        self._patient_text = "\n".join(lines)
+        self._patient_dirty = False
+        return True
+    
+    def _render_diagnosis_process(self) -> bool:
+        """追加渲染新增的诊断步骤，返回是否有变化"""
+        if len(self.diagnosis_process) == self._rendered_steps:
+            return False
+        lines = [] if self._rendered_steps else ["\n诊断过程:"]
+        for i in range(self._rendered_steps, len(self.diagnosis_process)):
+            step = self.diagnosis_process[i]
+            lines.append(f"  步骤{i + 1}: {step['step']}")
+            lines.append(f"    思考: {step['thought']}")
+            lines.append(f"    行动: {step['action']}")
+        new_text = "\n".join(lines)
+        self._diagnosis_text = f"{self._diagnosis_text}\n{new_text}" if self._rendered_steps else new_text
+        self._rendered_steps = len(self.diagnosis_process)
+        return True
+    
+    def _render_recent_history(self) -> bool:
+        """重新渲染最近对话部分（只涉及最近几条消息），返回是否有变化"""
+        if len(self.history) == self._rendered_history_length:
+            return False
+        lines = ["\n最近对话:"] if self.history else []
+        for msg in self.history[-self.RECENT_MESSAGE_COUNT:]:  # 只取最近5条消息
+            lines.append(f"  {msg['role']}: {msg['content']}")
+        self._history_text = "\n".join(lines)
+        self._rendered_history_length = len(self.history)
+        return True
+    
     def get_context(self) -> str:
         """获取上下文信息"""
-        context_parts = []
-        
-        # 添加患者信息
-        if self.patient_info:
-            context_parts.append("患者信息:")
-            for key, value in self.patient_info.items():
-                context_parts.append(f"  {key}: {value}")
+        # 依次检查各部分，只渲染发生变化的部分
+        changed = self._render_patient_info()
+        changed = self._render_diagnosis_process() or changed
+        changed = self._render_recent_history() or changed
         
-        # 添加诊断过程
-        if self.diagnosis_process:
-            context_parts.append("\n诊断过程:")
-            for i, step in enumerate(self.diagnosis_process, 1):
-                context_parts.append(f"  步骤{i}: {step['step']}")
-                context_parts.append(f"    思考: {step['thought']}")
-                context_parts.append(f"    行动: {step['action']}")
-        
-        # 添加最近的对话历史
-        if self.history:
-            context_parts.append("\n最近对话:")
-            for msg in self.history[-5:]:  # 只取最近5条消息
-                context_parts.append(f"  {msg['role']}: {msg['content']}")
-        
-        return "\n".join(context_parts)
+        if changed:
+            context_parts = [part for part in (self._patient_text, self._diagnosis_text, self._history_text) if part]
+            self._context = "\n".join(context_parts)
+        return self._context
     
     def clear(self):
         """清空记忆"""
         self.history = []
         self.patient_info = {}
-        self.diagnosis_process = []
\ No newline at end of file
+        self.diagnosis_process = []
+        self._reset_render_cache()
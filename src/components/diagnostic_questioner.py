@@ -3,6 +3,7 @@
 """
 from typing import List
 from src.components.conversation_memory import ConversationMemory
+from src.utils.tokenizer import get_tokenizer
 
 
 class DiagnosticQuestioner:
@@ -58,10 +59,8 @@ class DiagnosticQuestioner:
     
     def extract_keywords(self, text: str) -> List[str]:
         """从文本中提取关键词"""
-        # 简单的关键词提取逻辑，实际应用中可以使用更复杂的NLP技术
-        import jieba
-        # 这里只做示例，实际应该根据医学术语库来提取
-        words = jieba.lcut(text)
+        # 使用加载了医学术语词典的分词器，方剂、症状等术语不会被切开
+        words = get_tokenizer().lcut(text)
         # 简单过滤，保留长度大于1的词
         keywords = [w for w in words if len(w) > 1 and w not in ['的', '了', '在', '是', '我', '有', '和', '就', '都', '而', '及', '与', '或']]
         return keywords[:10]  # 返回前10个关键词
@@ -2,11 +2,12 @@
 解释组件 - 提供可解释AI功能
 包括：Chain-of-Thought、反事实解释、追问式解释等
 """
-from typing import Dict, List, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, List, Any, AsyncIterator, Iterator
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from src.config.settings import API_CONFIG
+from src.utils.llm_registry import get_chat_model
+from src.components.intent_router import IntentRouter
+from src.utils.tracing import traced
 
 
 class ExplanationComponent:
@@ -14,12 +15,10 @@ class ExplanationComponent:
     
     def __init__(self):
         # 初始化LLM用于解释生成
-        self.explanation_llm = ChatOpenAI(
-            model=API_CONFIG["model_name"],
-            temperature=0.1,
-            base_url=API_CONFIG["base_url"],
-            api_key=API_CONFIG["api_key"]
-        )
+        self.explanation_llm = get_chat_model(temperature=0.1)
+        
+        # 意图路由器（反事实、追问等触发词的单次扫描识别）
+        self.intent_router = IntentRouter()
         
         # 反事实解释提示模板
         self.counterfactual_prompt = ChatPromptTemplate.from_messages([
@@ -91,6 +90,7 @@ class ExplanationComponent:
                                 | self.explanation_llm 
                                 | StrOutputParser())
     
+    @traced("explanation.counterfactual")
     def generate_counterfactual_explanation(self, original_symptoms: str, 
                                           original_diagnosis: str, 
                                           counterfactual_condition: str) -> str:
@@ -105,6 +105,7 @@ class ExplanationComponent:
         except Exception as e:
             return f"生成反事实解释时出现错误: {str(e)}"
     
+    @traced("explanation.citation")
     def generate_citation_explanation(self, diagnosis: str, treatment: str) -> str:
         """生成依据溯源解释"""
         try:
@@ -116,6 +117,15 @@ class ExplanationComponent:
         except Exception as e:
             return f"生成依据溯源解释时出现错误: {str(e)}"
     
+    @traced("explanation.citation")
+    def stream_citation_explanation(self, diagnosis: str, treatment: str) -> Iterator[str]:
+        """流式生成依据溯源解释，出错时抛出异常（可能已输出部分内容），由调用方记录降级"""
+        yield from self.citation_chain.stream({
+            "diagnosis": diagnosis,
+            "treatment": treatment
+        })
+    
+    @traced("explanation.comparison")
     def generate_comparison_explanation(self, current_approach: str, 
                                       alternative_approach: str, 
                                       patient_context: str) -> str:
@@ -130,6 +140,7 @@ class ExplanationComponent:
         except Exception as e:
             return f"生成对比解释时出现错误: {str(e)}"
     
+    @traced("explanation.interactive")
     def generate_interactive_explanation(self, original_diagnosis: str, 
                                        reasoning_process: str, 
                                        user_question: str) -> str:
@@ -144,13 +155,74 @@ class ExplanationComponent:
         except Exception as e:
             return f"生成交互式解释时出现错误: {str(e)}"
     
+    @traced("explanation.counterfactual")
+    async def agenerate_counterfactual_explanation(self, original_symptoms: str, 
+                                                 original_diagnosis: str, 
+                                                 counterfactual_condition: str) -> str:
+        """异步生成反事实解释"""
+        try:
+            return await self.counterfactual_chain.ainvoke({
+                "original_symptoms": original_symptoms,
+                "original_diagnosis": original_diagnosis,
+                "counterfactual_condition": counterfactual_condition
+            })
+        except Exception as e:
+            return f"生成反事实解释时出现错误: {str(e)}"
+    
+    @traced("explanation.citation")
+    async def agenerate_citation_explanation(self, diagnosis: str, treatment: str) -> str:
+        """异步生成依据溯源解释"""
+        try:
+            return await self.citation_chain.ainvoke({
+                "diagnosis": diagnosis,
+                "treatment": treatment
+            })
+        except Exception as e:
+            return f"生成依据溯源解释时出现错误: {str(e)}"
+    
+    @traced("explanation.citation")
+    async def astream_citation_explanation(self, diagnosis: str, treatment: str) -> AsyncIterator[str]:
+        """异步流式生成依据溯源解释，出错时抛出异常（可能已输出部分内容），由调用方记录降级"""
+        async for chunk in self.citation_chain.astream({
+            "diagnosis": diagnosis,
+            "treatment": treatment
+        }):
+            yield chunk
+    
+    @traced("explanation.comparison")
+    async def agenerate_comparison_explanation(self, current_approach: str, 
+                                             alternative_approach: str, 
+                                             patient_context: str) -> str:
+        """异步生成对比解释"""
+        try:
+            return await self.comparison_chain.ainvoke({
+                "current_approach": current_approach,
+                "alternative_approach": alternative_approach,
+                "patient_context": patient_context
+            })
+        except Exception as e:
+            return f"生成对比解释时出现错误: {str(e)}"
+    
+    @traced("explanation.interactive")
+    async def agenerate_interactive_explanation(self, original_diagnosis: str, 
+                                              reasoning_process: str, 
+                                              user_question: str) -> str:
+        """异步生成交互式追问解释"""
+        try:
+            return await self.interactive_chain.ainvoke({
+                "original_diagnosis": original_diagnosis,
+                "reasoning_process": reasoning_process,
+                "user_question": user_question
+            })
+        except Exception as e:
+            return f"生成交互式解释时出现错误: {str(e)}"
+    
     def is_counterfactual_query(self, question: str) -> bool:
         """判断是否为反事实查询"""
-        counterfactual_keywords = ['如果', '假如', '要是', '假设', '万一', '若']
-        return any(keyword in question for keyword in counterfactual_keywords)
+        return self.intent_router.classify(question).has("counterfactual")
     
     def is_interactive_query(self, question: str, conversation_context: str = "") -> bool:
         """判断是否为交互式追问"""
-        interactive_keywords = ['为什么', '如何', '怎么', '原因', '依据', '区别', '对比', '解释']
-        has_context_reference = any(word in conversation_context for word in ['诊断', '分析', '建议', '治疗', '方案'])
-        return any(keyword in question for keyword in interactive_keywords) and has_context_reference
\ No newline at end of file
+        if not self.intent_router.classify(question).has("interactive"):
+            return False
+        return self.intent_router.classify_context(conversation_context).has("interactive")
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+意图路由组件 - 单次扫描识别用户消息和对话上下文中的意图触发词
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from src.config.settings import INTENT_CONFIG
+from src.utils.aho_corasick import AhoCorasickAutomaton
+
+
+@dataclass
+class IntentMatches:
+    """意图识别结果：意图 -> 命中的(起始位置, 结束位置, 触发词)列表"""
+    spans: Dict[str, List[Tuple[int, int, str]]] = field(default_factory=dict)
+
+    def has(self, intent: str) -> bool:
+        """是否命中指定意图"""
+        return intent in self.spans
+
+    def intents(self) -> List[str]:
+        """命中的意图列表"""
+        return list(self.spans)
+
+
+class IntentRouter:
+    """意图路由器
+
+    将消息词表和上下文词表编译进同一个Aho-Corasick自动机，
+    每次识别只扫描一遍文本，词表增长不会增加扫描次数。
+    """
+
+    MESSAGE_SCOPE = "message"
+    CONTEXT_SCOPE = "context"
+
+    def __init__(self, message_intents: Optional[Dict[str, List[str]]] = None,
+                 context_intents: Optional[Dict[str, List[str]]] = None):
+        self.message_intents = message_intents or INTENT_CONFIG["message_intents"]
+        self.context_intents = context_intents or INTENT_CONFIG["context_intents"]
+        self.automaton = AhoCorasickAutomaton()
+        for scope, vocabularies in ((self.MESSAGE_SCOPE, self.message_intents),
+                                    (self.CONTEXT_SCOPE, self.context_intents)):
+            for intent, keywords in vocabularies.items():
+                self.automaton.add_all(keywords, f"{scope}:{intent}")
+        self.automaton.build()
+        self._last_context: Tuple[Optional[str], IntentMatches] = (None, IntentMatches())
+
+    def _scan(self, text: str, scope: str) -> IntentMatches:
+        """扫描文本，收集指定范围内命中的意图"""
+        prefix = f"{scope}:"
+        matches = IntentMatches()
+        for start, end, keyword, labels in self.automaton.iter_matches(text):
+            for label in labels:
+                if label.startswith(prefix):
+                    matches.spans.setdefault(label[len(prefix):], []).append((start, end, keyword))
+        return matches
+
+    def classify(self, message: str) -> IntentMatches:
+        """识别用户消息中的意图"""
+        return self._scan(message, self.MESSAGE_SCOPE)
+
+    def classify_context(self, context: str) -> IntentMatches:
+        """识别对话上下文中的引用，上下文未变化时直接返回上次结果"""
+        last_context, last_matches = self._last_context
+        if context == last_context:
+            return last_matches
+        matches = self._scan(context, self.CONTEXT_SCOPE)
+        self._last_context = (context, matches)
+        return matches
@@ -32,4 +32,182 @@ VECTOR_DB_CONFIG = {
 SYSTEM_CONFIG = {
     "tokenizers_parallelism": "false",
     "max_fix_attempts": 2
-}
\ No newline at end of file
+}
+
+# 并发配置
+CONCURRENCY_CONFIG = {
+    "fanout_enabled": True,    # 是否并发查询中西医知识
+    "max_workers": None,       # 并发线程池大小，None表示按max_concurrent_turns自动计算
+    "max_concurrent_turns": 16,  # 预期同时处理的轮数（所有会话共享线程池，每轮最多占用3个线程：中西医分支和医学依据）
+    "tcm_timeout": 30,         # 中医分支超时（秒）
+    "wm_timeout": 30           # 西医分支超时（秒）
+}
+
+# 响应缓存配置
+CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 1024,           # 内存LRU层最大条目数
+    "ttl_seconds": 24 * 3600,      # 缓存有效期（秒）
+    "disk_path": None,             # sqlite磁盘层路径，None表示仅使用内存
+    "max_disk_entries": 20000      # 磁盘层最大条目数
+}
+
+# 语义缓存配置
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": True,
+    "similarity_threshold": 0.92,  # 余弦相似度阈值
+    "max_entries": 512,            # 每个解释模式的最大条目数
+    "ttl_seconds": 24 * 3600,      # 缓存有效期（秒）
+    "match_entities": True,        # 命中时还要求两问题中的医学实体（病症、证型、方剂、症状）相同
+    "term_file": "./basic_app/term.txt"   # 提取医学实体使用的术语表
+}
+
+# LLM HTTP连接池配置（所有LLM客户端共享）
+LLM_POOL_CONFIG = {
+    "max_connections": 100,            # 最大连接数
+    "max_keepalive_connections": 20,   # 最大保持连接数
+    "keepalive_expiry": 60,            # 空闲连接保持时间（秒）
+    "connect_timeout": 10,             # 连接超时（秒）
+    "read_timeout": 120                # 请求超时（秒）
+}
+
+# LLM调用容错配置（按模型端点统计）
+RESILIENCE_CONFIG = {
+    "max_retries": 3,              # 临时错误（连接失败、超时、429、5xx）的最大重试次数
+    "backoff_base": 0.5,           # 指数退避基数（秒），实际等待为[0, base×2^n]内的随机值
+    "backoff_max": 8,              # 单次退避上限（秒）
+    "hedging_enabled": True,       # 是否对慢请求发起对冲请求
+    "hedge_percentile": 95,        # 等待超过近期耗时的该分位数后发起对冲
+    "hedge_min_delay": 2.0,        # 对冲前的最短等待（秒）
+    "hedge_min_samples": 20,       # 耗时样本少于此数时不对冲
+    "max_hedge_ratio": 0.1,        # 对冲请求数占总请求数的上限
+    "latency_window": 200,         # 计算分位数使用的近期样本数
+    "failure_threshold": 5,        # 连续失败多少次后熔断
+    "reset_timeout": 30            # 熔断后多久（秒）放行探测请求
+}
+
+# 多会话配置
+SESSION_CONFIG = {
+    "idle_timeout": 30 * 60,   # 会话空闲超时（秒），超时后被清理
+    "max_sessions": 10000      # 最大会话数，超出时淘汰最久未活动的会话
+}
+
+# 批量查询配置
+BATCH_CONFIG = {
+    "max_concurrency": 8,          # 同时处理的问题数
+    "requests_per_second": 2.0     # 全局限速：每秒最多开始处理的问题数，0表示不限速
+}
+
+# 意图路由词表配置（所有词表编译为同一个多模式匹配自动机，可在此扩展）
+INTENT_CONFIG = {
+    # 用户消息中的触发词
+    "message_intents": {
+        "start_diagnosis": ['诊断', '看病', '症状', '不适', '哪里不舒服', '疼', '痒', '治疗', '病', '问诊'],
+        "counterfactual": ['如果', '假如', '要是', '假设', '万一', '若'],
+        "interactive": ['为什么', '如何', '怎么', '原因', '依据', '区别', '对比', '解释']
+    },
+    # 对话上下文中的引用词（上下文中存在之前的诊断结果时才处理反事实和追问）
+    "context_intents": {
+        "counterfactual": ['诊断', '分析'],
+        "interactive": ['诊断', '分析', '建议', '治疗', '方案']
+    }
+}
+
+# 各解释模式的生成配置：prompt为提示模板变体，model为None时使用API_CONFIG中的模型，
+# max_tokens限制生成长度，stop为停止序列
+GENERATION_PROFILES = {
+    "detailed": {"prompt": "integration", "model": None, "temperature": 0.3, "max_tokens": 2048, "stop": None},
+    "brief": {"prompt": "brief", "model": None, "temperature": 0.3, "max_tokens": 320, "stop": None},
+    "cot": {"prompt": "cot", "model": None, "temperature": 0.3, "max_tokens": 2048, "stop": None},
+    "structured": {"prompt": "json", "model": None, "temperature": 0.1, "max_tokens": 1024, "stop": None}
+}
+
+# 链路追踪配置
+TRACING_CONFIG = {
+    "enabled": True,                       # 进程内按阶段汇总耗时（stats命令、基准测试使用）
+    "trace_file": os.getenv("TRACE_FILE") or None,   # 各阶段追踪记录（JSONL），None表示不写文件
+    "max_file_bytes": 50 * 1024 * 1024,    # 追踪文件超过此大小时轮转
+    "backup_count": 3,                     # 轮转保留的旧文件数（traces.jsonl.1 ~ .N）
+    "max_samples": 10000                   # 每个阶段保留的耗时样本数，用于计算分位数
+}
+
+# 请求截止时间配置
+DEADLINE_CONFIG = {
+    "default_budget": 60,          # 每轮请求的默认时间预算（秒），None表示不限时
+    "mode_budgets": {              # 各解释模式的默认时间预算（秒），覆盖default_budget
+        "detailed": 150,           # 详细和CoT模式最多生成2048个Token并附医学依据，60秒常不够
+        "cot": 150,
+        "structured": 120
+    },
+    "knowledge_share": {           # 中西医知识分支可使用的剩余预算比例（两分支并发执行）
+        "tcm": 0.5,
+        "wm": 0.5
+    },
+    "min_citation_budget": 8,      # 剩余时间少于此值（秒）时跳过医学依据生成
+    "max_workers": 64              # 限时调用和流式迭代共用的后台线程数
+}
+
+# 图数据库schema快照配置（启动时加载快照，跳过schema查询）
+GRAPH_SCHEMA_CONFIG = {
+    "snapshot_file": "./basic app/graph_schema.json",
+    "background_refresh": True,    # 使用快照启动后在后台重新查询schema，有变化时更新快照
+    "rebuild": os.getenv("GRAPH_SCHEMA_REBUILD", "").lower() in ("1", "true", "yes")  # 启动时忽略快照重新查询
+}
+
+# Cypher模板缓存配置（按问题句式复用参数化的Cypher，跳过Cypher生成）
+CYPHER_CACHE_CONFIG = {
+    "enabled": True,
+    "max_templates": 256,          # 最多缓存的问题句式数（LRU）
+    "min_fixed_chars": 2           # 句式中除实体外至少包含的字符数
+}
+
+# 图谱查询快速路径配置（识别术语表中的实体和所问关系，直接执行预置Cypher）
+GRAPH_FAST_PATH_CONFIG = {
+    "enabled": True,
+    "term_file": "./basic_app/term.txt",
+    # 术语表分节 -> 图谱节点标签
+    "section_labels": {"方剂": "方剂", "证型": "证型", "症状": "症状", "病症": "皮肤病"},
+    # 同一术语属于多种标签时的优先顺序
+    "label_priority": ["皮肤病", "证型", "方剂", "症状"],
+    # 所问的关系（目标节点标签） -> 触发词
+    "relation_keywords": {
+        "方剂": ['方剂', '方子', '处方', '中药', '用药', '用什么药', '吃什么药', '药膏', '怎么治', '如何治', '治疗方法', '治法'],
+        "证型": ['证型', '辨证', '分型', '哪些证', '什么证', '证候'],
+        "症状": ['症状', '主症', '表现', '症候'],
+        "皮肤病": ['什么病', '哪些病', '哪种病', '主治', '适用于', '治什么']
+    }
+}
+
+# 分词配置
+TOKENIZER_CONFIG = {
+    "term_file": "./basic_app/term.txt",   # 医学术语表，作为jieba用户词典加载
+    "cache_dir": None,                     # 编译后用户词典的缓存目录，None表示系统临时目录
+    "parallel_processes": None,            # 批量分词的进程数，None表示CPU核数
+    "parallel_min_texts": 256,             # 批量分词文本数达到此值时才使用多进程
+    "parallel_start_method": "spawn"       # 批量分词子进程的启动方式（spawn或forkserver，不使用fork）
+}
+
+# 疾病数据配置（Neo4j不可用时的备用知识库）
+DISEASE_STORE_CONFIG = {
+    "source_file": "./tools/disease.jsonl",     # tools/structure.py生成的疾病数据
+    "store_file": "./tools/disease.store",      # tools/build_disease_store.py编译的二进制存储，存在时优先使用
+    "index_dir": "./tools/disease.index"        # 使用二进制存储时持久化的检索索引目录（过期时自动重建）
+}
+
+# 疾病数据检索配置（Neo4j不可用时的备用查询，BM25F排序）
+DISEASE_INDEX_CONFIG = {
+    "field_boosts": {              # 各字段的权重，未列出的字段不建索引
+        "name": 5.0,
+        "key_point": 3.0,
+        "solution": 2.0,
+        "name_exp": 1.0,
+        "cause": 1.0,
+        "after": 0.5
+    },
+    "k1": 1.2,                     # 词频饱和参数
+    "b": 0.75,                     # 字段长度归一化参数
+    "top_k": 3,                    # 返回的疾病数
+    "batch_chunk_size": 1024,      # 批量检索时每次矩阵乘法的问题数（限制稠密得分矩阵的内存）
+    "stopwords": ['的', '了', '在', '是', '我', '有', '和', '就', '都', '而', '及', '与', '或',
+                  '什么', '怎么', '如何', '哪些', '一下', '可以', '请问', '需要']
+}
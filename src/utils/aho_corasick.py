@@ -0,0 +1,78 @@
+"""
+Aho-Corasick多模式匹配工具类
+"""
+from collections import deque
+from typing import Dict, List, Iterator, Iterable, Tuple, Set
+
+
+class AhoCorasickAutomaton:
+    """Aho-Corasick自动机
+
+    一次扫描文本即可找出所有词表中出现的模式串，耗时与文本长度和匹配数成正比，
+    与模式串数量无关。每个模式串可以带多个标签（如同一个词同时属于多个意图）。
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, Tuple[str, ...]]]] = [[]]
+        self._labels: Dict[str, Set[str]] = {}
+        self._built = False
+
+    def add(self, pattern: str, label: str):
+        """添加模式串及其标签，添加后需重新build"""
+        if not pattern:
+            return
+        self._labels.setdefault(pattern, set()).add(label)
+        self._built = False
+
+    def add_all(self, patterns: Iterable[str], label: str):
+        """批量添加同一标签的模式串"""
+        for pattern in patterns:
+            self.add(pattern, label)
+
+    def build(self) -> "AhoCorasickAutomaton":
+        """构建goto表、失败指针和输出表"""
+        self._goto, self._fail, self._outputs = [{}], [0], [[]]
+        for pattern, labels in self._labels.items():
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                state = next_state
+            self._outputs[state].append((pattern, tuple(sorted(labels))))
+
+        # 按层次遍历设置失败指针，并合并失败状态的输出
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Tuple[str, ...]]]:
+        """扫描文本，依次返回(起始位置, 结束位置, 模式串, 标签)"""
+        if not self._built:
+            self.build()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern, labels in outputs[state]:
+                yield index + 1 - len(pattern), index + 1, pattern, labels
+
+    def __len__(self) -> int:
+        return len(self._labels)
@@ -0,0 +1,97 @@
+"""
+Cypher模板缓存 - 按问题句式复用已生成的参数化Cypher，跳过Cypher生成的LLM调用
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from src.config.settings import CYPHER_CACHE_CONFIG
+
+# Cypher中节点id的字符串字面量，如 {id: "扁平疣"} 或 n.id = '扁平疣'
+_ID_LITERAL = re.compile(
+    r"""(?P<prefix>\bid\s*:\s*|\.id\s*=\s*)(?P<quote>["'])(?P<value>(?:(?!(?P=quote)).)+)(?P=quote)"""
+)
+
+
+@dataclass
+class CypherTemplate:
+    """一个问题句式及其参数化Cypher"""
+    pattern: re.Pattern    # 问题句式，实体位置为命名分组（分组名即Cypher参数名）
+    cypher: str            # id字面量替换为$参数的Cypher
+    hits: int = 0
+
+
+class CypherTemplateCache:
+    """Cypher模板缓存
+
+    Cypher生成成功后，把其中出现在问题里的节点id字面量提取为参数：问题中的实体位置变成正则分组
+    （问题句式），Cypher中的字面量变成$参数（模板）。之后的问题匹配已知句式时，用匹配到的实体
+    作为参数直接执行模板，不再调用LLM生成Cypher。按LRU保留最多max_templates个句式。
+    """
+
+    def __init__(self, max_templates: Optional[int] = None, min_fixed_chars: Optional[int] = None):
+        self.max_templates = max_templates or CYPHER_CACHE_CONFIG["max_templates"]
+        self.min_fixed_chars = min_fixed_chars or CYPHER_CACHE_CONFIG["min_fixed_chars"]
+        self._templates: "OrderedDict[str, CypherTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """去除空白和句末标点（不改变大小写，实体按原样作为参数）"""
+        return re.sub(r"\s+", "", question).rstrip("?？。!！.~～")
+
+    def lookup(self, question: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """查找匹配问题句式的模板，返回(参数化Cypher, 参数)，未命中返回None"""
+        question = self.normalize(question)
+        with self._lock:
+            for key, template in reversed(self._templates.items()):
+                match = template.pattern.fullmatch(question)
+                if match:
+                    template.hits += 1
+                    self._templates.move_to_end(key)
+                    return template.cypher, match.groupdict()
+        return None
+
+    def learn(self, question: str, cypher: str) -> bool:
+        """从问题和为其生成的Cypher中提取模板，返回是否已缓存
+
+        只缓存能可靠参数化的情况：Cypher中每个id字面量在问题中恰好出现一次，实体之间有固定文字分隔，
+        且固定文字不少于min_fixed_chars个字符（避免"实体"本身就是整个问题的句式匹配任意问题）。
+        """
+        question = self.normalize(question)
+        values = list(dict.fromkeys(match.group("value") for match in _ID_LITERAL.finditer(cypher)))
+        if not values or any(question.count(value) != 1 for value in values):
+            return False
+
+        spans = sorted((question.index(value), question.index(value) + len(value), value) for value in values)
+        names, parts, position = {}, [], 0
+        for start, end, value in spans:
+            if start < position or (parts and start == position):
+                return False  # 实体重叠或相邻，无法确定边界
+            names[value] = f"p{len(names)}"
+            parts.append(re.escape(question[position:start]))
+            parts.append(f"(?P<{names[value]}>.+?)")
+            position = end
+        parts.append(re.escape(question[position:]))
+        if len(question) - sum(end - start for start, end, _ in spans) < self.min_fixed_chars:
+            return False
+
+        pattern = "".join(parts)
+        template = _ID_LITERAL.sub(lambda match: f"{match.group('prefix')}${names[match.group('value')]}", cypher)
+        with self._lock:
+            self._templates[pattern] = CypherTemplate(re.compile(pattern), template)
+            self._templates.move_to_end(pattern)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return True
+
+    def clear(self):
+        """清空全部模板（图数据库schema变化后已学到的Cypher可能不再适用）"""
+        with self._lock:
+            self._templates.clear()
+
+    def templates(self) -> List[CypherTemplate]:
+        """当前缓存的模板（最近使用的在后）"""
+        with self._lock:
+            return list(self._templates.values())
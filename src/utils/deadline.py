@@ -0,0 +1,151 @@
+"""
+截止时间工具类 - 单次请求的时间预算及降级记录
+"""
+import asyncio
+import contextvars
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional
+from src.config.settings import DEADLINE_CONFIG
+
+
+class DeadlineExceeded(TimeoutError):
+    """超过请求截止时间"""
+
+    def __init__(self, message: str = "已超过本次请求的截止时间"):
+        super().__init__(message)
+
+
+class Deadline:
+    """单次请求的截止时间
+
+    budget为时间预算（秒），为None时不限时。各阶段按剩余时间决定超时、是否跳过可选环节，
+    被取消或跳过的阶段通过mark_degraded记录，随回复一起告知调用方。
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.budget = budget
+        self.expires_at = math.inf if budget is None else time.monotonic() + max(0.0, budget)
+        self.degraded: Dict[str, str] = {}  # 阶段名 -> 降级原因
+        self._lock = threading.Lock()
+
+    @property
+    def bounded(self) -> bool:
+        """是否设置了时间预算"""
+        return self.expires_at != math.inf
+
+    def remaining(self) -> float:
+        """剩余时间（秒），不限时返回inf"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self) -> Optional[float]:
+        """剩余时间，用作各类等待的timeout参数（不限时返回None）"""
+        return self.remaining() if self.bounded else None
+
+    def expired(self) -> bool:
+        """是否已超过截止时间"""
+        return time.monotonic() >= self.expires_at
+
+    def mark_degraded(self, stage: str, reason: str):
+        """记录降级的阶段（同一阶段只记录首个原因）"""
+        with self._lock:
+            self.degraded.setdefault(stage, reason)
+
+
+_ITEM, _ERROR, _END = range(3)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _iter_executor() -> ThreadPoolExecutor:
+    """后台迭代共用的线程池（按需创建），空闲线程被后续调用复用"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DEADLINE_CONFIG["max_workers"],
+                                               thread_name_prefix="deadline-iter")
+    return _executor
+
+
+def call_with_deadline(func: Callable[..., Any], deadline: Deadline, *args, **kwargs) -> Any:
+    """在截止时间内调用func，超时抛出DeadlineExceeded
+
+    设置了时间预算时在共用线程池中调用，超时后不再等待（后台调用完成后结果被丢弃）。不限时时直接调用。
+    """
+    if not deadline.bounded:
+        return func(*args, **kwargs)
+    return next(iter_with_deadline(_call_once(func, args, kwargs), deadline))
+
+
+def _call_once(func: Callable[..., Any], args, kwargs) -> Iterator[Any]:
+    """将单次调用包装为只产出一项的迭代器"""
+    yield func(*args, **kwargs)
+
+
+def iter_with_deadline(iterable: Iterable[Any], deadline: Deadline) -> Iterator[Any]:
+    """逐项产出iterable的内容，等待下一项超过截止时间时抛出DeadlineExceeded
+
+    设置了时间预算时在共用线程池中迭代，阻塞的网络读取不会拖住调用方；调用方提前结束
+    或超时后，后台迭代在当前项返回后停止（尚未开始的不再开始）。不限时时直接迭代。
+    """
+    if not deadline.bounded:
+        yield from iterable
+        return
+
+    items = queue.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        if stopped.is_set():
+            return
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                items.put((_ITEM, item))
+            items.put((_END, None))
+        except BaseException as e:
+            items.put((_ERROR, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    _iter_executor().submit(contextvars.copy_context().run, produce)
+    try:
+        while True:
+            try:
+                kind, value = items.get(timeout=deadline.remaining())
+            except queue.Empty:
+                raise DeadlineExceeded() from None
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stopped.set()
+
+
+async def aiter_with_deadline(aiterable: AsyncIterable[Any], deadline: Deadline) -> AsyncIterator[Any]:
+    """iter_with_deadline的异步版本，超时时取消正在等待的下一项"""
+    iterator = aiterable.__aiter__()
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(anext(iterator), deadline.timeout())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded() from None
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
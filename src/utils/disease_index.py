@@ -0,0 +1,223 @@
+"""
+疾病数据倒排索引 - Neo4j不可用时按BM25F对疾病数据排序检索
+"""
+import hashlib
+import heapq
+import json
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+from src.config.settings import DISEASE_INDEX_CONFIG
+from src.utils.tokenizer import get_tokenizer
+
+# 持久化索引的格式版本，格式变化时递增
+INDEX_FORMAT = 1
+# 持久化索引目录中的数组文件：排序后的词表和 词×疾病 权重矩阵的CSR数组
+_ARRAYS = ("terms", "indptr", "indices", "data")
+
+
+class DiseaseIndex:
+    """疾病数据的倒排索引
+
+    按BM25F（各字段词频按字段权重和长度归一化后合并，再做词频饱和）算出每个词在每个疾病上的权重，
+    存为 词×疾病 的稀疏矩阵，疾病得分为问题中各词权重之和。单次检索只读取问题中出现的词所在的行，
+    用堆取得分最高的k个疾病；批量检索用一次稀疏矩阵乘法算出所有问题的得分。
+
+    指定index_dir时索引持久化到该目录：词表和矩阵保存为.npy文件，之后启动时以内存映射方式打开，
+    不再对疾病数据分词，启动耗时和常驻内存不随数据量增长。数据、分词词典或检索参数变化时自动重建。
+    索引建好后只读，可在多个线程中同时检索。
+    """
+
+    def __init__(self, diseases: Sequence[Mapping[str, Any]], config: Optional[Dict[str, Any]] = None,
+                 index_dir: Optional[str] = None, source_version: str = ""):
+        config = config or DISEASE_INDEX_CONFIG
+        self.diseases = diseases
+        self.fields: List[str] = list(config["field_boosts"])
+        self.boosts: List[float] = [config["field_boosts"][field] for field in self.fields]
+        self.k1 = config["k1"]
+        self.b = config["b"]
+        self.top_k = config["top_k"]
+        self.stopwords = set(config["stopwords"])
+        self.batch_chunk_size = config["batch_chunk_size"]
+
+        self.terms: np.ndarray = np.array([], dtype="<U1")     # 排序后的词表，下标即矩阵行号
+        self.matrix: Optional[sparse.csr_matrix] = None          # 词×疾病的权重矩阵
+
+        signature = self._signature(source_version)
+        if index_dir is None or not self._load(index_dir, signature):
+            self._build()
+            if index_dir is not None:
+                self._save(index_dir, signature)
+
+    def tokenize(self, text: str) -> List[str]:
+        """分词（搜索引擎模式，长词同时切出其中的短词），过滤单字和停用词"""
+        return self._filter(get_tokenizer().lcut_for_search(text))
+
+    def _filter(self, words: List[str]) -> List[str]:
+        """过滤单字、空白和停用词"""
+        return [word for word in words if len(word) > 1 and word not in self.stopwords and not word.isspace()]
+
+    def _signature(self, source_version: str) -> str:
+        """索引内容的签名：数据版本、疾病数、分词词典版本和检索参数，任一变化时持久化的索引失效"""
+        payload = json.dumps({
+            "format": INDEX_FORMAT,
+            "source": source_version,
+            "count": len(self.diseases),
+            "dictionary": get_tokenizer().dictionary_version(),
+            "field_boosts": dict(zip(self.fields, self.boosts)),
+            "k1": self.k1,
+            "b": self.b,
+            "stopwords": sorted(self.stopwords)
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _build(self):
+        """对每个疾病的各字段分词（批量分词），计算每个词在每个疾病上的BM25F权重
+
+        权重与问题无关，建索引时算好，按词排序存为 词×疾病 的稀疏矩阵。
+        """
+        texts = [str(disease.get(field) or "") for disease in self.diseases for field in self.fields]
+        words = iter(get_tokenizer().bulk_lcut(texts, search=True))
+        field_postings: Dict[str, List[Tuple[int, int, int]]] = {}
+        field_lengths: List[List[int]] = []
+        for doc_id in range(len(self.diseases)):
+            lengths = []
+            for field_id in range(len(self.fields)):
+                tokens = self._filter(next(words))
+                lengths.append(len(tokens))
+                for token, tf in Counter(tokens).items():
+                    field_postings.setdefault(token, []).append((doc_id, field_id, tf))
+            field_lengths.append(lengths)
+
+        count = max(1, len(self.diseases))
+        avg_lengths = [
+            max(1.0, sum(lengths[field_id] for lengths in field_lengths) / count)
+            for field_id in range(len(self.fields))
+        ]
+
+        terms = sorted(field_postings)
+        rows, cols, weights = [], [], []
+        for term_id, token in enumerate(terms):
+            # 各字段词频按字段权重和长度归一化后合并到疾病上
+            weighted_tf: Dict[int, float] = {}
+            for doc_id, field_id, tf in field_postings[token]:
+                norm = 1 - self.b + self.b * field_lengths[doc_id][field_id] / avg_lengths[field_id]
+                weighted_tf[doc_id] = weighted_tf.get(doc_id, 0.0) + self.boosts[field_id] * tf / norm
+            # 文档频率按疾病计（同一疾病多个字段出现只计一次）
+            df = len(weighted_tf)
+            idf = math.log(1 + (len(self.diseases) - df + 0.5) / (df + 0.5))
+            for doc_id, tf in weighted_tf.items():
+                rows.append(term_id)
+                cols.append(doc_id)
+                weights.append(idf * tf / (self.k1 + tf))
+
+        self.terms = np.array(terms, dtype=str) if terms else np.array([], dtype="<U1")
+        self.matrix = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), (rows, cols)),
+            shape=(len(terms), len(self.diseases))
+        )
+
+    def _save(self, index_dir: str, signature: str):
+        """保存索引（先删除旧的元数据，数组写完后再写元数据，中断时不会留下看似有效的索引）"""
+        meta_path = os.path.join(index_dir, "meta.json")
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            arrays = {"terms": self.terms, "indptr": self.matrix.indptr,
+                      "indices": self.matrix.indices, "data": self.matrix.data}
+            for name in _ARRAYS:
+                np.save(os.path.join(index_dir, f"{name}.npy"), arrays[name])
+            temp_path = f"{meta_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "terms": len(self.terms), "diseases": len(self.diseases),
+                           "nnz": int(self.matrix.nnz)}, f)
+            os.replace(temp_path, meta_path)
+        except OSError as e:
+            print(f"⚠️ 疾病检索索引保存失败，下次启动时将重新建立: {str(e)}")
+
+    def _load(self, index_dir: str, signature: str) -> bool:
+        """以内存映射方式打开持久化的索引，索引不存在、已过期或不完整时返回False"""
+        try:
+            with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("signature") != signature:
+                return False
+            arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        except (OSError, ValueError):
+            return False
+        if (len(arrays["terms"]) != meta["terms"] or len(arrays["indptr"]) != meta["terms"] + 1
+                or len(arrays["indices"]) != meta["nnz"] or len(arrays["data"]) != meta["nnz"]):
+            return False
+
+        self.terms = arrays["terms"]
+        self.matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(meta["terms"], len(self.diseases)), copy=False
+        )
+        return True
+
+    def _lookup(self, words: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """在词表中二分查找，返回(矩阵行号, 是否在词表中)，两者与words一一对应"""
+        if not len(words) or not len(self.terms):
+            return np.zeros(len(words), dtype=np.int64), np.zeros(len(words), dtype=bool)
+        words = np.asarray(words, dtype=str)
+        rows = np.minimum(np.searchsorted(self.terms, words), len(self.terms) - 1)
+        return rows, self.terms[rows] == words
+
+    def search(self, question: str, k: Optional[int] = None) -> List[Tuple[Mapping[str, Any], float]]:
+        """检索与问题最相关的k个疾病，返回[(疾病数据, 得分)]，按得分从高到低排列"""
+        rows, found = self._lookup(self.tokenize(question))
+        indptr, indices, data = self.matrix.indptr, self.matrix.indices, self.matrix.data
+        scores: Dict[int, float] = {}
+        for row in set(rows[found].tolist()):
+            start, end = indptr[row], indptr[row + 1]
+            for doc_id, weight in zip(indices[start:end].tolist(), data[start:end].tolist()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+
+        # 得分相同时文件中靠前的疾病优先
+        top = heapq.nlargest(k or self.top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.diseases[doc_id], score) for doc_id, score in top]
+
+    def batch_search(self, questions: Sequence[str], k: Optional[int] = None) -> List[List[Tuple[Mapping[str, Any], float]]]:
+        """批量检索，结果与逐条调用search相同（得分相同的疾病顺序可能不同）
+
+        问题批量分词后组成 问题×词 的稀疏矩阵，与索引矩阵相乘一次得到全部得分，
+        再用argpartition按行取前k个。
+        """
+        questions = list(questions)
+        k = min(k or self.top_k, len(self.diseases))
+        if not questions or k <= 0:
+            return [[] for _ in questions]
+
+        question_ids, words = [], []
+        for question_id, tokens in enumerate(get_tokenizer().bulk_lcut(questions, search=True)):
+            tokens = self._filter(tokens)
+            question_ids.extend([question_id] * len(tokens))
+            words.extend(tokens)
+        term_ids, found = self._lookup(words)
+        # 同一问题中重复的词只计一次
+        pairs = np.unique(np.asarray(question_ids, dtype=np.int64)[found] * len(self.terms) + term_ids[found])
+        rows, cols = np.divmod(pairs, max(1, len(self.terms)))
+        query_matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(questions), len(self.terms))
+        )
+
+        results = []
+        chunk_size = self.batch_chunk_size
+        for start in range(0, len(questions), chunk_size):
+            scores = (query_matrix[start:start + chunk_size] @ self.matrix).toarray()
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            # 按得分从高到低排序，得分相同时文件中靠前的疾病优先
+            order = np.lexsort((top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for doc_ids, row_scores in zip(top.tolist(), top_scores.tolist()):
+                results.append([(self.diseases[doc_id], score)
+                                for doc_id, score in zip(doc_ids, row_scores) if score > 0])
+        return results
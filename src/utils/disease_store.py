@@ -0,0 +1,161 @@
+"""
+疾病数据存储 - 紧凑的二进制格式，内存映射后按需解码字段
+
+文件格式（小端）：
+    头部      magic(8字节) 字段数(uint32) 疾病数(uint32)
+    字段表    每个字段名：长度(uint16) + UTF-8字节
+    偏移表    疾病数 × 字段数 个 (偏移uint32, 长度uint32)，偏移相对于字符串表起始位置
+    字符串表  所有字段值的UTF-8字节依次拼接
+"""
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Sequence
+
+MAGIC = b"DSTORE1\0"
+_HEADER = struct.Struct("<8sII")
+_NAME_LENGTH = struct.Struct("<H")
+_SLOT = struct.Struct("<II")
+
+
+def read_disease_records(path: str) -> List[Dict[str, Any]]:
+    """读取疾病JSON文件，兼容每行一个对象的JSONL和tools/structure.py输出的多行缩进格式
+
+    依次解码文件中连续的JSON对象，跳过无法解析的片段。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    decoder = json.JSONDecoder()
+    records, pos = [], 0
+    while True:
+        pos = text.find("{", pos)
+        if pos == -1:
+            return records
+        try:
+            record, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos += 1
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+        pos = end
+
+
+def write_disease_store(records: Sequence[Dict[str, Any]], path: str, fields: Sequence[str] = None) -> int:
+    """将疾病数据写入二进制存储文件，返回写入的字节数
+
+    fields为要保存的字段，默认取所有记录中出现过的字段（按首次出现的顺序）。
+    """
+    if fields is None:
+        fields = list(dict.fromkeys(key for record in records for key in record))
+
+    slots, strings, offset = [], [], 0
+    for record in records:
+        for field in fields:
+            value = record.get(field)
+            if value is None:
+                value = ""
+            elif not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False)
+            data = value.encode("utf-8")
+            slots.append(_SLOT.pack(offset, len(data)))
+            strings.append(data)
+            offset += len(data)
+    if offset > 0xFFFFFFFF:
+        raise ValueError("疾病数据超过4GB，无法写入存储文件")
+
+    names = [field.encode("utf-8") for field in fields]
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(fields), len(records)))
+        for name in names:
+            f.write(_NAME_LENGTH.pack(len(name)))
+            f.write(name)
+        f.writelines(slots)
+        f.writelines(strings)
+        size = f.tell()
+    os.replace(temp_path, path)
+    return size
+
+
+class DiseaseRecord(Mapping):
+    """存储中的一条疾病数据，字段在访问时才从内存映射中解码"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "DiseaseStore", index: int):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, field: str) -> str:
+        return self._store.field(self._index, field)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.fields)
+
+    def __len__(self) -> int:
+        return len(self._store.fields)
+
+    def __repr__(self) -> str:
+        return f"DiseaseRecord({self._index}, name={self.get('name', '')!r})"
+
+
+class DiseaseStore(Sequence):
+    """内存映射的疾病数据存储
+
+    打开时只解析头部和字段表，偏移表和字符串表留在内存映射中，由操作系统按页加载，
+    启动耗时和常驻内存不随数据量增长。只读，可在多个线程中同时访问。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # 文件版本（大小和修改时间），重新编译后变化，用于判断持久化的检索索引是否过期
+        self.version = f"{stat.st_size}:{stat.st_mtime_ns}"
+
+        magic, field_count, self._count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是有效的疾病数据存储文件: {path}")
+
+        pos = _HEADER.size
+        self.fields: List[str] = []
+        for _ in range(field_count):
+            (length,) = _NAME_LENGTH.unpack_from(self._mmap, pos)
+            pos += _NAME_LENGTH.size
+            self.fields.append(self._mmap[pos:pos + length].decode("utf-8"))
+            pos += length
+        self._field_ids = {field: i for i, field in enumerate(self.fields)}
+        self._slots_start = pos
+        self._strings_start = pos + self._count * field_count * _SLOT.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("疾病序号超出范围")
+        return DiseaseRecord(self, index)
+
+    def field(self, index: int, field: str) -> str:
+        """解码第index条疾病数据的字段，字段不存在时抛出KeyError"""
+        field_id = self._field_ids[field]
+        slot = self._slots_start + (index * len(self.fields) + field_id) * _SLOT.size
+        offset, length = _SLOT.unpack_from(self._mmap, slot)
+        start = self._strings_start + offset
+        return self._mmap[start:start + length].decode("utf-8")
+
+    def close(self):
+        """关闭内存映射"""
+        self._mmap.close()
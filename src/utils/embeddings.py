@@ -1,11 +1,13 @@
 """
 嵌入模型工具类
 """
-from typing import Optional
+from typing import Optional, List
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.embeddings import DashScopeEmbeddings
 from src.config.settings import EMBEDDING_CONFIG, API_CONFIG
+from src.utils.single_flight import SingleFlight
 
 
 class EmbeddingFactory:
@@ -60,6 +62,26 @@ class EmbeddingFactory:
             return cls.create_huggingface_embedding()
 
 
+class SingleFlightEmbeddings(Embeddings):
+    """嵌入模型包装：并发的相同查询文本只向量化一次（检索和语义缓存共用）"""
+    
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.inflight = SingleFlight("embedding")
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.inflight.do(text, self.embeddings.embed_query, text)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.inflight.ado(text, self.embeddings.aembed_query, text)
+
+
 def get_embedding_function(preferred_type: str = "huggingface"):
     """获取嵌入函数的便捷方法"""
     return EmbeddingFactory.create_embedding(preferred_type)
\ No newline at end of file
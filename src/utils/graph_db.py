@@ -1,34 +1,60 @@
 """
 图数据库工具类
 """
-from typing import Optional, Dict, Any
+import asyncio
+import os
+import threading
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple
+from neo4j import AsyncGraphDatabase, RoutingControl
 from langchain_neo4j import Neo4jGraph
-from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain
+from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain, extract_cypher
+from langchain_neo4j.graphs.neo4j_graph import format_schema
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from src.config.settings import API_CONFIG
+from src.config.settings import API_CONFIG, CYPHER_CACHE_CONFIG, GRAPH_FAST_PATH_CONFIG, GRAPH_SCHEMA_CONFIG
+from src.utils.llm_registry import get_chat_model
+from src.utils.cypher_cache import CypherTemplateCache
+from src.utils.graph_fast_path import GraphFastPath
+from src.utils.graph_schema import load_schema_snapshot, save_schema_snapshot, schema_hash
+from src.utils.tracing import tracer, traced, traced_runnable
+
+
+class _TracedNeo4jGraph(Neo4jGraph):
+    """记录Cypher执行耗时的Neo4jGraph"""
+    
+    @traced("graph.cypher_execute")
+    def query(self, query: str, params: Optional[dict] = None, session_params: Optional[dict] = None) -> List[Dict[str, Any]]:
+        return super().query(query, params, session_params)
+
+
+class GraphQueryError(Exception):
+    """图数据库不可用或查询失败，异常信息为面向用户的说明文字"""
 
 
 class GraphDBManager:
     """图数据库管理器"""
     
-    def __init__(self, database: Optional[str] = None):
+    def __init__(self, database: Optional[str] = None, graph=None):
         self.database = database or API_CONFIG["neo4j_database"]
         self.graph = None
         self.chain = None
         self.llm = None
-        self._initialize_graph()
+        self._async_drivers: Dict[asyncio.AbstractEventLoop, Any] = {}  # 事件循环 -> 异步Neo4j驱动
+        self._async_driver_lock = threading.Lock()
+        self.fast_path = GraphFastPath() if GRAPH_FAST_PATH_CONFIG["enabled"] else None
+        self.cypher_cache = CypherTemplateCache() if CYPHER_CACHE_CONFIG["enabled"] else None
+        self.schema_hash = None
+        self._schema_lock = threading.Lock()
+        self._schema_listeners: List[Callable[[], None]] = []
+        self._initialize_graph(graph)
     
-    def _initialize_graph(self):
-        """初始化图数据库连接"""
+    def _initialize_graph(self, graph=None):
+        """初始化图数据库连接，graph为已有的图存储对象时直接使用"""
         try:
-            self.graph = Neo4jGraph(database=self.database)
-            self.llm = ChatOpenAI(
-                model=API_CONFIG["model_name"],
-                temperature=0,
-                base_url=API_CONFIG["base_url"],
-                api_key=API_CONFIG["api_key"]
-            )
+            from_snapshot = False
+            if graph is None:
+                graph, from_snapshot = self._connect_neo4j()
+            self.graph = graph
+            self.llm = get_chat_model(temperature=0)
             self._create_cypher_chain()
             print(f"✅ 图数据库连接成功: {self.database}")
         except Exception as e:
@@ -36,6 +62,66 @@ class GraphDBManager:
             print("将使用替代方案进行图数据查询")
             self.graph = None
             self.chain = None
+            return
+        
+        if from_snapshot and GRAPH_SCHEMA_CONFIG["background_refresh"]:
+            # 使用快照启动后在后台核对schema，有变化时更新快照并重建查询链
+            threading.Thread(target=self.refresh_schema, name="graph-schema-refresh", daemon=True).start()
+    
+    def _connect_neo4j(self) -> Tuple[Neo4jGraph, bool]:
+        """连接Neo4j，返回(图对象, 是否使用了schema快照)
+        
+        构造时跳过schema查询：有本数据库的schema快照时直接加载，否则查询schema并保存快照。
+        """
+        graph = _TracedNeo4jGraph(database=self.database, refresh_schema=False)
+        snapshot = None
+        if not GRAPH_SCHEMA_CONFIG["rebuild"]:
+            snapshot = load_schema_snapshot(GRAPH_SCHEMA_CONFIG["snapshot_file"], self.database)
+        
+        if snapshot is None:
+            graph.refresh_schema()
+            self.schema_hash = save_schema_snapshot(GRAPH_SCHEMA_CONFIG["snapshot_file"], self.database,
+                                                    graph.structured_schema)
+            return graph, False
+        
+        graph.structured_schema = snapshot
+        graph.schema = format_schema(snapshot, getattr(graph, "_enhanced_schema", False))
+        self.schema_hash = schema_hash(snapshot)
+        return graph, True
+    
+    def refresh_schema(self) -> bool:
+        """重新查询schema，有变化时更新快照并重建查询链，返回schema是否有变化"""
+        if not isinstance(self.graph, Neo4jGraph):
+            return False
+        with self._schema_lock:
+            try:
+                self.graph.refresh_schema()
+                digest = schema_hash(self.graph.structured_schema)
+                if digest == self.schema_hash:
+                    return False
+                self.schema_hash = save_schema_snapshot(GRAPH_SCHEMA_CONFIG["snapshot_file"], self.database,
+                                                        self.graph.structured_schema)
+                self._create_cypher_chain()
+                print(f"🔄 图数据库schema已更新: {self.database}")
+            except Exception as e:
+                print(f"⚠️ 图数据库schema刷新失败，继续使用现有schema: {e}")
+                return False
+            self._on_schema_changed()
+            return True
+    
+    def add_schema_listener(self, callback: Callable[[], None]):
+        """注册schema变化时的回调（如清除依赖本数据库查询结果的响应缓存）"""
+        self._schema_listeners.append(callback)
+    
+    def _on_schema_changed(self):
+        """schema变化后清空按旧schema学到的Cypher模板，并通知依赖本数据库的缓存失效"""
+        if self.cypher_cache is not None:
+            self.cypher_cache.clear()
+        for callback in self._schema_listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ 图数据库schema变化后的缓存清理失败: {e}")
     
     def _create_cypher_chain(self):
         """创建Cypher查询链"""
@@ -61,7 +147,7 @@ class GraphDBManager:
             input_variables=["schema", "question"]
         )
 
-        self.chain = GraphCypherQAChain.from_llm(
+        chain = GraphCypherQAChain.from_llm(
             graph=self.graph,
             llm=self.llm,
             cypher_prompt=cypher_prompt,
@@ -70,18 +156,141 @@ class GraphDBManager:
             validate_cypher=True,
             fix_cypher=True,
             max_fix_attempts=2,
+            return_intermediate_steps=True,  # 取得生成的Cypher用于模板缓存
         )
+        # 分别追踪Cypher生成和结果问答两个LLM阶段
+        chain.cypher_generation_chain = traced_runnable("graph.cypher_generation", chain.cypher_generation_chain)
+        chain.qa_chain = traced_runnable("graph.qa", chain.qa_chain)
+        # 构建完成后再替换（schema刷新时重建，进行中的查询继续使用原查询链）
+        self.chain = chain
     
     def query(self, question: str) -> str:
-        """查询图数据库"""
+        """查询图数据库，失败时返回说明文字"""
+        try:
+            return self.fetch(question)
+        except GraphQueryError as e:
+            return str(e)
+    
+    @traced("graph.query")
+    def fetch(self, question: str) -> str:
+        """查询图数据库，不可用或查询失败时抛出GraphQueryError"""
         if self.chain is None:
-            return "图数据库暂时不可用，将使用通用模型进行回答。"
+            raise GraphQueryError("图数据库暂时不可用，将使用通用模型进行回答。")
         
         try:
+            for source, cypher, params in self._direct_cyphers(question):
+                context = self.graph.query(cypher, params)[:self.chain.top_k]
+                if self._direct_answered(source, context):
+                    return self.chain.qa_chain.invoke({"question": question, "context": context})
+            
             response = self.chain.invoke({"query": question})
+            # intermediate_steps为[{"query": 生成的Cypher}, {"context": 查询结果}]
+            steps = {key: value for step in response.get("intermediate_steps", []) for key, value in step.items()}
+            self._learn_template(question, steps.get("query"), steps.get("context"))
             return response.get("result", "未找到相关信息")
         except Exception as e:
-            return f"图数据库查询出错: {str(e)}"
+            raise GraphQueryError(f"图数据库查询出错: {str(e)}") from e
+    
+    async def aquery(self, question: str) -> str:
+        """异步查询图数据库，失败时返回说明文字"""
+        try:
+            return await self.afetch(question)
+        except GraphQueryError as e:
+            return str(e)
+    
+    @traced("graph.query")
+    async def afetch(self, question: str) -> str:
+        """异步查询图数据库，不可用或查询失败时抛出GraphQueryError
+        
+        依次异步执行Cypher生成、Cypher查询（异步Neo4j驱动）和结果问答，
+        不经过同步链的Cypher自动修复流程。
+        """
+        if self.chain is None:
+            raise GraphQueryError("图数据库暂时不可用，将使用通用模型进行回答。")
+        
+        try:
+            for source, cypher, params in self._direct_cyphers(question):
+                context = (await self._aexecute_cypher(cypher, params))[:self.chain.top_k]
+                if self._direct_answered(source, context):
+                    return await self.chain.qa_chain.ainvoke({"question": question, "context": context})
+            
+            generated_cypher = await self.chain.cypher_generation_chain.ainvoke({
+                "question": question,
+                "schema": self.chain.graph_schema
+            })
+            generated_cypher = extract_cypher(generated_cypher)
+            if self.chain.cypher_query_corrector:
+                generated_cypher = self.chain.cypher_query_corrector(generated_cypher)
+            
+            context = await self._aexecute_cypher(generated_cypher) if generated_cypher else []
+            self._learn_template(question, generated_cypher, context)
+            return await self.chain.qa_chain.ainvoke({
+                "question": question,
+                "context": context[:self.chain.top_k]
+            })
+        except Exception as e:
+            raise GraphQueryError(f"图数据库查询出错: {str(e)}") from e
+    
+    def _direct_cyphers(self, question: str) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """依次给出无需LLM生成的Cypher：(来源, Cypher, 参数)
+        
+        先按识别出的实体和关系使用预置Cypher，再按问题句式使用缓存的模板。
+        按需生成，前一个查到结果后不再查找后面的。
+        """
+        if self.fast_path is not None:
+            plan = self.fast_path.plan(question)
+            if plan is None:
+                tracer.record_cache("graph_fast_path", False)
+            else:
+                yield ("graph_fast_path", *plan)
+        if self.cypher_cache is not None:
+            template = self.cypher_cache.lookup(question)
+            if template is None:
+                tracer.record_cache("cypher_template", False)
+            else:
+                yield ("cypher_template", *template)
+    
+    def _direct_answered(self, source: str, context: List[Dict[str, Any]]) -> bool:
+        """直接执行的Cypher是否有结果：实体识别或句式匹配不准（如问题多了前缀）时查不到结果，
+        继续尝试下一种方式，最后由LLM生成Cypher"""
+        tracer.record_cache(source, bool(context))
+        return bool(context)
+    
+    def _learn_template(self, question: str, cypher: Optional[str], context: Optional[List[Dict[str, Any]]]):
+        """生成的Cypher查到结果时缓存其模板"""
+        if self.cypher_cache is not None and cypher and context:
+            self.cypher_cache.learn(question, cypher)
+    
+    @traced("graph.cypher_execute")
+    async def _aexecute_cypher(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """使用异步Neo4j驱动执行只读Cypher查询（其他图存储在线程中执行同步查询）"""
+        if not isinstance(self.graph, Neo4jGraph):
+            return await asyncio.to_thread(self.graph.query, cypher, params or {})
+        records, _, _ = await self._async_driver().execute_query(
+            cypher,
+            parameters_=params or {},
+            database_=self.database,
+            routing_=RoutingControl.READ
+        )
+        return [record.data() for record in records]
+    
+    def _async_driver(self):
+        """当前事件循环的异步Neo4j驱动
+        
+        驱动的连接绑定在创建它的事件循环上，每个事件循环（如每次批量查询的asyncio.run）使用各自的驱动；
+        已关闭的事件循环的驱动在创建新驱动时丢弃。
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_driver_lock:
+            driver = self._async_drivers.get(loop)
+            if driver is None:
+                for closed in [other for other in self._async_drivers if other.is_closed()]:
+                    del self._async_drivers[closed]
+                driver = self._async_drivers[loop] = AsyncGraphDatabase.driver(
+                    os.environ["NEO4J_URI"],
+                    auth=(os.environ["NEO4J_USERNAME"], os.environ["NEO4J_PASSWORD"])
+                )
+            return driver
     
     def is_available(self) -> bool:
         """检查图数据库是否可用"""
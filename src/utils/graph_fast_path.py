@@ -0,0 +1,121 @@
+"""
+图谱查询快速路径 - 识别问题中的术语实体和所问关系，直接执行预置的参数化Cypher
+"""
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from src.config.settings import GRAPH_FAST_PATH_CONFIG
+from src.utils.aho_corasick import AhoCorasickAutomaton
+from src.utils.medical_terms import load_medical_terms
+
+
+@dataclass
+class GraphEntity:
+    """问题中识别出的实体"""
+    start: int
+    end: int
+    term: str                  # 问题中的术语（或别名）
+    labels: Tuple[str, ...]    # 可能的节点标签（同一术语可能同时是证型和症状等）
+
+
+class GraphFastPath:
+    """图谱查询快速路径
+
+    将术语表中的方剂、证型、症状、病症及病症别名编译进Aho-Corasick自动机，与关系触发词一起
+    单次扫描问题。问题中恰好能确定一个（实体, 所问关系）组合且有对应的预置Cypher时，
+    返回该Cypher和节点id参数，不再需要LLM生成Cypher；无法确定时返回None，交给LLM生成。
+    """
+
+    # (实体标签, 所问关系) -> 预置Cypher，$ids为实体对应的节点id列表
+    TEMPLATES = {
+        "皮肤病": {
+            "证型": "MATCH (d:皮肤病)-[:辨证为]->(s:证型) WHERE d.id IN $ids RETURN d.id AS 皮肤病, s.id AS 证型",
+            "症状": ("MATCH (d:皮肤病)-[:辨证为]->(s:证型)-[:主症包括]->(z:症状) WHERE d.id IN $ids "
+                   "RETURN d.id AS 皮肤病, s.id AS 证型, collect(z.id) AS 症状"),
+            "方剂": ("MATCH (d:皮肤病)-[:辨证为]->(s:证型)-[:治法为]->(f:方剂) WHERE d.id IN $ids "
+                   "RETURN d.id AS 皮肤病, s.id AS 证型, f.id AS 方剂")
+        },
+        "证型": {
+            "症状": "MATCH (s:证型)-[:主症包括]->(z:症状) WHERE s.id IN $ids RETURN s.id AS 证型, z.id AS 症状",
+            "方剂": "MATCH (s:证型)-[:治法为]->(f:方剂) WHERE s.id IN $ids RETURN s.id AS 证型, f.id AS 方剂",
+            "皮肤病": "MATCH (d:皮肤病)-[:辨证为]->(s:证型) WHERE s.id IN $ids RETURN s.id AS 证型, d.id AS 皮肤病"
+        },
+        "方剂": {
+            "证型": "MATCH (s:证型)-[:治法为]->(f:方剂) WHERE f.id IN $ids RETURN f.id AS 方剂, s.id AS 证型",
+            "皮肤病": "MATCH (f:方剂)-[:用于治疗]->(d:皮肤病) WHERE f.id IN $ids RETURN f.id AS 方剂, d.id AS 皮肤病"
+        },
+        "症状": {
+            "证型": "MATCH (s:证型)-[:主症包括]->(z:症状) WHERE z.id IN $ids RETURN z.id AS 症状, s.id AS 证型",
+            "皮肤病": ("MATCH (d:皮肤病)-[:辨证为]->(s:证型)-[:主症包括]->(z:症状) WHERE z.id IN $ids "
+                    "RETURN DISTINCT z.id AS 症状, d.id AS 皮肤病, s.id AS 证型")
+        }
+    }
+
+    ENTITY_PREFIX = "entity:"
+    RELATION_PREFIX = "relation:"
+
+    def __init__(self, term_file: Optional[str] = None, config: Optional[Dict[str, Any]] = None):
+        config = config or GRAPH_FAST_PATH_CONFIG
+        term_file = term_file or config["term_file"]
+        self.automaton = AhoCorasickAutomaton()
+        self.node_ids: Dict[Tuple[str, str], List[str]] = {}  # (标签, 术语) -> 节点id
+        self.label_priority: List[str] = config["label_priority"]
+
+        if os.path.exists(term_file):
+            terms = load_medical_terms(os.path.abspath(term_file))
+            for section, label in config["section_labels"].items():
+                for term, node_ids in terms.node_ids.get(section, {}).items():
+                    self._add_entity(term, label, node_ids)
+                if section == "病症":
+                    for alias, name in terms.aliases.items():
+                        self._add_entity(alias, label, terms.node_ids[section][name])
+        else:
+            print(f"⚠️ 未找到医学术语表，图谱查询快速路径不可用: {term_file}")
+
+        for relation, keywords in config["relation_keywords"].items():
+            self.automaton.add_all(keywords, self.RELATION_PREFIX + relation)
+        self.automaton.build()
+
+    def _add_entity(self, term: str, label: str, node_ids: List[str]):
+        """添加实体术语，同一术语指向的节点id合并"""
+        self.automaton.add(term, self.ENTITY_PREFIX + label)
+        self.node_ids.setdefault((label, term), [])
+        self.node_ids[(label, term)] = list(dict.fromkeys(self.node_ids[(label, term)] + node_ids))
+
+    def recognize(self, question: str) -> Tuple[List[GraphEntity], List[str]]:
+        """识别问题中的实体和所问关系
+
+        实体取最长且互不重叠的匹配；落在实体内部的关系触发词不计入（如方剂名中的字）。
+        """
+        entities, relations = [], []
+        for start, end, term, labels in self.automaton.iter_matches(question):
+            entity_labels = tuple(label[len(self.ENTITY_PREFIX):] for label in labels
+                                  if label.startswith(self.ENTITY_PREFIX))
+            if entity_labels:
+                entities.append(GraphEntity(start, end, term, entity_labels))
+            relations.extend((start, end, label[len(self.RELATION_PREFIX):]) for label in labels
+                             if label.startswith(self.RELATION_PREFIX))
+
+        chosen: List[GraphEntity] = []
+        for entity in sorted(entities, key=lambda e: (e.start - e.end, e.start)):
+            if all(entity.end <= other.start or entity.start >= other.end for other in chosen):
+                chosen.append(entity)
+        chosen.sort(key=lambda e: e.start)
+
+        asked = [relation for start, end, relation in relations
+                 if all(end <= entity.start or start >= entity.end for entity in chosen)]
+        return chosen, list(dict.fromkeys(asked))
+
+    def plan(self, question: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """为问题选择预置Cypher，返回(Cypher, 参数)；实体或关系无法唯一确定时返回None"""
+        entities, relations = self.recognize(question)
+        candidates = {
+            (label, entity.term, relation)
+            for entity in entities for label in entity.labels for relation in relations
+            if relation in self.TEMPLATES.get(label, {})
+        }
+        if len({(term, relation) for _, term, relation in candidates}) != 1:
+            return None
+        # 同一术语有多种标签（如"湿疹"既是病症也是证型）时按优先级取一种
+        label, term, relation = min(candidates, key=lambda candidate: self.label_priority.index(candidate[0]))
+        return self.TEMPLATES[label][relation], {"ids": self.node_ids[(label, term)]}
@@ -0,0 +1,50 @@
+"""
+图数据库schema快照 - 将schema持久化到磁盘，启动时直接加载，跳过schema查询
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+def schema_hash(structured_schema: Dict[str, Any]) -> str:
+    """schema内容的哈希（键排序后序列化，与字段顺序无关）"""
+    payload = json.dumps(structured_schema, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_schema_snapshot(path: str, database: str) -> Optional[Dict[str, Any]]:
+    """读取schema快照，返回结构化schema
+
+    快照不存在、属于其他数据库或内容与记录的哈希不符（文件损坏或被手工修改）时返回None。
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    structured_schema = snapshot.get("structured_schema")
+    if snapshot.get("database") != database or not isinstance(structured_schema, dict):
+        return None
+    if snapshot.get("hash") != schema_hash(structured_schema):
+        return None
+    return structured_schema
+
+
+def save_schema_snapshot(path: str, database: str, structured_schema: Dict[str, Any]) -> str:
+    """保存schema快照（先写临时文件再替换，避免读到写了一半的文件），返回schema哈希"""
+    digest = schema_hash(structured_schema)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "database": database,
+            "hash": digest,
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "structured_schema": structured_schema
+        }, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temp_path, path)
+    return digest
@@ -0,0 +1,200 @@
+"""
+增量JSON解析工具类
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# 字符串中合法的转义字符
+_VALID_ESCAPES = set('"\\/bfnrtu')
+# 字符串中需要转义的控制字符
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class StreamingJsonParser:
+    """容错的增量JSON解析器
+
+    逐块读入LLM流式输出的JSON文本，顶层对象的每个字段一结束就返回，无需等待完整输出。
+    解析时修复常见缺陷：代码块标记和JSON前后的多余文本、字符串中未转义的引号和换行、
+    非法转义、多余的逗号、字段间缺少逗号，以及输出被截断时未闭合的字符串和括号。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False      # 是否已遇到顶层对象的左括号
+        self._done = False         # 顶层对象是否已结束
+        self._stack: List[str] = []
+        self._in_string = False
+        self._expect = "key"       # 顶层对象中期待的内容：key / colon / value
+        self._key: Optional[str] = None
+        self._token: List[str] = []
+        self._value_closed = False  # 当前顶层值是否已是完整的字符串或容器
+        self.fields: Dict[str, Any] = {}
+        self.closed = False        # 是否已调用close
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """读入一块文本，返回本次新完成的顶层字段列表[(字段名, 值)]"""
+        self._buffer += chunk
+        return self._advance(final=False)
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """输入结束，补全未闭合的内容，返回剩余完成的字段"""
+        completed = self._advance(final=True)
+        if self._started and not self._done and self._expect == "value" and self._token:
+            if self._in_string:
+                self._token.append('"')
+                self._in_string = False
+            while len(self._stack) > 1:
+                self._close_container(self._stack.pop())
+            completed.append(self._finish_value())
+        self._done = True
+        self.closed = True
+        return completed
+
+    def result(self) -> Dict[str, Any]:
+        """解析结果；未解析出任何字段时返回{"raw_output": 原始文本}"""
+        if self.fields:
+            return dict(self.fields)
+        return {"raw_output": self._buffer.strip()}
+
+    def _lookahead(self, index: int) -> Tuple[Optional[str], bool]:
+        """返回index之后第一个非空白字符及其前面是否有换行，文本不足时返回(None, ...)"""
+        text = self._buffer
+        newline = False
+        while index < len(text) and text[index].isspace():
+            newline = newline or text[index] == "\n"
+            index += 1
+        return (text[index] if index < len(text) else None), newline
+
+    def _close_container(self, opener: str):
+        """为当前值补上容器结束符，并去掉其前面多余的逗号"""
+        self._strip_trailing_comma()
+        self._token.append("}" if opener == "{" else "]")
+
+    def _strip_trailing_comma(self):
+        """去掉当前值末尾的空白和多余逗号"""
+        while self._token and self._token[-1].isspace():
+            self._token.pop()
+        if self._token and self._token[-1] == ",":
+            self._token.pop()
+
+    @staticmethod
+    def _loads_key(raw: str) -> str:
+        """解析字段名，无法解析时去掉引号使用原文"""
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return raw.strip('"')
+
+    def _finish_value(self) -> Tuple[str, Any]:
+        """结束当前顶层值，记录并返回该字段"""
+        raw = "".join(self._token).strip()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.strip('"')
+        key = self._key if self._key is not None else ""
+        self.fields[key] = value
+        self._key = None
+        self._token = []
+        self._value_closed = False
+        self._expect = "key"
+        return key, value
+
+    def _advance(self, final: bool) -> List[Tuple[str, Any]]:
+        """从上次停止的位置继续扫描，需要向后看而文本不足时停下等待下一块"""
+        completed = []
+        text = self._buffer
+        i = self._pos
+        while i < len(text) and not self._done:
+            char = text[i]
+
+            if not self._started:
+                # 跳过代码块标记等前导文本
+                if char == "{":
+                    self._started = True
+                    self._stack.append("{")
+                i += 1
+                continue
+
+            if self._in_string:
+                if char == "\\":
+                    if i + 1 >= len(text) and not final:
+                        break
+                    escaped = text[i + 1] if i + 1 < len(text) else "\\"
+                    if escaped in _VALID_ESCAPES:
+                        self._token.append(char + escaped)
+                        i += 2
+                    else:
+                        self._token.append("\\\\")
+                        i += 1
+                    continue
+                if char == '"':
+                    next_char, newline = self._lookahead(i + 1)
+                    if next_char is None and not final:
+                        break
+                    if next_char is None or next_char in ",:}]" or newline:
+                        self._token.append(char)
+                        self._in_string = False
+                        if len(self._stack) == 1:
+                            if self._expect == "key":
+                                self._key = self._loads_key("".join(self._token))
+                                self._token = []
+                                self._expect = "colon"
+                            else:
+                                self._value_closed = True
+                    else:
+                        # 字符串内部未转义的引号
+                        self._token.append('\\"')
+                    i += 1
+                    continue
+                self._token.append(_CONTROL_ESCAPES.get(char, char if char >= " " else ""))
+                i += 1
+                continue
+
+            if len(self._stack) == 1:
+                if self._expect == "key":
+                    if char == '"':
+                        self._in_string = True
+                        self._token = ['"']
+                    elif char == "}":
+                        self._done = True
+                    i += 1
+                    continue
+                if self._expect == "colon":
+                    if char == ":":
+                        self._expect = "value"
+                        self._token = []
+                    i += 1
+                    continue
+                # 顶层值
+                if char in ",}":
+                    if self._token:
+                        completed.append(self._finish_value())
+                    self._expect = "key"
+                    self._done = char == "}"
+                    i += 1
+                    continue
+                if char == '"' and self._value_closed:
+                    # 字段之间缺少逗号
+                    completed.append(self._finish_value())
+                    continue
+                if not self._token and char.isspace():
+                    i += 1
+                    continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in "}]" and len(self._stack) > 1:
+                self._close_container(self._stack.pop())
+                if len(self._stack) == 1:
+                    self._value_closed = True
+                i += 1
+                continue
+            self._token.append(char)
+            i += 1
+
+        self._pos = i
+        return completed
@@ -0,0 +1,149 @@
+"""
+LLM客户端注册表 - 进程内共享ChatOpenAI实例和HTTP连接池
+"""
+import asyncio
+import threading
+from typing import Optional, Dict, Tuple, Callable
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+from src.config.settings import API_CONFIG, LLM_POOL_CONFIG
+from src.utils.tracing import TokenUsageCallback
+from src.utils.resilience import ResilientChatModel
+
+
+class _LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """按事件循环分别维护连接池的异步传输层
+
+    异步连接池中的连接绑定在创建它的事件循环上，在另一个事件循环（如每次asyncio.run）中复用会出错。
+    此传输层为每个正在运行的事件循环创建独立的连接池，事件循环关闭后其连接池随之丢弃。
+    （连接引用着事件循环，不能用WeakKeyDictionary按事件循环回收。）
+    """
+
+    def __init__(self, **transport_kwargs):
+        self._transport_kwargs = transport_kwargs
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        self._lock = threading.Lock()
+
+    def _current_transport(self) -> httpx.AsyncHTTPTransport:
+        """当前事件循环的连接池，同时丢弃已关闭的事件循环的连接池"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current_transport().handle_async_request(request)
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class LLMRegistry:
+    """LLM客户端注册表
+
+    按(model, temperature)缓存ChatOpenAI实例，所有实例共用同一组保持长连接的
+    HTTP客户端，避免每个组件各自建立连接池和TLS握手。流式调用同样返回Token用量，由回调计入追踪记录。
+    返回的模型均经ResilientChatModel包装，统一提供重试、对冲和按端点的熔断。
+    共享的异步HTTP客户端按事件循环分别维护连接池，可在多个事件循环（如多次asyncio.run）中使用。
+    """
+
+    _models: Dict[Tuple[str, float], BaseChatModel] = {}
+    _http_client: Optional[httpx.Client] = None
+    _http_async_client: Optional[httpx.AsyncClient] = None
+    _model_factory: Optional[Callable[[str, float], BaseChatModel]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _pool_limits() -> httpx.Limits:
+        """HTTP连接池参数"""
+        return httpx.Limits(
+            max_connections=LLM_POOL_CONFIG["max_connections"],
+            max_keepalive_connections=LLM_POOL_CONFIG["max_keepalive_connections"],
+            keepalive_expiry=LLM_POOL_CONFIG["keepalive_expiry"]
+        )
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        """HTTP请求超时"""
+        return httpx.Timeout(LLM_POOL_CONFIG["read_timeout"], connect=LLM_POOL_CONFIG["connect_timeout"])
+
+    @classmethod
+    def get_http_clients(cls) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """获取共享的同步/异步HTTP客户端（异步客户端按事件循环分别维护连接池）"""
+        with cls._lock:
+            if cls._http_client is None:
+                cls._http_client = httpx.Client(limits=cls._pool_limits(), timeout=cls._timeout())
+                cls._http_async_client = httpx.AsyncClient(
+                    transport=_LoopLocalAsyncTransport(limits=cls._pool_limits()),
+                    timeout=cls._timeout()
+                )
+            return cls._http_client, cls._http_async_client
+
+    @classmethod
+    def set_model_factory(cls, factory: Optional[Callable[[str, float], BaseChatModel]]):
+        """设置模型工厂(model, temperature) -> 聊天模型，用于替代ChatOpenAI（如基准测试中的本地模型），传None恢复默认"""
+        with cls._lock:
+            cls._model_factory = factory
+            cls._models.clear()
+
+    @classmethod
+    def get_chat_model(cls, temperature: float, model: Optional[str] = None) -> BaseChatModel:
+        """获取共享的聊天模型实例"""
+        model = model or API_CONFIG["model_name"]
+        key = (model, temperature)
+        with cls._lock:
+            chat_model = cls._models.get(key)
+            if chat_model is None and cls._model_factory is not None:
+                chat_model = cls._models[key] = ResilientChatModel(
+                    inner=cls._model_factory(model, temperature),
+                    endpoint_name=f"factory:{model}",
+                    callbacks=[TokenUsageCallback()]
+                )
+        if chat_model is not None:
+            return chat_model
+
+        http_client, http_async_client = cls.get_http_clients()
+        with cls._lock:
+            if key not in cls._models:
+                # 重试由ResilientChatModel统一处理，关闭OpenAI客户端自身的重试
+                cls._models[key] = ResilientChatModel(
+                    inner=ChatOpenAI(
+                        model=model,
+                        temperature=temperature,
+                        base_url=API_CONFIG["base_url"],
+                        api_key=API_CONFIG["api_key"],
+                        timeout=LLM_POOL_CONFIG["read_timeout"],
+                        max_retries=0,
+                        http_client=http_client,
+                        http_async_client=http_async_client,
+                        stream_usage=True
+                    ),
+                    endpoint_name=f"{API_CONFIG['base_url']}#{model}",
+                    callbacks=[TokenUsageCallback()]
+                )
+            return cls._models[key]
+
+    @classmethod
+    def clear(cls):
+        """清空注册表并关闭同步HTTP客户端"""
+        with cls._lock:
+            cls._models.clear()
+            if cls._http_client is not None:
+                cls._http_client.close()
+            cls._http_client = None
+            cls._http_async_client = None
+
+
+def get_chat_model(temperature: float, model: Optional[str] = None) -> BaseChatModel:
+    """获取共享LLM客户端的便捷方法"""
+    return LLMRegistry.get_chat_model(temperature, model)
@@ -0,0 +1,130 @@
+"""
+医学术语表 - 解析basic_app/term.txt（由basic_app/term_extract.py从知识图谱导出）
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, List
+from src.utils.aho_corasick import AhoCorasickAutomaton
+
+# 术语表中的分节标题，如"方剂: ----"
+_SECTION = re.compile(r"^(\S+?):\s*-*\s*$")
+# 条目中并列的多个术语，如"龙胆泻肝汤、知柏地黄丸合方"
+_ITEM_SEPARATOR = re.compile(r"[、，,；;]")
+# 方剂名称后的加减说明
+_FORMULA_SUFFIX = re.compile(r"(加减|加味|合方)$")
+# 表示缺失的取值
+_EMPTY_VALUES = {"无", "本病", "None", "名称"}
+
+
+@dataclass
+class MedicalTerms:
+    """术语表内容"""
+    sections: Dict[str, List[str]] = field(default_factory=dict)  # 分节名（方剂/证型/症状/病症） -> 术语
+    aliases: Dict[str, str] = field(default_factory=dict)         # 病症的别名、对照名 -> 图谱中的病症名称
+    node_ids: Dict[str, Dict[str, List[str]]] = field(default_factory=dict)  # 分节名 -> 术语 -> 图谱中的节点id
+
+    def all_terms(self) -> List[str]:
+        """所有术语（包括病症别名），去重并保持顺序"""
+        terms = [term for section in self.sections.values() for term in section]
+        return list(dict.fromkeys(terms + list(self.aliases)))
+
+
+def _clean(term: str, max_length: int = 12) -> str:
+    """规范化单个术语，不像术语的内容（剂量、说明文字、"证型1"等占位节点）返回空字符串"""
+    term = re.sub(r"\s+", "", term).strip("（）()【】")
+    if (not 2 <= len(term) <= max_length or re.search(r"\d|[。：:]", term)
+            or not re.search(r"[\u4e00-\u9fff]", term) or term in _EMPTY_VALUES):
+        return ""
+    return term
+
+
+def _split_items(line: str, section: str) -> List[str]:
+    """拆分一行中并列的术语"""
+    terms = []
+    for item in _ITEM_SEPARATOR.split(line):
+        item = _clean(item)
+        if section == "方剂":
+            item = _FORMULA_SUFFIX.sub("", item)
+        if item:
+            terms.append(item)
+    return terms
+
+
+@lru_cache(maxsize=8)
+def load_medical_terms(path: str) -> MedicalTerms:
+    """读取并解析术语表，同一文件只解析一次
+
+    术语表按"分节名: ----"分节；病症一节为制表符分隔的"名称 别名 对照"表，
+    别名和对照名中的每一项都映射到图谱中的病症名称。
+    """
+    terms = MedicalTerms()
+    section = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            heading = _SECTION.match(line.strip())
+            if heading:
+                section = heading.group(1)
+                terms.sections.setdefault(section, [])
+                continue
+            if section is None or not line.strip():
+                continue
+
+            if "\t" not in line:
+                # 每行是一个图谱节点的id，拆出的术语都指向该节点
+                for term in _split_items(line, section):
+                    terms.sections[section].append(term)
+                    terms.node_ids.setdefault(section, {}).setdefault(term, []).append(line.strip())
+                continue
+
+            # 病症表：名称\t别名\t对照
+            node_id, *others = line.split("\t")
+            name = re.sub(r"\s+", "", node_id)
+            if not re.search(r"[\u4e00-\u9fff]", name) or name in _EMPTY_VALUES:
+                continue
+            terms.sections[section].append(name)
+            terms.node_ids.setdefault(section, {}).setdefault(name, []).append(node_id.strip())
+            for other in others:
+                for alias in _split_items(other, section):
+                    if alias != name:
+                        terms.aliases.setdefault(alias, name)
+
+    for section, items in terms.sections.items():
+        terms.sections[section] = list(dict.fromkeys(items))
+    for ids in terms.node_ids.values():
+        for term, node_ids in ids.items():
+            ids[term] = list(dict.fromkeys(node_ids))
+    # 别名与某个病症名称相同时以名称为准
+    names = set(terms.sections.get("病症", []))
+    terms.aliases = {alias: name for alias, name in terms.aliases.items() if alias not in names}
+    return terms
+
+
+class MedicalEntityMatcher:
+    """医学实体匹配器 - 单次扫描提取文本中出现的术语，病症别名归一为图谱中的病症名称"""
+
+    def __init__(self, terms: MedicalTerms):
+        self.automaton = AhoCorasickAutomaton()
+        for items in terms.sections.values():
+            for term in items:
+                self.automaton.add(term, term)
+        for alias, name in terms.aliases.items():
+            self.automaton.add(alias, name)
+        self.automaton.build()
+
+    def extract(self, text: str) -> FrozenSet[str]:
+        """提取文本中的实体，取最长且互不重叠的匹配（"婴儿湿疹"不再计入其中的"湿疹"）"""
+        matches = sorted(self.automaton.iter_matches(text), key=lambda match: (match[0] - match[1], match[0]))
+        chosen, entities = [], set()
+        for start, end, _, labels in matches:
+            if all(end <= other_start or start >= other_end for other_start, other_end in chosen):
+                chosen.append((start, end))
+                entities.update(labels)
+        return frozenset(entities)
+
+
+@lru_cache(maxsize=8)
+def load_entity_matcher(path: str) -> MedicalEntityMatcher:
+    """由术语表构建实体匹配器，同一文件只构建一次"""
+    return MedicalEntityMatcher(load_medical_terms(path))
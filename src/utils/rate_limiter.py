@@ -0,0 +1,30 @@
+"""
+速率限制工具类
+"""
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """异步令牌桶限速器，限制每秒发起的请求数"""
+
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        if self.interval == 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) / self.interval)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.interval)
@@ -0,0 +1,409 @@
+"""
+LLM调用容错工具类 - 重试退避、对冲请求和按模型端点的熔断
+"""
+import asyncio
+import contextvars
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+import httpx
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from src.config.settings import RESILIENCE_CONFIG
+from src.utils.tracing import tracer
+
+# 可重试的HTTP状态码（另外所有5xx均可重试）
+_RETRYABLE_STATUS = {408, 409, 429}
+# 流式输出为空时的占位
+_EMPTY = object()
+
+
+class CircuitOpenError(Exception):
+    """模型端点处于熔断状态，请求被直接拒绝"""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"模型服务暂时不可用（熔断中）: {endpoint}")
+        self.endpoint = endpoint
+
+
+def is_retryable(error: BaseException) -> bool:
+    """是否为可重试的临时错误：连接失败、超时、限流和服务端错误"""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status in _RETRYABLE_STATUS or status >= 500)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """读取限流响应中的Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMEndpoint:
+    """单个模型端点的运行状态：熔断器、近期耗时样本和重试/对冲计数
+
+    熔断器连续失败failure_threshold次后打开，打开期间直接拒绝请求；经过reset_timeout后
+    进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = None
+        self._latencies = defaultdict(lambda: deque(maxlen=RESILIENCE_CONFIG["latency_window"]))
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查熔断状态，熔断中抛出CircuitOpenError"""
+        now = time.monotonic()
+        with self._lock:
+            self.counters["calls"] += 1
+            if self.state == self.OPEN and now - self._opened_at >= RESILIENCE_CONFIG["reset_timeout"]:
+                self.state = self.HALF_OPEN
+                self._probe_started_at = None
+            if self.state == self.HALF_OPEN:
+                # 探测请求长时间未返回时允许发起新的探测
+                if self._probe_started_at is None or now - self._probe_started_at >= RESILIENCE_CONFIG["reset_timeout"]:
+                    self._probe_started_at = now
+                    return
+            if self.state != self.CLOSED:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name)
+
+    def record_success(self, kind: Optional[str] = None, latency: Optional[float] = None):
+        """记录成功（包括服务正常响应的非重试类错误），关闭熔断器"""
+        with self._lock:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            if kind is not None:
+                self._latencies[kind].append(latency)
+
+    def record_failure(self):
+        """记录一次临时错误，连续失败达到阈值或半开探测失败时打开熔断器"""
+        with self._lock:
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED
+                    and self.consecutive_failures >= RESILIENCE_CONFIG["failure_threshold"]):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.counters["circuit_opened"] += 1
+
+    def count(self, name: str):
+        """累加计数（重试、对冲等）"""
+        with self._lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        """发起对冲请求前的等待时间：近期耗时的分位数，且不低于hedge_min_delay
+
+        未启用对冲、样本不足或对冲次数已达上限时返回None（不对冲）。
+        """
+        if not RESILIENCE_CONFIG["hedging_enabled"]:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[kind])
+            if len(samples) < RESILIENCE_CONFIG["hedge_min_samples"]:
+                return None
+            if self.counters["hedges"] >= self.counters["calls"] * RESILIENCE_CONFIG["max_hedge_ratio"]:
+                return None
+        index = min(len(samples) - 1, int(len(samples) * RESILIENCE_CONFIG["hedge_percentile"] / 100))
+        return max(RESILIENCE_CONFIG["hedge_min_delay"], samples[index])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """端点状态和计数"""
+        with self._lock:
+            return {"state": self.state, **{key: self.counters[key] for key in
+                                            ("calls", "retries", "hedges", "hedge_wins",
+                                             "failures", "rejected", "circuit_opened")}}
+
+
+_endpoints: Dict[str, LLMEndpoint] = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name: str) -> LLMEndpoint:
+    """获取（或创建）指定名称的模型端点状态"""
+    with _endpoints_lock:
+        endpoint = _endpoints.get(name)
+        if endpoint is None:
+            endpoint = _endpoints[name] = LLMEndpoint(name)
+        return endpoint
+
+
+def resilience_metrics() -> Dict[str, Dict[str, Any]]:
+    """各模型端点的熔断状态和重试/对冲计数"""
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return {endpoint.name: endpoint.snapshot() for endpoint in endpoints}
+
+
+def format_resilience_metrics() -> str:
+    """格式化各模型端点的容错统计，供命令行输出"""
+    metrics = resilience_metrics()
+    if not metrics:
+        return "暂无LLM调用"
+    return "\n".join(
+        f"LLM端点 {name}: 状态 {stats['state']}, 调用 {stats['calls']}, 重试 {stats['retries']}, "
+        f"对冲 {stats['hedges']} (胜出 {stats['hedge_wins']}), 失败 {stats['failures']}, "
+        f"熔断拒绝 {stats['rejected']}, 熔断次数 {stats['circuit_opened']}"
+        for name, stats in sorted(metrics.items())
+    )
+
+
+def _count(endpoint: LLMEndpoint, name: str):
+    """累加端点计数，并标注在当前追踪阶段上"""
+    endpoint.count(name)
+    span = tracer.current_span()
+    if span is not None:
+        span.incr(f"llm.{name}")
+
+
+class ResilientChatModel(BaseChatModel):
+    """为聊天模型增加重试、对冲和熔断的包装
+
+    - 可重试的临时错误（连接失败、超时、429、5xx）按指数退避加随机抖动重试，遵守Retry-After；
+    - 请求耗时超过该端点近期耗时的分位数时发起一次对冲请求，采用先成功的结果；
+    - 同一模型端点连续失败后熔断，熔断期间直接抛出CircuitOpenError。
+    流式调用在收到首个片段前出错时重试，对冲按首个片段的等待时间判断；已输出内容后出错不再重试。
+    """
+
+    inner: BaseChatModel
+    endpoint_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"endpoint": self.endpoint_name, **self.inner._identifying_params}
+
+    @property
+    def endpoint(self) -> LLMEndpoint:
+        return get_endpoint(self.endpoint_name)
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """记录失败并判断是否重试；服务正常响应的错误（如400）视为端点可用"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if not is_retryable(error):
+            self.endpoint.record_success()
+            return False
+        self.endpoint.record_failure()
+        if attempt >= RESILIENCE_CONFIG["max_retries"]:
+            return False
+        _count(self.endpoint, "retries")
+        return True
+
+    @staticmethod
+    def _backoff(attempt: int, error: Exception) -> float:
+        """第attempt次重试前的等待时间：指数退避加全随机抖动，不短于Retry-After"""
+        ceiling = min(RESILIENCE_CONFIG["backoff_max"], RESILIENCE_CONFIG["backoff_base"] * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RESILIENCE_CONFIG["backoff_max"]))
+        return delay
+
+    # ---- 同步调用 ----
+
+    def _race(self, call: Callable[[], Any], delay: Optional[float],
+              discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """执行call，超过delay秒未完成时在另一线程发起对冲请求，返回先成功的结果
+
+        落后的成功结果交给discard清理（如关闭流）；全部失败时抛出最后一个错误。
+        """
+        if delay is None:
+            return call()
+        outcomes = queue.Queue()
+        winner = []
+        lock = threading.Lock()
+
+        def run(tag: str):
+            try:
+                value = call()
+            except BaseException as e:
+                outcomes.put((tag, False, e))
+                return
+            with lock:
+                won = not winner
+                if won:
+                    winner.append(tag)
+            if won:
+                outcomes.put((tag, True, value))
+            elif discard is not None:
+                discard(value)
+
+        def start(tag: str):
+            threading.Thread(target=contextvars.copy_context().run, args=(run, tag),
+                             name=f"llm-{tag}", daemon=True).start()
+
+        start("primary")
+        launched = 1
+        try:
+            tag, ok, value = outcomes.get(timeout=delay)
+        except queue.Empty:
+            _count(self.endpoint, "hedges")
+            start("hedge")
+            launched = 2
+            tag, ok, value = outcomes.get()
+        received = 1
+        while not ok and received < launched:
+            tag, ok, value = outcomes.get()
+            received += 1
+        if not ok:
+            raise value
+        if tag == "hedge":
+            _count(self.endpoint, "hedge_wins")
+        return value
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        for attempt in itertools.count():
+            self.endpoint.before_call()
+            start = time.perf_counter()
+            try:
+                result = self._race(lambda: self.inner._generate(messages, stop, **kwargs),
+                                    self.endpoint.hedge_delay("generate"))
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.endpoint.record_success("generate", time.perf_counter() - start)
+            return result
+
+    def _open_stream(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]):
+        """开始流式请求并读取首个片段，返回(流, 首个片段)"""
+        stream = self.inner._stream(messages, stop, **kwargs)
+        return stream, next(stream, _EMPTY)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for attempt in itertools.count():
+            self.endpoint.before_call()
+            start = time.perf_counter()
+            try:
+                stream, first = self._race(lambda: self._open_stream(messages, stop, kwargs),
+                                           self.endpoint.hedge_delay("first_chunk"),
+                                           discard=lambda opened: opened[0].close())
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.endpoint.record_success("first_chunk", time.perf_counter() - start)
+            break
+        try:
+            if first is not _EMPTY:
+                yield first
+            yield from stream
+        except Exception as e:
+            if is_retryable(e):
+                self.endpoint.record_failure()
+            raise
+        finally:
+            stream.close()
+
+    # ---- 异步调用 ----
+
+    async def _arace(self, call: Callable[[], Awaitable[Any]], delay: Optional[float],
+                     discard: Optional[Callable[[Any], Awaitable[None]]] = None) -> Any:
+        """_race的异步版本，返回前取消仍在进行的请求"""
+        if delay is None:
+            return await call()
+        tasks = {asyncio.ensure_future(call()): "primary"}
+        pending = set(tasks)
+        error = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                _count(self.endpoint, "hedges")
+                tasks[asyncio.ensure_future(call())] = "hedge"
+                pending = set(tasks)
+            while True:
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    for task in succeeded[1:]:
+                        if discard is not None:
+                            await discard(task.result())
+                    if tasks[succeeded[0]] == "hedge":
+                        _count(self.endpoint, "hedge_wins")
+                    return succeeded[0].result()
+                if done:
+                    error = next(iter(done)).exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        for attempt in itertools.count():
+            self.endpoint.before_call()
+            start = time.perf_counter()
+            try:
+                result = await self._arace(lambda: self.inner._agenerate(messages, stop, **kwargs),
+                                           self.endpoint.hedge_delay("generate"))
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.endpoint.record_success("generate", time.perf_counter() - start)
+            return result
+
+    async def _aopen_stream(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]):
+        """_open_stream的异步版本"""
+        stream = self.inner._astream(messages, stop, **kwargs)
+        return stream, await anext(stream, _EMPTY)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for attempt in itertools.count():
+            self.endpoint.before_call()
+            start = time.perf_counter()
+            try:
+                stream, first = await self._arace(lambda: self._aopen_stream(messages, stop, kwargs),
+                                                  self.endpoint.hedge_delay("first_chunk"),
+                                                  discard=lambda opened: opened[0].aclose())
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.endpoint.record_success("first_chunk", time.perf_counter() - start)
+            break
+        try:
+            if first is not _EMPTY:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            if is_retryable(e):
+                self.endpoint.record_failure()
+            raise
+        finally:
+            await stream.aclose()
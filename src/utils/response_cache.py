@@ -0,0 +1,163 @@
+"""
+响应缓存工具类
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from src.config.settings import CACHE_CONFIG
+
+
+class ResponseCache:
+    """响应缓存 - 内存LRU层 + 可选sqlite磁盘层
+
+    条目按命名空间（如tcm、wm、integration）区分，便于在知识库重建时按来源失效。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 disk_path: Optional[str] = None, max_disk_entries: Optional[int] = None):
+        self.max_entries = max_entries or CACHE_CONFIG["max_entries"]
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else CACHE_CONFIG["ttl_seconds"]
+        self.disk_path = disk_path or CACHE_CONFIG["disk_path"]
+        self.max_disk_entries = max_disk_entries or CACHE_CONFIG["max_disk_entries"]
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (namespace, value, expires_at)
+        self._lock = threading.Lock()
+        self._disk = None
+        if self.disk_path:
+            self._initialize_disk()
+
+    def _initialize_disk(self):
+        """初始化sqlite磁盘缓存"""
+        try:
+            self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, namespace TEXT, value TEXT, "
+                "expires_at REAL, accessed_at REAL)"
+            )
+            self._disk.execute(
+                "CREATE INDEX IF NOT EXISTS idx_response_cache_accessed "
+                "ON response_cache (accessed_at)"
+            )
+            self._disk.commit()
+        except Exception as e:
+            print(f"❌ 磁盘缓存初始化失败: {e}")
+            self._disk = None
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """规范化问题文本：去除空白和句末标点，统一大小写"""
+        normalized = re.sub(r"\s+", "", question).lower()
+        return normalized.rstrip("?？。!！.~～")
+
+    @classmethod
+    def make_key(cls, namespace: str, question: str, mode: str = "", context: str = "") -> str:
+        """根据命名空间、规范化问题、解释模式和上下文哈希生成缓存键"""
+        payload = json.dumps(
+            [namespace, cls.normalize_question(question), mode,
+             hashlib.sha256(context.encode("utf-8")).hexdigest()],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                namespace, value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT namespace, value, expires_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[2] > now:
+                    self._disk.execute(
+                        "UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                    )
+                    self._disk.commit()
+                    self._set_memory(key, row[0], row[1], row[2])
+                    self.hits += 1
+                    return row[1]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str, namespace: str):
+        """写入缓存"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._set_memory(key, namespace, value, expires_at)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, namespace, value, expires_at, now)
+                )
+                self._evict_disk(now)
+                self._disk.commit()
+
+    def _set_memory(self, key: str, namespace: str, value: str, expires_at: float):
+        """写入内存层，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = (namespace, value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float):
+        """清理磁盘层过期条目，超出容量时淘汰最久未访问的条目"""
+        self._disk.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        count = self._disk.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._disk.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
+
+    def invalidate(self, *namespaces: str):
+        """使指定命名空间的缓存失效，不指定时清空全部缓存"""
+        with self._lock:
+            if namespaces:
+                for key in [k for k, v in self._memory.items() if v[0] in namespaces]:
+                    del self._memory[key]
+            else:
+                self._memory.clear()
+
+            if self._disk is not None:
+                if namespaces:
+                    placeholders = ",".join("?" * len(namespaces))
+                    self._disk.execute(
+                        f"DELETE FROM response_cache WHERE namespace IN ({placeholders})", namespaces
+                    )
+                else:
+                    self._disk.execute("DELETE FROM response_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory)
+            }
+            if self._disk is not None:
+                stats["disk_entries"] = self._disk.execute(
+                    "SELECT COUNT(*) FROM response_cache"
+                ).fetchone()[0]
+            return stats
@@ -0,0 +1,177 @@
+"""
+语义缓存工具类
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, FrozenSet
+import numpy as np
+from src.config.settings import SEMANTIC_CACHE_CONFIG
+from src.utils.medical_terms import load_entity_matcher
+
+
+class _SemanticNamespace:
+    """单个命名空间的向量索引，固定容量，按最近命中时间淘汰"""
+
+    def __init__(self, capacity: int, dimension: int):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.questions = [None] * capacity
+        self.answers = [None] * capacity
+        self.entities = [None] * capacity   # 问题中的医学实体
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_access = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+    def search(self, vector: np.ndarray, now: float, entities: Optional[FrozenSet[str]] = None):
+        """返回(槽位, 相似度)，无有效条目时返回(None, 0)；指定entities时只考虑医学实体相同的条目"""
+        if self.size == 0:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        scores[self.expires_at[:self.size] <= now] = -1.0
+        if entities is not None:
+            scores[[slot for slot in range(self.size) if self.entities[slot] != entities]] = -1.0
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def free_slot(self, now: float) -> int:
+        """获取可写入的槽位：优先空槽，其次已过期条目，最后最久未命中的条目"""
+        if self.size < len(self.questions):
+            self.size += 1
+            return self.size - 1
+        expired = np.flatnonzero(self.expires_at <= now)
+        if len(expired):
+            return int(expired[0])
+        return int(np.argmin(self.last_access))
+
+
+class SemanticCache:
+    """语义缓存 - 复述问题（如"湿疹吃什么药"与"湿疹该用哪些药物"）命中同一回答
+
+    使用嵌入模型将问题向量化，在进程内向量索引中按余弦相似度查找，
+    相似度不低于阈值且两问题中的医学实体相同才视为命中：只差病名或药名的短问题
+    （如"湿疹用什么药"与"痤疮用什么药"）向量非常接近，不能互相复用回答。未识别出任何医学实体的问题
+    （如"平时需要注意什么"）所指不明，既不查找也不写入。不同解释模式使用不同命名空间。
+    """
+
+    def __init__(self, embedding_function, similarity_threshold: Optional[float] = None,
+                 max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 entity_extractor: Optional[Callable[[str], FrozenSet[str]]] = None):
+        self.embedding_function = embedding_function
+        self.entity_extractor = entity_extractor or self._default_entity_extractor()
+        self.similarity_threshold = similarity_threshold or SEMANTIC_CACHE_CONFIG["similarity_threshold"]
+        self.max_entries = max_entries or SEMANTIC_CACHE_CONFIG["max_entries"]
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else SEMANTIC_CACHE_CONFIG["ttl_seconds"]
+        self.hits = 0
+        self.misses = 0
+        self._namespaces: Dict[str, _SemanticNamespace] = {}
+        self._recent_vectors = OrderedDict()  # 问题 -> 向量，避免查找和写入重复计算
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_entity_extractor() -> Optional[Callable[[str], FrozenSet[str]]]:
+        """按配置使用术语表提取医学实体，未启用或术语表不存在时返回None（只比较相似度）"""
+        if not SEMANTIC_CACHE_CONFIG["match_entities"]:
+            return None
+        term_file = SEMANTIC_CACHE_CONFIG["term_file"]
+        if not os.path.exists(term_file):
+            print(f"⚠️ 未找到医学术语表，语义缓存不比较医学实体: {term_file}")
+            return None
+        return load_entity_matcher(os.path.abspath(term_file)).extract
+
+    def _entities(self, question: str) -> Optional[FrozenSet[str]]:
+        """问题中的医学实体，未配置实体提取时返回None"""
+        return self.entity_extractor(question) if self.entity_extractor is not None else None
+
+    def applicable(self, question: str) -> bool:
+        """问题是否可使用语义缓存：配置了实体提取时要求问题中至少有一个医学实体"""
+        return self.entity_extractor is None or bool(self._entities(question))
+
+    def _embed(self, question: str) -> np.ndarray:
+        """计算归一化的问题向量"""
+        with self._lock:
+            vector = self._recent_vectors.get(question)
+            if vector is not None:
+                self._recent_vectors.move_to_end(question)
+                return vector
+
+        vector = np.asarray(self.embedding_function.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        with self._lock:
+            self._recent_vectors[question] = vector
+            while len(self._recent_vectors) > 256:
+                self._recent_vectors.popitem(last=False)
+        return vector
+
+    def lookup(self, question: str, namespace: str) -> Optional[str]:
+        """查找语义相近的问题的回答，未命中时返回None"""
+        if not self.applicable(question):
+            return None
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            print(f"❌ 语义缓存向量化失败: {e}")
+            return None
+
+        entities = self._entities(question)
+        now = time.time()
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            slot, score = index.search(vector, now, entities) if index is not None else (None, 0.0)
+            if slot is None or score < self.similarity_threshold:
+                self.misses += 1
+                return None
+            index.last_access[slot] = now
+            self.hits += 1
+            return index.answers[slot]
+
+    def add(self, question: str, answer: str, namespace: str):
+        """写入问题和回答"""
+        if not self.applicable(question):
+            return
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            print(f"❌ 语义缓存向量化失败: {e}")
+            return
+
+        entities = self._entities(question)
+        now = time.time()
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                index = _SemanticNamespace(self.max_entries, len(vector))
+                self._namespaces[namespace] = index
+
+            slot, score = index.search(vector, now, entities)
+            # 几乎相同的问题覆盖原条目，避免重复占用容量
+            if slot is None or score < 0.999:
+                slot = index.free_slot(now)
+            index.vectors[slot] = vector
+            index.questions[slot] = question
+            index.answers[slot] = answer
+            index.entities[slot] = entities
+            index.expires_at[slot] = now + self.ttl_seconds
+            index.last_access[slot] = now
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """使指定命名空间失效，不指定时清空全部"""
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+            else:
+                self._namespaces.pop(namespace, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": {name: index.size for name, index in self._namespaces.items()}
+            }
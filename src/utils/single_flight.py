@@ -0,0 +1,213 @@
+"""
+请求合并工具类 - 并发的相同请求共享同一次正在进行的计算
+"""
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, AsyncIterable
+from src.utils.tracing import tracer
+
+
+class _Call:
+    """一次正在进行的同步调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    """一次正在进行的异步调用及等待它的调用方数"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """多个调用方共享的流：已产出的片段缓存在items中，后加入的调用方从头回放"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self.source = None
+        self.items = []
+        self.finished = False
+        self.error = None
+        self.consumers = 0
+        self.pull_lock = threading.Lock()     # 同步流：同一时刻只有一个调用方读取上游
+        self.changed = None                   # 异步流：上游产出新片段时通知等待的调用方
+        self.task = None                      # 异步流：读取上游的后台任务
+
+
+class SingleFlight:
+    """请求合并
+
+    同一键的请求正在进行时，后到的相同请求不再重复执行，而是等待并共享其结果（包括异常）。
+    只合并同时进行的请求，完成后即移除，不缓存结果。支持同步调用、协程和流式输出，
+    合并情况以"inflight.名称"计入追踪的缓存统计（命中即被合并）。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, _AsyncCall] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, coalesced: bool):
+        tracer.record_cache(f"inflight.{self.name}", coalesced)
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """执行func，相同key的调用正在进行时等待其结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._record(not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._pop(self._calls, key, call)
+            call.done.set()
+
+    def forget(self, key: Hashable):
+        """放弃key对应的正在进行的同步调用：已在等待的调用方仍共享其结果，之后的相同请求重新执行
+
+        用于调用方超时后放弃仍在后台运行的调用，避免后续请求合并到这次调用上继续等待。
+        """
+        with self._lock:
+            self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """do的异步版本：协程在共享任务中执行，全部调用方取消后任务才被取消"""
+        loop_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            call = self._async_calls.get(loop_key)
+            leader = call is None
+            if leader:
+                call = self._async_calls[loop_key] = _AsyncCall(asyncio.ensure_future(func(*args, **kwargs)))
+                call.task.add_done_callback(lambda _: self._pop(self._async_calls, loop_key, call))
+            call.waiters += 1
+        self._record(not leader)
+
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _pop(self, flights: Dict[Hashable, Any], key: Hashable, flight: Any):
+        """移除已结束的请求（仅当仍是同一请求时）"""
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def _join(self, key: Hashable, factory: Callable[[], Any]) -> _SharedStream:
+        """加入相同key正在进行的流，不存在时新建"""
+        with self._lock:
+            stream = self._streams.get(key)
+            leader = stream is None
+            if leader:
+                stream = self._streams[key] = _SharedStream(factory)
+            stream.consumers += 1
+        self._record(not leader)
+        return stream
+
+    def _leave(self, key: Hashable, stream: _SharedStream) -> bool:
+        """调用方离开流，返回是否为最后一个调用方"""
+        with self._lock:
+            stream.consumers -= 1
+            last = stream.consumers == 0
+            if last and self._streams.get(key) is stream:
+                del self._streams[key]
+            return last
+
+    def stream(self, key: Hashable, factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """共享factory()产出的流：相同key的流正在进行时从头回放并跟随后续片段
+
+        上游由当前需要下一片段的调用方读取；所有调用方都离开后关闭上游。
+        """
+        stream = self._join(key, factory)
+        index = 0
+        try:
+            while True:
+                if index < len(stream.items):
+                    yield stream.items[index]
+                    index += 1
+                    continue
+                if stream.finished:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+                with stream.pull_lock:
+                    if index < len(stream.items) or stream.finished:
+                        continue
+                    try:
+                        if stream.source is None:
+                            stream.source = iter(stream.factory())
+                        stream.items.append(next(stream.source))
+                    except StopIteration:
+                        stream.finished = True
+                        self._pop(self._streams, key, stream)
+                    except BaseException as e:
+                        stream.error = e
+                        stream.finished = True
+                        self._pop(self._streams, key, stream)
+        finally:
+            if self._leave(key, stream) and not stream.finished:
+                stream.finished = True
+                close = getattr(stream.source, "close", None)
+                if close is not None:
+                    close()
+
+    async def astream(self, key: Hashable, factory: Callable[[], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+        """stream的异步版本：上游在后台任务中读取，所有调用方都离开后取消该任务"""
+        loop_key = (asyncio.get_running_loop(), key)
+        stream = self._join(loop_key, factory)
+        if stream.task is None:
+            stream.changed = asyncio.Condition()
+            stream.task = asyncio.ensure_future(self._produce(loop_key, stream))
+        index = 0
+        try:
+            while True:
+                if index < len(stream.items):
+                    yield stream.items[index]
+                    index += 1
+                    continue
+                if stream.finished:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+                async with stream.changed:
+                    await stream.changed.wait_for(lambda: index < len(stream.items) or stream.finished)
+        finally:
+            if self._leave(loop_key, stream) and not stream.task.done():
+                stream.task.cancel()
+
+    async def _produce(self, key: Hashable, stream: _SharedStream):
+        """读取上游并通知等待的调用方"""
+        try:
+            async for item in stream.factory():
+                stream.items.append(item)
+                async with stream.changed:
+                    stream.changed.notify_all()
+        except Exception as e:
+            stream.error = e
+        finally:
+            stream.finished = True
+            self._pop(self._streams, key, stream)
+            async with stream.changed:
+                stream.changed.notify_all()
@@ -0,0 +1,174 @@
+"""
+分词服务 - 加载医学术语词典的jieba分词器，后台预热，线程安全
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, parent_process
+from typing import Dict, List, Optional, Sequence
+import jieba
+from src.config.settings import TOKENIZER_CONFIG
+from src.utils.medical_terms import load_medical_terms
+
+
+class MedicalTokenizer:
+    """医学分词器
+
+    使用独立的jieba.Tokenizer实例，首次使用前加载jieba词典，并把术语表中的方剂、证型、症状、
+    病症及其别名作为用户词典加入，使"龙胆泻肝汤""扁平疣"等术语不被切开。用户词典中的词频在
+    首次编译时计算并按术语表内容缓存，术语表不变时直接加载。
+
+    词典加载约需1秒，可调用warm_up在后台线程中提前完成；加载完成前的分词调用会等待加载结束，
+    加载完成后分词只读取词典，可在多个线程中同时使用。
+
+    批量分词的进程池首次使用时创建并一直复用。此时进程中已有后台线程和网络连接，fork出的子进程
+    可能死锁，因此按配置使用spawn方式启动子进程（子进程会重新导入主模块，入口脚本需用
+    if __name__ == "__main__" 保护启动代码；子进程异常退出时改为在当前进程中分词）。
+    """
+
+    def __init__(self, term_file: Optional[str] = None, cache_dir: Optional[str] = None):
+        self.term_file = term_file or TOKENIZER_CONFIG["term_file"]
+        self.cache_dir = cache_dir or TOKENIZER_CONFIG["cache_dir"] or tempfile.gettempdir()
+        self._tokenizer = jieba.Tokenizer()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()          # 词典加载
+        self._warmup_lock = threading.Lock()   # 启动后台预热线程
+        self._warmup_thread = None
+        self._pools: Dict[int, ProcessPoolExecutor] = {}   # 进程数 -> 批量分词进程池
+        self._pool_lock = threading.Lock()
+        self._parallel_enabled = True
+
+    def warm_up(self, background: bool = True):
+        """加载词典，background为True时在后台线程中加载并立即返回"""
+        if self._ready.is_set():
+            return
+        if not background:
+            self._ensure_ready()
+            return
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self._ensure_ready, name="tokenizer-warmup", daemon=True)
+                self._warmup_thread.start()
+
+    @property
+    def ready(self) -> bool:
+        """词典是否已加载"""
+        return self._ready.is_set()
+
+    def _ensure_ready(self):
+        """加载词典（只加载一次，并发调用等待同一次加载）"""
+        if self._ready.is_set():
+            return
+        with self._lock:
+            if self._ready.is_set():
+                return
+            self._tokenizer.initialize()
+            try:
+                user_dict = self._compile_user_dict()
+                if user_dict:
+                    self._tokenizer.load_userdict(user_dict)
+            except Exception as e:
+                print(f"⚠️ 医学术语词典加载失败，使用jieba默认词典: {str(e)}")
+            self._ready.set()
+
+    def dictionary_version(self) -> str:
+        """用户词典的版本（术语表内容的哈希），术语表不存在时返回空字符串；分词结果随其变化"""
+        if not os.path.exists(self.term_file):
+            return ""
+        with open(self.term_file, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()[:12]
+
+    def _compile_user_dict(self) -> Optional[str]:
+        """将术语表编译为带词频的jieba用户词典，返回词典路径（术语表不存在时返回None）"""
+        digest = self.dictionary_version()
+        if not digest:
+            print(f"⚠️ 未找到医学术语表: {self.term_file}")
+            return None
+        dict_file = os.path.join(self.cache_dir, f"jieba_medical_{digest}.dict")
+        if os.path.exists(dict_file):
+            return dict_file
+
+        # 词频取能使术语作为整体切出的最小值，避免过度影响其他词的切分
+        terms = load_medical_terms(os.path.abspath(self.term_file)).all_terms()
+        lines = [f"{term} {self._tokenizer.suggest_freq(term, tune=False)}\n" for term in terms]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = f"{dict_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(temp_file, dict_file)
+        return dict_file
+
+    def lcut(self, text: str) -> List[str]:
+        """精确模式分词"""
+        self._ensure_ready()
+        return self._tokenizer.lcut(text)
+
+    def lcut_for_search(self, text: str) -> List[str]:
+        """搜索引擎模式分词（长词同时切出其中的短词）"""
+        self._ensure_ready()
+        return self._tokenizer.lcut_for_search(text)
+
+    def bulk_lcut(self, texts: Sequence[str], search: bool = False, processes: Optional[int] = None) -> List[List[str]]:
+        """批量分词，文本较多且有多个CPU时使用多进程并行，结果与逐条分词相同且顺序不变"""
+        self._ensure_ready()
+        cut = self._tokenizer.lcut_for_search if search else self._tokenizer.lcut
+        processes = processes or TOKENIZER_CONFIG["parallel_processes"] or os.cpu_count() or 1
+        # 批量分词的子进程中不再创建进程池
+        if (processes <= 1 or len(texts) < TOKENIZER_CONFIG["parallel_min_texts"]
+                or not self._parallel_enabled or parent_process() is not None):
+            return [cut(text) for text in texts]
+
+        chunksize = max(1, len(texts) // (processes * 4))
+        try:
+            return list(self._bulk_pool(processes).map(_bulk_cut, texts, [search] * len(texts), chunksize=chunksize))
+        except BrokenProcessPool:
+            print("⚠️ 批量分词子进程异常退出（入口脚本需用 if __name__ == \"__main__\" 保护启动代码），改为在当前进程中分词")
+            with self._pool_lock:
+                self._parallel_enabled = False
+                self._pools.pop(processes, None)
+            return [cut(text) for text in texts]
+
+    def _bulk_pool(self, processes: int) -> ProcessPoolExecutor:
+        """获取批量分词的进程池（按进程数创建一次后复用），创建前等待后台预热线程结束"""
+        with self._pool_lock:
+            pool = self._pools.get(processes)
+            if pool is None:
+                if self._warmup_thread is not None:
+                    self._warmup_thread.join()
+                pool = self._pools[processes] = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=get_context(TOKENIZER_CONFIG["parallel_start_method"]),
+                    initializer=_init_bulk_worker,
+                    initargs=(self.term_file, self.cache_dir)
+                )
+            return pool
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_worker_tokenizer = None
+
+
+def _init_bulk_worker(term_file: str, cache_dir: str):
+    """批量分词子进程的初始化：加载与主进程相同的词典（编译好的用户词典直接从缓存读取）"""
+    global _worker_tokenizer
+    _worker_tokenizer = MedicalTokenizer(term_file, cache_dir)
+    _worker_tokenizer.warm_up(background=False)
+
+
+def _bulk_cut(text: str, search: bool) -> List[str]:
+    """批量分词的子进程任务"""
+    return _worker_tokenizer.lcut_for_search(text) if search else _worker_tokenizer.lcut(text)
+
+
+def get_tokenizer() -> MedicalTokenizer:
+    """获取全局共享的医学分词器"""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = MedicalTokenizer()
+    return _tokenizer
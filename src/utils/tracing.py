@@ -0,0 +1,308 @@
+"""
+链路追踪工具类 - 记录每轮对话各阶段的耗时、Token用量和缓存命中情况
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from src.config.settings import TRACING_CONFIG
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一个阶段的追踪记录"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.status = "ok"
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def set(self, key: str, value: Any):
+        """设置阶段属性"""
+        self.attributes[key] = value
+
+    def incr(self, key: str, amount: int = 1):
+        """累加计数类属性（如LLM重试次数）"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def elapsed_ms(self) -> float:
+        """阶段开始至今的耗时（毫秒）"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def mark(self, key: str):
+        """首次调用时记录当前耗时（如首个Token的到达时间）"""
+        if key not in self.attributes:
+            self.attributes[key] = round(self.elapsed_ms(), 3)
+
+    def add_tokens(self, input_tokens: int, output_tokens: int):
+        """累加Token用量，并计入所有上级阶段"""
+        span = self
+        while span is not None:
+            span.input_tokens += input_tokens
+            span.output_tokens += output_tokens
+            span = span.parent
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为写入追踪文件的记录"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class Tracer:
+    """追踪器
+
+    span()记录阶段耗时，嵌套关系通过contextvars传递（线程池中执行时需复制上下文）。
+    结束的阶段在进程内按阶段名汇总耗时分布；配置了追踪文件时同时写入本地JSONL文件，
+    文件超过max_file_bytes后轮转，最多保留backup_count个旧文件。
+    """
+
+    def __init__(self, trace_file: Optional[str] = None, enabled: Optional[bool] = None,
+                 max_samples: Optional[int] = None, max_file_bytes: Optional[int] = None,
+                 backup_count: Optional[int] = None):
+        self.enabled = TRACING_CONFIG["enabled"] if enabled is None else enabled
+        self.trace_file = trace_file or TRACING_CONFIG["trace_file"]
+        self.max_samples = max_samples or TRACING_CONFIG["max_samples"]
+        self.max_file_bytes = max_file_bytes or TRACING_CONFIG["max_file_bytes"]
+        self.backup_count = TRACING_CONFIG["backup_count"] if backup_count is None else backup_count
+        self._durations = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._tokens = defaultdict(lambda: [0, 0])
+        self._errors = defaultdict(int)
+        self._cache = defaultdict(lambda: [0, 0])  # 缓存名 -> [命中, 未命中]
+        self._lock = threading.Lock()
+        self._file = None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """记录一个阶段（未启用追踪时照常计时，但不汇总也不写文件）"""
+        parent = _current_span.get()
+        span = Span(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error" if isinstance(e, Exception) else "cancelled"
+            span.set("error", str(e)[:200])
+            raise
+        finally:
+            span.duration_ms = span.elapsed_ms()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 生成器在其他上下文中结束时无法reset，直接恢复父阶段
+                _current_span.set(parent)
+            self._record(span)
+
+    def current_span(self) -> Optional[Span]:
+        """当前所在的阶段"""
+        return _current_span.get()
+
+    def add_tokens(self, input_tokens: int, output_tokens: int):
+        """将Token用量计入当前阶段"""
+        span = _current_span.get()
+        if span is not None:
+            span.add_tokens(input_tokens, output_tokens)
+
+    def record_cache(self, cache_name: str, hit: bool):
+        """记录缓存命中情况，并标注在当前阶段上"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._cache[cache_name][0 if hit else 1] += 1
+        span = _current_span.get()
+        if span is not None:
+            span.set(f"cache.{cache_name}", "hit" if hit else "miss")
+
+    def _record(self, span: Span):
+        """汇总并写入追踪文件"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._durations[span.name].append(span.duration_ms)
+            self._tokens[span.name][0] += span.input_tokens
+            self._tokens[span.name][1] += span.output_tokens
+            if span.status != "ok":
+                self._errors[span.name] += 1
+            if not self.trace_file:
+                return
+            line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+            try:
+                if self._file is not None and self._file.name != self.trace_file:
+                    # 追踪文件路径被修改（如基准测试改写到临时目录）
+                    self._file.close()
+                    self._file = None
+                if self._file is None:
+                    directory = os.path.dirname(self.trace_file)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._file = open(self.trace_file, "a", encoding="utf-8")
+                self._file.write(line + "\n")
+                self._file.flush()
+                if self._file.tell() >= self.max_file_bytes:
+                    self._rotate()
+            except OSError as e:
+                print(f"❌ 写入追踪文件失败: {e}")
+                self.trace_file = None
+
+    def _rotate(self):
+        """轮转追踪文件：traces.jsonl -> traces.jsonl.1 -> ... -> traces.jsonl.N，超出的旧文件删除"""
+        self._file.close()
+        self._file = None
+        if self.backup_count <= 0:
+            os.remove(self.trace_file)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.trace_file}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.trace_file}.{index + 1}")
+        os.replace(self.trace_file, f"{self.trace_file}.1")
+
+    @staticmethod
+    def _percentile(sorted_values, percent: float) -> float:
+        """计算已排序数据的百分位数（最近秩法）"""
+        index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def summary(self) -> Dict[str, Any]:
+        """按阶段汇总的耗时分布（毫秒）、Token用量和缓存命中率"""
+        with self._lock:
+            stages = {}
+            for name, durations in self._durations.items():
+                values = sorted(durations)
+                stages[name] = {
+                    "count": len(values),
+                    "mean_ms": sum(values) / len(values),
+                    "p50_ms": self._percentile(values, 50),
+                    "p95_ms": self._percentile(values, 95),
+                    "p99_ms": self._percentile(values, 99),
+                    "max_ms": values[-1],
+                    "errors": self._errors[name],
+                    "input_tokens": self._tokens[name][0],
+                    "output_tokens": self._tokens[name][1]
+                }
+            caches = {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                for name, (hits, misses) in self._cache.items()
+            }
+            return {"stages": stages, "caches": caches}
+
+    def format_summary(self) -> str:
+        """格式化汇总结果，供命令行输出"""
+        summary = self.summary()
+        if not summary["stages"]:
+            return "暂无追踪数据"
+        lines = [f"{'stage':<28}{'count':>7}{'mean_ms':>10}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}"
+                 f"{'max_ms':>10}{'errors':>8}{'in_tok':>10}{'out_tok':>10}"]
+        for name, stats in sorted(summary["stages"].items()):
+            lines.append(
+                f"{name:<28}{stats['count']:>7}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+                f"{stats['errors']:>8}{stats['input_tokens']:>10}{stats['output_tokens']:>10}"
+            )
+        for name, stats in sorted(summary["caches"].items()):
+            lines.append(f"缓存 {name}: 命中 {stats['hits']} / 未命中 {stats['misses']} (命中率 {stats['hit_rate']:.1%})")
+        return "\n".join(lines)
+
+    def reset(self):
+        """清空进程内的汇总数据"""
+        with self._lock:
+            self._durations.clear()
+            self._tokens.clear()
+            self._errors.clear()
+            self._cache.clear()
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """LLM回调：将每次调用的Token用量计入当前阶段"""
+
+    run_inline = True  # 异步调用中也在当前上下文执行，才能取到当前阶段
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            # 流式调用的用量在消息的usage_metadata中
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    input_tokens += metadata.get("input_tokens", 0)
+                    output_tokens += metadata.get("output_tokens", 0)
+        if input_tokens or output_tokens:
+            tracer.add_tokens(input_tokens, output_tokens)
+
+
+tracer = Tracer()
+
+
+def traced(name: str):
+    """追踪装饰器，支持普通函数、协程函数以及同步/异步生成器函数"""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return async_gen_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    yield from func(*args, **kwargs)
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_runnable(name: str, runnable: Runnable) -> Runnable:
+    """为Runnable的invoke/ainvoke调用增加追踪（用于包装链内部的子链）"""
+    def invoke(inputs: Any, config: RunnableConfig, **kwargs) -> Any:
+        with tracer.span(name):
+            return runnable.invoke(inputs, config)
+
+    async def ainvoke(inputs: Any, config: RunnableConfig, **kwargs) -> Any:
+        with tracer.span(name):
+            return await runnable.ainvoke(inputs, config)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=name)
@@ -1,19 +1,23 @@
 """
 向量数据库工具类
 """
+import os
 from typing import Optional, List
 from langchain_core.documents import Document
 from langchain_chroma import Chroma
 from src.config.settings import VECTOR_DB_CONFIG
-from src.utils.embeddings import get_embedding_function
+from src.utils.embeddings import get_embedding_function, SingleFlightEmbeddings
+from src.utils.tracing import traced
 
 
 class VectorDBManager:
     """向量数据库管理器"""
     
-    def __init__(self, persist_directory: Optional[str] = None, embedding_type: str = "huggingface"):
+    def __init__(self, persist_directory: Optional[str] = None, embedding_type: str = "huggingface",
+                 embedding_function=None):
         self.persist_directory = persist_directory or VECTOR_DB_CONFIG["chroma_persist_dir"]
-        self.embedding_function = get_embedding_function(embedding_type)
+        # 并发的相同查询只向量化一次
+        self.embedding_function = SingleFlightEmbeddings(embedding_function or get_embedding_function(embedding_type))
         self.vectorstore = None
         self.retriever = None
         self._initialize_db()
@@ -34,6 +38,7 @@ class VectorDBManager:
             self.vectorstore = None
             self.retriever = None
     
+    @traced("vector.retrieve")
     def retrieve_documents(self, query: str, k: Optional[int] = None) -> List[Document]:
         """检索相关文档"""
         if self.retriever is None:
@@ -46,6 +51,26 @@ class VectorDBManager:
             print(f"❌ 文档检索失败: {e}")
             return []
     
+    @traced("vector.retrieve")
+    async def aretrieve_documents(self, query: str, k: Optional[int] = None) -> List[Document]:
+        """异步检索相关文档"""
+        if self.retriever is None:
+            return []
+        
+        search_k = k or VECTOR_DB_CONFIG["retriever_k"]
+        try:
+            return await self.retriever.ainvoke(query, k=search_k)
+        except Exception as e:
+            print(f"❌ 文档检索失败: {e}")
+            return []
+    
+    def data_version(self) -> str:
+        """向量库数据版本（以sqlite文件修改时间标识），用于响应缓存失效"""
+        try:
+            return str(os.path.getmtime(os.path.join(self.persist_directory, "chroma.sqlite3")))
+        except OSError:
+            return ""
+    
     def format_documents(self, docs: List[Document]) -> str:
         """格式化文档内容"""
         return "\n\n".join(doc.page_content for doc in docs)
@@ -54,6 +79,15 @@ class VectorDBManager:
         """查询向量数据库并返回格式化结果"""
         docs = self.retrieve_documents(query, k)
         context = self.format_documents(docs)
+        return {
+            "context": context,
+            "documents": docs
+        }
+    
+    async def aquery(self, query: str, k: Optional[int] = None) -> dict:
+        """异步查询向量数据库并返回格式化结果"""
+        docs = await self.aretrieve_documents(query, k)
+        context = self.format_documents(docs)
         return {
             "context": context,
             "documents": docs
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Aho-Corasick自动机、意图路由和医学实体匹配（离线，无需LLM）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.aho_corasick import AhoCorasickAutomaton
+from src.utils.medical_terms import MedicalEntityMatcher, load_medical_terms
+from src.components.intent_router import IntentRouter
+
+
+def naive_matches(patterns, text):
+    """逐个模式串暴力查找，作为对照"""
+    return sorted(
+        (start, start + len(pattern), pattern)
+        for pattern in set(patterns)
+        for start in range(len(text) - len(pattern) + 1)
+        if text.startswith(pattern, start)
+    )
+
+
+def test_matches_agree_with_naive_search():
+    """重叠、嵌套和共享后缀的模式串全部找出，与暴力查找一致"""
+    patterns = ["湿疹", "婴儿湿疹", "疹", "he", "she", "hers", "his"]
+    automaton = AhoCorasickAutomaton()
+    automaton.add_all(patterns, "term")
+    for text in ["婴儿湿疹和湿疹", "ushers his", "", "无匹配"]:
+        found = sorted((start, end, pattern) for start, end, pattern, _ in automaton.iter_matches(text))
+        assert found == naive_matches(patterns, text)
+
+
+def test_labels_are_merged_and_rebuild_is_lazy():
+    """同一模式串的多个标签合并返回；新增模式串后下次扫描自动重建"""
+    automaton = AhoCorasickAutomaton()
+    automaton.add("诊断", "message:start_diagnosis")
+    automaton.add("诊断", "context:interactive")
+    automaton.add("", "ignored")
+    assert list(automaton.iter_matches("请诊断")) == [
+        (1, 3, "诊断", ("context:interactive", "message:start_diagnosis"))
+    ]
+    automaton.add("请", "polite")
+    assert [match[2] for match in automaton.iter_matches("请诊断")] == ["请", "诊断"]
+    assert len(automaton) == 2
+
+
+def test_intent_router_scopes():
+    """消息和上下文使用同一个自动机，但各自只返回本范围的意图"""
+    router = IntentRouter(
+        message_intents={"counterfactual": ["如果"], "interactive": ["为什么"]},
+        context_intents={"interactive": ["诊断"]}
+    )
+    message = router.classify("如果加上口干，为什么诊断会变")
+    assert message.intents() == ["counterfactual", "interactive"]
+    assert message.spans["interactive"] == [(7, 10, "为什么")]
+    context = router.classify_context("诊断: 湿热证")
+    assert context.intents() == ["interactive"]
+    assert router.classify_context("诊断: 湿热证") is context
+
+
+def test_entity_matcher_prefers_longest_match_and_maps_aliases(tmp_path):
+    """实体取最长且互不重叠的匹配，病症别名归一为图谱中的病症名称"""
+    term_file = tmp_path / "term.txt"
+    term_file.write_text(
+        "方剂: ----\n龙胆泻肝汤加减\n"
+        "症状: ----\n瘙痒\n"
+        "病症: ----\n湿疹\t无\t无\n婴儿湿疹\t奶癣\t胎敛疮\n",
+        encoding="utf-8"
+    )
+    matcher = MedicalEntityMatcher(load_medical_terms(str(term_file)))
+    assert matcher.extract("婴儿湿疹瘙痒用龙胆泻肝汤吗") == {"婴儿湿疹", "瘙痒", "龙胆泻肝汤"}
+    assert matcher.extract("奶癣怎么办") == {"婴儿湿疹"}
+    assert matcher.extract("湿疹怎么办") == {"湿疹"}
+    assert matcher.extract("头疼") == frozenset()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Cypher模板缓存的句式学习和匹配（离线，无需LLM和图数据库）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.cypher_cache import CypherTemplateCache
+
+CYPHER = 'MATCH (d:皮肤病 {id: "湿疹"})-[:辨证为]->(s:证型) RETURN s.id'
+
+
+def test_learned_template_matches_other_entities():
+    """学到的句式用新实体作为参数，Cypher中的字面量变为$参数"""
+    cache = CypherTemplateCache(max_templates=8, min_fixed_chars=2)
+    assert cache.learn("湿疹有哪些证型？", CYPHER)
+    cypher, params = cache.lookup("荨麻疹 有哪些证型")
+    assert cypher == 'MATCH (d:皮肤病 {id: $p0})-[:辨证为]->(s:证型) RETURN s.id'
+    assert params == {"p0": "荨麻疹"}
+    assert cache.lookup("荨麻疹用什么方剂") is None
+
+
+def test_multiple_entities_and_property_comparisons():
+    """多个实体按在问题中的顺序编号，n.id = '...'形式的字面量同样参数化"""
+    cache = CypherTemplateCache(max_templates=8, min_fixed_chars=2)
+    cypher = "MATCH (f:方剂)-[:用于治疗]->(d:皮肤病) WHERE f.id = '消风散' AND d.id = '湿疹' RETURN f"
+    assert cache.learn("湿疹能用消风散吗", cypher)
+    template, params = cache.lookup("痤疮能用枇杷清肺饮吗")
+    assert params == {"p0": "痤疮", "p1": "枇杷清肺饮"}
+    assert template == "MATCH (f:方剂)-[:用于治疗]->(d:皮肤病) WHERE f.id = $p1 AND d.id = $p0 RETURN f"
+
+
+def test_unreliable_templates_are_not_learned():
+    """无法可靠参数化时不缓存：无字面量、字面量不在问题中或出现多次、实体相邻、固定文字过少"""
+    cache = CypherTemplateCache(max_templates=8, min_fixed_chars=2)
+    assert not cache.learn("湿疹有哪些证型", "MATCH (s:证型) RETURN s.id")
+    assert not cache.learn("湿疹有哪些证型", 'MATCH (d {id: "痤疮"}) RETURN d')
+    assert not cache.learn("湿疹和湿疹", CYPHER)
+    assert not cache.learn("湿疹消风散", 'MATCH (d {id: "湿疹"}), (f {id: "消风散"}) RETURN d, f')
+    assert not cache.learn("湿疹?", CYPHER)
+    assert cache.templates() == []
+
+
+def test_lru_eviction_and_clear():
+    """超过容量时淘汰最久未使用的句式，clear清空全部"""
+    cache = CypherTemplateCache(max_templates=2, min_fixed_chars=2)
+    cache.learn("湿疹有哪些证型", CYPHER)
+    cache.learn("湿疹用什么方剂", CYPHER)
+    assert cache.lookup("痤疮有哪些证型") is not None   # 最近使用，保留
+    cache.learn("湿疹有什么症状", CYPHER)
+    assert cache.lookup("痤疮用什么方剂") is None
+    assert cache.lookup("痤疮有哪些证型") is not None
+    assert cache.templates()[-1].hits == 2
+    cache.clear()
+    assert cache.lookup("痤疮有哪些证型") is None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试请求截止时间：预算分配和降级（离线，使用本地替身模型）
+"""
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+from src.agents.stream_events import StreamEventType
+from src.config.settings import CONCURRENCY_CONFIG, DEADLINE_CONFIG
+from src.utils.deadline import Deadline, DeadlineExceeded, call_with_deadline, iter_with_deadline
+
+
+def degraded_stages(events):
+    return [json.loads(event.content) for event in events if event.type == StreamEventType.DEGRADED]
+
+
+def test_deadline_tracks_remaining_time_and_first_reason():
+    """剩余时间随时间减少；同一阶段只记录首个降级原因；不限时的截止时间永不过期"""
+    deadline = Deadline(0.05)
+    assert deadline.bounded and 0 < deadline.remaining() <= 0.05
+    deadline.mark_degraded("wm", "超时")
+    deadline.mark_degraded("wm", "出错")
+    assert deadline.degraded == {"wm": "超时"}
+    time.sleep(0.06)
+    assert deadline.expired() and deadline.remaining() == 0
+    unbounded = Deadline(None)
+    assert not unbounded.bounded and not unbounded.expired() and unbounded.timeout() is None
+
+
+def test_calls_and_iteration_stop_at_deadline():
+    """限时调用和限时迭代在截止时间到达时抛出DeadlineExceeded，不等待后台调用结束"""
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(time.sleep, Deadline(0.05), 1)
+
+    def slow_items():
+        yield "a"
+        time.sleep(1)
+        yield "b"
+
+    items = []
+    with pytest.raises(DeadlineExceeded):
+        for item in iter_with_deadline(slow_items(), Deadline(0.1)):
+            items.append(item)
+    assert items == ["a"]
+    assert time.monotonic() - start < 0.5
+
+
+def test_branch_budgets_split_remaining_time(offline_agent):
+    """各知识分支使用剩余预算的配置比例，且不超过分支超时配置"""
+    budgets = offline_agent._branch_budgets(Deadline(10))
+    for branch, share in DEADLINE_CONFIG["knowledge_share"].items():
+        assert budgets[branch] == pytest.approx(10 * share, abs=0.01)
+    assert offline_agent._branch_budgets(Deadline(1000))["tcm"] == CONCURRENCY_CONFIG["tcm_timeout"]
+
+
+def test_default_budget_follows_explanation_mode(offline_agent):
+    """未指定时间预算时按解释模式取默认值，指定时使用指定值"""
+    session = offline_agent.spawn_session()
+    assert session._turn_deadline(None).budget == DEADLINE_CONFIG["mode_budgets"]["detailed"]
+    session.set_explanation_preference("/explain brief")
+    assert session._turn_deadline(None).budget == DEADLINE_CONFIG["default_budget"]
+    assert session._turn_deadline(5).budget == 5
+
+
+def test_short_budget_skips_citation(offline_agent):
+    """剩余时间不足以生成医学依据时跳过依据，回答注明降级"""
+    session = offline_agent.spawn_session()
+    events = list(session.stream_query("湿疹用什么药", deadline=DEADLINE_CONFIG["min_citation_budget"] - 1))
+    assert degraded_stages(events) == [{"citation": "剩余时间不足，已跳过"}]
+    assert "【医学依据】" not in events[-1].content
+    assert events[-1].content.endswith("医学依据（剩余时间不足，已跳过））")
+
+
+def test_integration_timeout_returns_knowledge_with_note(offline_agent):
+    """整合超时时放弃等待，返回原始中西医信息并注明降级，不再生成医学依据"""
+    session = offline_agent.spawn_session()
+    session.integration_chain = RunnableLambda(lambda inputs: time.sleep(1) or "迟到的整合结果")
+    start = time.monotonic()
+    events = list(session.stream_query("湿疹用什么药", deadline=0.3))
+    assert time.monotonic() - start < 0.8
+    assert degraded_stages(events) == [{"integration": "超时"}]
+    answer = events[-1].content
+    assert answer.startswith("整合结果超时") and "中医信息" in answer and "【医学依据】" not in answer
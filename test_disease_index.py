@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试疾病数据的BM25F检索（离线，无需图数据库）
+"""
+import sys
+import os
+import math
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.config.settings import DISEASE_INDEX_CONFIG
+from src.utils.disease_index import DiseaseIndex
+
+DISEASES = [
+    {"name": "湿疮(湿疹)", "key_point": "皮损多形，瘙痒剧烈，有渗出倾向", "solution": "龙胆泻肝汤", "name_exp": "湿疹是常见皮肤病"},
+    {"name": "瘾疹(荨麻疹)", "key_point": "风团时起时消，瘙痒", "solution": "消风散", "name_exp": "荨麻疹与过敏有关"},
+    {"name": "蛇串疮(带状疱疹)", "key_point": "簇集水疱，沿神经分布，疼痛明显", "solution": "龙胆泻肝汤", "name_exp": "带状疱疹由病毒引起"},
+    {"name": "粉刺(痤疮)", "key_point": "粉刺丘疹，好发于面部", "solution": "枇杷清肺饮", "name_exp": "痤疮多见于青春期"}
+]
+
+
+def names(results):
+    return [disease["name"] for disease, _ in results]
+
+
+def ranked(results):
+    return [(disease["name"], round(score, 5)) for disease, score in results]
+
+
+def test_name_field_outranks_other_fields():
+    """问题中的词出现在权重更高的字段时排名更靠前"""
+    index = DiseaseIndex(DISEASES)
+    # "湿疹"在湿疮的名称中，在带状疱疹中不出现；"龙胆泻肝汤"两者都有
+    assert names(index.search("湿疹用龙胆泻肝汤"))[:2] == ["湿疮(湿疹)", "蛇串疮(带状疱疹)"]
+    assert names(index.search("带状疱疹很疼")) == ["蛇串疮(带状疱疹)"]
+    assert index.search("今天天气不错") == []
+
+
+def test_scores_follow_bm25f():
+    """单字段命中时得分为 idf·tf/(k1+tf)，tf按字段权重和长度归一化"""
+    config = dict(DISEASE_INDEX_CONFIG, field_boosts={"name": 1.0}, b=0.0, stopwords=[])
+    index = DiseaseIndex([{"name": "湿疹"}, {"name": "痤疮"}, {"name": "白癜风"}], config=config)
+    (disease, score), = index.search("湿疹")
+    idf = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    assert disease["name"] == "湿疹"
+    assert abs(score - idf * 1 / (config["k1"] + 1)) < 1e-6
+
+
+def test_batch_search_matches_search():
+    """批量检索与逐条检索结果一致"""
+    index = DiseaseIndex(DISEASES)
+    questions = ["湿疹瘙痒怎么办", "风团瘙痒", "脸上长粉刺", "没有任何相关词", "龙胆泻肝汤"]
+    for question, batch in zip(questions, index.batch_search(questions, k=3)):
+        assert ranked(batch) == ranked(index.search(question, k=3))
+
+
+def test_persisted_index_is_memory_mapped_and_rebuilt_when_stale(tmp_path):
+    """持久化的索引再次打开时以内存映射方式加载且结果相同；数据版本变化时重建"""
+    built = DiseaseIndex(DISEASES, index_dir=str(tmp_path), source_version="v1")
+    loaded = DiseaseIndex(DISEASES, index_dir=str(tmp_path), source_version="v1")
+    assert isinstance(loaded.terms, np.memmap) and not isinstance(built.terms, np.memmap)
+    assert ranked(loaded.search("湿疹瘙痒")) == ranked(built.search("湿疹瘙痒"))
+    assert [ranked(r) for r in loaded.batch_search(["湿疹瘙痒", "风团"])] == \
+           [ranked(r) for r in built.batch_search(["湿疹瘙痒", "风团"])]
+
+    stale = DiseaseIndex(DISEASES[:2], index_dir=str(tmp_path), source_version="v2")
+    assert not isinstance(stale.terms, np.memmap)
+    assert names(stale.search("带状疱疹")) == []
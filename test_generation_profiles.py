@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试各解释模式的生成配置（离线，使用Agent的真实提示模板和本地替身模型）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from benchmarks.fakes import FakeLatencyChatModel
+from src.config.settings import GENERATION_PROFILES
+from src.utils.llm_registry import LLMRegistry
+
+KNOWLEDGE = {"tcm": "湿疹多属湿热浸淫证", "wm": "湿疹是常见的变态反应性皮肤病"}
+
+
+@pytest.fixture
+def prompts(offline_agent):
+    """用无延迟的替身模型替代离线Agent的模型，回复为足够长的文本，并记录收到的提示"""
+    received = []
+
+    def responder(prompt):
+        received.append(prompt)
+        return "字" * 10000
+
+    previous_factory = LLMRegistry._model_factory
+    LLMRegistry.set_model_factory(lambda model, temperature: FakeLatencyChatModel(
+        responder=responder, first_token_latency=0, token_latency=0, chars_per_token=1
+    ))
+    yield received
+    LLMRegistry.set_model_factory(previous_factory)
+
+
+def test_prompt_variants_take_integration_inputs(offline_agent):
+    """各模式的提示模板只使用整合输入中的变量（示例中的花括号需转义），均能正常格式化"""
+    inputs = offline_agent._integration_inputs(KNOWLEDGE)
+    for mode, profile in GENERATION_PROFILES.items():
+        prompt = offline_agent.prompt_variants[profile["prompt"]]
+        assert set(prompt.input_variables) <= set(inputs), mode
+        assert KNOWLEDGE["tcm"] in prompt.format(**inputs)
+
+
+@pytest.mark.parametrize("mode", list(GENERATION_PROFILES))
+def test_profile_caps_generation_length(offline_agent, prompts, mode):
+    """每个模式（包括结构化模式）的整合链经真实提示模板调用，输出长度受其max_tokens限制"""
+    chain = offline_agent._build_profile_chain(mode)
+    inputs = offline_agent._integration_inputs(KNOWLEDGE)
+    max_tokens = GENERATION_PROFILES[mode]["max_tokens"]
+    assert len(chain.invoke(inputs)) == max_tokens
+    assert len("".join(chain.stream(inputs))) == max_tokens
+    assert len(prompts) == 2 and all(KNOWLEDGE["wm"] in prompt for prompt in prompts)
+
+
+def test_brief_profile_is_shorter_than_detailed():
+    """简洁模式的生成上限低于详细模式"""
+    assert GENERATION_PROFILES["brief"]["max_tokens"] < GENERATION_PROFILES["detailed"]["max_tokens"]
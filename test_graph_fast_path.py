@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试图谱查询快速路径（离线，使用临时术语表和内存图数据库）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from benchmarks.fakes import InMemoryGraph
+from src.utils.graph_db import GraphDBManager
+from src.utils.graph_fast_path import GraphFastPath
+from src.utils.tracing import tracer
+
+TERMS = (
+    "方剂: \n龙胆泻肝汤加减\n消风散\n"
+    "证型: \n湿热浸淫证\n湿疹\n"
+    "症状: \n瘙痒\n"
+    "病症: ----\n名称\t别名\t对照\n湿疹\t湿疮\t急性湿疹\n荨麻疹\t瘾疹\t无\n"
+)
+
+
+@pytest.fixture
+def fast_path(tmp_path):
+    term_file = tmp_path / "term.txt"
+    term_file.write_text(TERMS, encoding="utf-8")
+    return GraphFastPath(str(term_file))
+
+
+@pytest.mark.parametrize("question, label, relation, ids", [
+    ("湿疹有哪些证型", "皮肤病", "证型", ["湿疹"]),             # 同时是证型的术语按优先级取皮肤病
+    ("湿疮用什么药", "皮肤病", "方剂", ["湿疹"]),               # 别名映射到病症名称
+    ("龙胆泻肝汤主治什么病", "方剂", "皮肤病", ["龙胆泻肝汤加减"]),  # 去掉加减后缀的方剂名
+    ("湿热浸淫证用什么方剂", "证型", "方剂", ["湿热浸淫证"]),
+    ("瘙痒是什么证型", "症状", "证型", ["瘙痒"]),
+])
+def test_known_entity_and_relation_use_template(fast_path, question, label, relation, ids):
+    """能唯一确定实体和所问关系时使用对应的预置Cypher，参数为节点id"""
+    assert fast_path.plan(question) == (GraphFastPath.TEMPLATES[label][relation], {"ids": ids})
+
+
+@pytest.mark.parametrize("question", [
+    "湿疹怎么办",              # 未问具体关系
+    "湿疹和荨麻疹有哪些证型",    # 多个实体
+    "湿疹的证型和症状",         # 多个关系
+    "白癜风用什么药",           # 术语表中没有的病
+    "今天天气怎么样",
+])
+def test_ambiguous_or_unknown_questions_fall_through(fast_path, question):
+    """实体或关系无法唯一确定时返回None，交给LLM生成Cypher"""
+    assert fast_path.plan(question) is None
+
+
+def stage_count(name):
+    return tracer.summary()["stages"].get(name, {}).get("count", 0)
+
+
+def test_manager_skips_cypher_generation_on_fast_path(offline_agent):
+    """快速路径命中时不调用LLM生成Cypher，未命中时回退到LLM生成"""
+    manager = GraphDBManager(graph=InMemoryGraph(latency=0))
+    tracer.reset()
+    assert manager.fetch("湿疹有哪些证型")
+    assert stage_count("graph.cypher_generation") == 0
+    assert tracer.summary()["caches"]["graph_fast_path"]["hits"] == 1
+
+    manager.fetch("湿疹怎么办")
+    assert stage_count("graph.cypher_generation") == 1
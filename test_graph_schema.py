@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试图数据库schema快照（离线）
+"""
+import sys
+import os
+import copy
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.fakes import InMemoryGraph
+from src.utils.graph_schema import load_schema_snapshot, save_schema_snapshot, schema_hash
+
+SCHEMA = InMemoryGraph().get_structured_schema
+
+
+def test_hash_is_stable_and_ignores_key_order():
+    """相同schema的哈希稳定，与字典键的顺序无关"""
+    reordered = {key: SCHEMA[key] for key in reversed(list(SCHEMA))}
+    assert schema_hash(SCHEMA) == schema_hash(copy.deepcopy(SCHEMA)) == schema_hash(reordered)
+
+
+def test_hash_changes_when_schema_changes():
+    """新增节点属性或关系时哈希变化"""
+    with_property = copy.deepcopy(SCHEMA)
+    with_property["node_props"]["方剂"].append({"property": "组成", "type": "STRING"})
+    with_relationship = copy.deepcopy(SCHEMA)
+    with_relationship["relationships"].append({"start": "症状", "type": "见于", "end": "皮肤病"})
+    hashes = {schema_hash(SCHEMA), schema_hash(with_property), schema_hash(with_relationship)}
+    assert len(hashes) == 3
+
+
+def test_snapshot_round_trip(tmp_path):
+    """保存的快照可按数据库名加载，返回的哈希与内容一致"""
+    path = str(tmp_path / "snapshots" / "graph_schema.json")
+    digest = save_schema_snapshot(path, "neo4j", SCHEMA)
+    assert digest == schema_hash(SCHEMA)
+    assert load_schema_snapshot(path, "neo4j") == SCHEMA
+    assert load_schema_snapshot(path, "other") is None
+    assert load_schema_snapshot(str(tmp_path / "missing.json"), "neo4j") is None
+
+
+def test_tampered_or_corrupt_snapshot_is_ignored(tmp_path):
+    """内容与记录的哈希不符或文件损坏时不使用快照"""
+    path = tmp_path / "graph_schema.json"
+    save_schema_snapshot(str(path), "neo4j", SCHEMA)
+    snapshot = json.loads(path.read_text(encoding="utf-8"))
+    snapshot["structured_schema"]["relationships"].pop()
+    path.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    assert load_schema_snapshot(str(path), "neo4j") is None
+
+    path.write_text('{"database": "neo4j", "hash":', encoding="utf-8")
+    assert load_schema_snapshot(str(path), "neo4j") is None
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试集成诊断Agent的整合流程（离线，使用本地替身模型和真实提示模板）
+"""
+import sys
+import os
+import asyncio
+import copy
+import json
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.runnables import RunnableLambda
+from benchmarks.fakes import STRUCTURED_ANSWER, FakeEmbeddings
+from src.agents.knowledge_agents import KnowledgeQueryError
+from src.agents.stream_events import StreamEventType
+from src.utils.response_cache import ResponseCache
+from src.utils.medical_terms import load_entity_matcher
+from src.utils.semantic_cache import SemanticCache
+from src.utils.single_flight import SingleFlight
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ERROR_MARKERS = ("出错", "出现错误", "超时", "降级")
+
+
+def structured_session(agent):
+    session = agent.spawn_session()
+    session.set_explanation_preference("/explain structured")
+    return session
+
+
+def cached_namespaces(cache):
+    return {namespace for namespace, _, _ in cache._memory.values()}
+
+
+def test_structured_mode_formats_fields_through_real_prompt(offline_agent):
+    """结构化模式经真实提示模板生成JSON，逐字段输出格式化结果并生成医学依据"""
+    session = structured_session(offline_agent)
+    events = list(session.stream_query("带状疱疹用什么药"))
+    fields = {event.name for event in events if event.type == StreamEventType.STRUCTURED_FIELD}
+    answer = events[-1].content
+    assert fields == set(STRUCTURED_ANSWER)
+    assert STRUCTURED_ANSWER["diagnosis"] in answer and "【医学依据】" in answer
+    assert not any(marker in answer for marker in ERROR_MARKERS)
+    assert not any(event.type == StreamEventType.DEGRADED for event in events)
+
+
+def test_structured_mode_async(offline_agent):
+    """异步接口的结构化模式同样正常输出"""
+    session = structured_session(offline_agent)
+    answer = asyncio.run(session.aquery("带状疱疹用什么药"))
+    assert STRUCTURED_ANSWER["diagnosis"] in answer
+    assert not any(marker in answer for marker in ERROR_MARKERS)
+
+
+def test_structured_failure_falls_back_to_plain_integration(offline_agent):
+    """结构化输出出错且尚未输出内容时回退到普通整合，而不是返回错误说明"""
+    session = structured_session(offline_agent)
+
+    def fail(inputs):
+        raise ValueError("structured chain broken")
+
+    session.json_integration_chain = RunnableLambda(fail)
+    for answer in (session.query("湿疹用什么药"), asyncio.run(session.aquery("荨麻疹用什么药"))):
+        assert answer.startswith("综合分析")
+        assert not any(marker in answer for marker in ERROR_MARKERS)
+
+
+def test_semantic_cache_is_not_shared_across_conversations(offline_agent):
+    """会话首轮的通用问答可复用；有之前对话的追问和不含医学实体的问题不使用语义缓存"""
+    parent = offline_agent.spawn_session()
+    parent.semantic_cache = SemanticCache(
+        FakeEmbeddings(), similarity_threshold=0.5,
+        entity_extractor=load_entity_matcher(os.path.join(ROOT, "basic_app", "term.txt")).extract
+    )
+    first, second = parent.spawn_session(), parent.spawn_session()
+    first.query("湿疹用什么药膏")
+    second.query("痤疮用什么药")
+    first_follow_up = first.query("平时需要注意什么")
+    second_follow_up = second.query("平时需要注意什么")
+    assert parent.semantic_cache.stats()["hits"] == 0
+    assert first_follow_up != second_follow_up
+
+    # 新会话首轮的复述问题命中
+    third = parent.spawn_session()
+    assert third.query("湿疹用什么药膏呢") == first.get_conversation_history()[1]["content"]
+    assert parent.semantic_cache.stats()["hits"] == 1
+
+
+def test_citation_failing_midstream_is_not_cached(offline_agent):
+    """医学依据输出一部分后出错：回答标注降级，整合结果不写入缓存，成功的知识分支照常缓存"""
+    def broken_stream(diagnosis, treatment):
+        yield "依据片段"
+        raise RuntimeError("citation broken")
+
+    async def abroken_stream(diagnosis, treatment):
+        yield "依据片段"
+        raise RuntimeError("citation broken")
+
+    session = offline_agent.spawn_session()
+    session.response_cache = ResponseCache()
+    session.explanation_component = copy.copy(offline_agent.explanation_component)
+    session.explanation_component.stream_citation_explanation = broken_stream
+    session.explanation_component.astream_citation_explanation = abroken_stream
+
+    events = list(session.stream_query("湿疹用什么药"))
+    degraded = [event for event in events if event.type == StreamEventType.DEGRADED]
+    assert [json.loads(event.content) for event in degraded] == [{"citation": "出错"}]
+    assert "依据片段" in events[-1].content and "医学依据（出错）" in events[-1].content
+    assert asyncio.run(session.aquery("荨麻疹用什么药")).endswith("医学依据（出错））")
+    assert cached_namespaces(session.response_cache) == {"tcm", "wm"}
+
+
+def test_failed_branch_is_not_cached(offline_agent):
+    """知识分支查询失败时以说明文字参与整合，该分支和整合结果都不写入缓存"""
+    def fail(question):
+        raise KnowledgeQueryError("西医知识查询出错: vector store down")
+
+    async def afail(question):
+        fail(question)
+
+    session = offline_agent.spawn_session()
+    session.response_cache = ResponseCache()
+    session.wm_agent = copy.copy(offline_agent.wm_agent)
+    session.wm_agent.fetch, session.wm_agent.afetch = fail, afail
+
+    assert "西医知识查询（出错）" in session.query("湿疹用什么药")
+    assert "西医知识查询（出错）" in asyncio.run(session.aquery("荨麻疹用什么药"))
+    assert cached_namespaces(session.response_cache) == {"tcm"}
+
+
+def test_timed_out_branch_releases_inflight_key(offline_agent):
+    """超时的知识分支仍在后台执行时释放合并键，之后的相同问题不会等待这次查询"""
+    release = threading.Event()
+    session = offline_agent.spawn_session()
+    session.wm_agent = copy.copy(offline_agent.wm_agent)
+    session.wm_agent.inflight = SingleFlight("wm")
+    session.wm_agent._query = lambda question: release.wait(5) and "西医知识"
+    try:
+        assert "西医知识查询（超时）" in session.query("湿疹用什么药", deadline=1)
+        assert not session.wm_agent.inflight._calls
+    finally:
+        release.set()
+
+
+def test_batch_resume_reruns_degraded_answers(offline_agent, tmp_path):
+    """批量续跑只跳过status为ok的结果，降级的回答重新处理"""
+    sink = str(tmp_path / "batch.jsonl")
+    questions = ["湿疹用什么药", "荨麻疹用什么药"]
+
+    async def afail(question):
+        raise KnowledgeQueryError("西医知识查询出错: vector store down")
+
+    broken = offline_agent.spawn_session()
+    broken.wm_agent = copy.copy(offline_agent.wm_agent)
+    broken.wm_agent.afetch = afail
+    results = broken.batch_query(questions, sink_path=sink)
+    assert [record["status"] for record in results] == ["degraded", "degraded"]
+    assert results[0]["degraded"] == {"wm": "出错"}
+
+    calls = []
+
+    async def counted(question):
+        calls.append(question)
+        return await offline_agent.wm_agent.afetch(question)
+
+    working = offline_agent.spawn_session()
+    working.wm_agent = copy.copy(offline_agent.wm_agent)
+    working.wm_agent.afetch = counted
+    assert [record["status"] for record in working.batch_query(questions, sink_path=sink)] == ["ok", "ok"]
+    assert working.batch_query(questions, sink_path=sink)[1]["answer"].startswith("综合分析")
+    assert sorted(calls) == sorted(questions)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试增量JSON解析器（离线，无需LLM）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.json_stream import StreamingJsonParser
+
+
+def parse_in_chunks(text, size=3):
+    """按固定大小分块读入，返回(按完成顺序的字段列表, 解析结果)"""
+    parser = StreamingJsonParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    completed.extend(parser.close())
+    return completed, parser.result()
+
+
+def test_fields_complete_before_end_of_stream():
+    """顶层字段一结束就返回，不等待整个对象"""
+    parser = StreamingJsonParser()
+    assert parser.feed('{"diagnosis": "湿疹", "reason') == [("diagnosis", "湿疹")]
+    assert parser.feed('ing": ["湿热", "瘙痒"], ') == [("reasoning", ["湿热", "瘙痒"])]
+    assert parser.feed('"confidence": 8}') == [("confidence", 8)]
+    assert parser.close() == []
+
+
+def test_chunk_boundaries_do_not_change_result():
+    """任意分块方式得到相同结果"""
+    text = '```json\n{"a": "x\\"y", "b": {"c": [1, 2]}, "d": true}\n```'
+    expected = {"a": 'x"y', "b": {"c": [1, 2]}, "d": True}
+    for size in (1, 2, 5, len(text)):
+        assert parse_in_chunks(text, size)[1] == expected
+
+
+def test_repairs_common_llm_mistakes():
+    """修复未转义的引号和换行、非法转义、多余逗号和字段间缺少的逗号"""
+    text = '前言 {"a": "他说"好"", "b": "第一行\n第二行", "c": "C:\\d", "e": [1, 2,], "f": "x"\n"g": "y"} 后记'
+    _, result = parse_in_chunks(text)
+    assert result == {"a": '他说"好"', "b": "第一行\n第二行", "c": "C:\\d", "e": [1, 2], "f": "x", "g": "y"}
+
+
+def test_truncated_output_is_closed():
+    """输出被截断时补全未闭合的字符串和括号"""
+    _, result = parse_in_chunks('{"a": 1, "b": ["x", {"c": "未完')
+    assert result == {"a": 1, "b": ["x", {"c": "未完"}]}
+
+
+def test_non_json_output_falls_back_to_raw_text():
+    """没有解析出任何字段时返回原始文本"""
+    _, result = parse_in_chunks("  抱歉，无法给出结构化结果  ")
+    assert result == {"raw_output": "抱歉，无法给出结构化结果"}
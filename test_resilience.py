@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试LLM调用容错（离线，使用按脚本返回的替身模型）
+"""
+import sys
+import os
+import asyncio
+import time
+import uuid
+from typing import Any, Iterator, List, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from src.config.settings import RESILIENCE_CONFIG
+from src.utils.resilience import CircuitOpenError, LLMEndpoint, ResilientChatModel
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按脚本依次响应的聊天模型：脚本项为要抛出的异常，或(延迟秒数, 回复文本)"""
+
+    script: List[Any]
+    calls: int = 0
+    cancelled: List[str] = []   # 异步调用被取消时记录其回复文本
+    closed: List[str] = []      # 流在读完前被关闭时记录其回复文本
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _next(self):
+        self.calls += 1
+        item = self.script.pop(0)
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, text = self._next()
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, text = self._next()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        delay, text = self._next()
+        time.sleep(delay)
+        try:
+            for char in text:
+                yield ChatGenerationChunk(message=AIMessageChunk(content=char))
+        except GeneratorExit:
+            self.closed.append(text)
+            raise
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """缩短退避、对冲和熔断的等待时间"""
+    for key, value in {"backoff_base": 0.001, "backoff_max": 0.01, "max_retries": 2,
+                       "hedge_min_delay": 0.05, "hedge_min_samples": 1, "max_hedge_ratio": 1.0,
+                       "failure_threshold": 2, "reset_timeout": 0.1}.items():
+        monkeypatch.setitem(RESILIENCE_CONFIG, key, value)
+    return RESILIENCE_CONFIG
+
+
+def resilient(*script) -> ResilientChatModel:
+    """包装脚本模型，每个测试使用独立的端点状态"""
+    return ResilientChatModel(inner=ScriptedChatModel(script=list(script)), endpoint_name=f"test-{uuid.uuid4().hex}")
+
+
+def test_transient_error_is_retried(config):
+    """连接失败等临时错误重试后成功"""
+    model = resilient(ConnectionError("reset"), (0, "好"))
+    assert model.invoke("问题").content == "好"
+    assert model.inner.calls == 2
+    assert model.endpoint.snapshot()["retries"] == 1
+
+
+def test_non_retryable_error_is_not_retried(config):
+    """非临时错误直接抛出，不重试，也不计入熔断失败"""
+    model = resilient(ValueError("bad request"), (0, "不会用到"))
+    with pytest.raises(ValueError):
+        model.invoke("问题")
+    assert model.inner.calls == 1
+    assert model.endpoint.snapshot()["retries"] == 0
+    assert model.endpoint.consecutive_failures == 0
+
+
+def test_hedge_fires_after_delay_and_cancels_loser(config):
+    """主请求超过对冲等待时间后发起对冲，采用先完成的结果并取消落后的请求"""
+    model = resilient((1.0, "慢"), (0, "快"))
+    model.endpoint.record_success("generate", 0.0)
+    start = time.monotonic()
+    assert asyncio.run(model.ainvoke("问题")).content == "快"
+    assert time.monotonic() - start < 0.5
+    assert model.inner.cancelled == ["慢"]
+    stats = model.endpoint.snapshot()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_stream_hedge_closes_losing_stream(config):
+    """流式对冲按首个片段的等待时间判断，落后的流在打开后被关闭"""
+    model = resilient((0.3, "慢慢"), (0, "快快"))
+    model.endpoint.record_success("first_chunk", 0.0)
+    assert "".join(chunk.content for chunk in model.stream("问题")) == "快快"
+    deadline = time.monotonic() + 2
+    while not model.inner.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.inner.closed == ["慢慢"]
+
+
+def test_breaker_opens_half_opens_and_closes(config):
+    """连续失败后熔断并直接拒绝；经过reset_timeout后放行一个探测请求，失败重新熔断，成功则恢复"""
+    config["max_retries"] = 0
+    model = resilient(ConnectionError(), ConnectionError(), ConnectionError(), (0, "恢复"))
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            model.invoke("问题")
+    assert model.endpoint.state == LLMEndpoint.OPEN
+    with pytest.raises(CircuitOpenError):
+        model.invoke("问题")
+    assert model.inner.calls == 2
+
+    time.sleep(0.15)
+    with pytest.raises(ConnectionError):
+        model.invoke("问题")   # 半开状态下放行的探测请求失败
+    assert model.inner.calls == 3
+    assert model.endpoint.state == LLMEndpoint.OPEN
+
+    time.sleep(0.15)
+    assert model.invoke("问题").content == "恢复"
+    assert model.endpoint.state == LLMEndpoint.CLOSED
+    assert model.endpoint.snapshot()["circuit_opened"] == 2
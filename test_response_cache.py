@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试响应缓存的LRU淘汰、过期和按命名空间失效（离线）
+"""
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from src.utils import response_cache
+from src.utils.response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的时钟"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_key_normalizes_question_but_not_mode_or_context():
+    """问题中的空白、大小写和句末标点不影响缓存键；命名空间、模式和上下文影响缓存键"""
+    key = ResponseCache.make_key("tcm", "湿疹 吃什么药？", "brief", "ctx")
+    assert key == ResponseCache.make_key("tcm", "湿疹吃什么药", "brief", "ctx")
+    assert key != ResponseCache.make_key("wm", "湿疹吃什么药", "brief", "ctx")
+    assert key != ResponseCache.make_key("tcm", "湿疹吃什么药", "detailed", "ctx")
+    assert key != ResponseCache.make_key("tcm", "湿疹吃什么药", "brief", "other")
+
+
+def test_lru_evicts_least_recently_used(clock):
+    """超出容量时淘汰最久未使用的条目，读取会刷新使用顺序"""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "A", "tcm")
+    cache.set("b", "B", "tcm")
+    assert cache.get("a") == "A"
+    cache.set("c", "C", "tcm")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.stats()["memory_entries"] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    """过期条目视为未命中并从内存层删除"""
+    cache = ResponseCache(max_entries=8, ttl_seconds=60)
+    cache.set("a", "A", "tcm")
+    clock.value += 59
+    assert cache.get("a") == "A"
+    clock.value += 1
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "memory_entries": 0}
+
+
+def test_disk_layer_survives_restart_and_invalidation(clock, tmp_path):
+    """磁盘层在新实例中仍可读取，按命名空间失效时同时清除内存层和磁盘层"""
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(max_entries=8, ttl_seconds=60, disk_path=path, max_disk_entries=8)
+    cache.set("tcm-key", "T", "tcm")
+    cache.set("wm-key", "W", "wm")
+
+    reopened = ResponseCache(max_entries=8, ttl_seconds=60, disk_path=path, max_disk_entries=8)
+    assert reopened.get("tcm-key") == "T"
+    reopened.invalidate("tcm")
+    assert reopened.get("tcm-key") is None
+    assert reopened.get("wm-key") == "W"
+    assert ResponseCache(max_entries=8, ttl_seconds=60, disk_path=path).get("tcm-key") is None
+
+
+def test_disk_layer_evicts_least_recently_accessed(clock, tmp_path):
+    """磁盘层超出容量时淘汰最久未访问的条目"""
+    cache = ResponseCache(max_entries=1, ttl_seconds=60, disk_path=str(tmp_path / "cache.sqlite3"),
+                          max_disk_entries=2)
+    for key in "abc":
+        clock.value += 1
+        cache.set(key, key.upper(), "tcm")
+    assert cache.stats()["disk_entries"] == 2
+    assert [cache.get(key) for key in "abc"] == [None, "B", "C"]
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试语义缓存的相似度命中、医学实体匹配、淘汰和过期（离线，使用确定性嵌入模型）
+"""
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from benchmarks.fakes import FakeEmbeddings
+from src.utils import semantic_cache
+from src.utils.semantic_cache import SemanticCache
+
+DISEASES = ("湿疹", "痤疮", "荨麻疹")
+
+
+def extract_diseases(question):
+    return frozenset(name for name in DISEASES if name in question)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的时钟"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(semantic_cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def make_cache(**kwargs):
+    options = dict(similarity_threshold=0.8, max_entries=2, ttl_seconds=60, entity_extractor=extract_diseases)
+    options.update(kwargs)
+    return SemanticCache(FakeEmbeddings(), **options)
+
+
+def test_paraphrase_hits_within_namespace(clock):
+    """复述问题命中同一回答，不同命名空间互不影响"""
+    cache = make_cache()
+    cache.add("湿疹应该吃什么药", "答案", "detailed")
+    assert cache.lookup("湿疹应该吃什么药呢", "detailed") == "答案"
+    assert cache.lookup("湿疹应该吃什么药呢", "brief") is None
+    assert cache.lookup("今天天气怎么样", "detailed") is None
+
+
+def test_different_medical_entities_never_hit(clock):
+    """只差病名的问题向量相近，但医学实体不同，不能复用回答"""
+    cache = make_cache(similarity_threshold=0.5)
+    cache.add("湿疹应该吃什么药", "湿疹的答案", "detailed")
+    assert cache.lookup("痤疮应该吃什么药", "detailed") is None
+    cache.add("痤疮应该吃什么药", "痤疮的答案", "detailed")
+    assert cache.lookup("湿疹应该吃什么药呢", "detailed") == "湿疹的答案"
+    assert cache.lookup("痤疮应该吃什么药呢", "detailed") == "痤疮的答案"
+
+
+def test_entries_expire_after_ttl(clock):
+    """过期条目不再命中"""
+    cache = make_cache()
+    cache.add("湿疹应该吃什么药", "答案", "detailed")
+    clock.value += 60
+    assert cache.lookup("湿疹应该吃什么药", "detailed") is None
+
+
+def test_full_namespace_evicts_least_recently_hit(clock):
+    """容量已满时优先覆盖过期条目，其次是最久未命中的条目"""
+    cache = make_cache()
+    cache.add("湿疹应该吃什么药", "湿疹", "detailed")
+    clock.value += 1
+    cache.add("痤疮应该吃什么药", "痤疮", "detailed")
+    clock.value += 1
+    assert cache.lookup("湿疹应该吃什么药", "detailed") == "湿疹"
+    clock.value += 1
+    cache.add("荨麻疹应该吃什么药", "荨麻疹", "detailed")
+    assert cache.lookup("痤疮应该吃什么药", "detailed") is None
+    assert cache.lookup("湿疹应该吃什么药", "detailed") == "湿疹"
+    assert cache.stats()["entries"] == {"detailed": 2}
+
+
+def test_invalidate_namespace(clock):
+    """按命名空间失效"""
+    cache = make_cache()
+    cache.add("湿疹应该吃什么药", "答案", "detailed")
+    cache.add("湿疹应该吃什么药", "简答", "brief")
+    cache.invalidate("detailed")
+    assert cache.lookup("湿疹应该吃什么药", "detailed") is None
+    assert cache.lookup("湿疹应该吃什么药", "brief") == "简答"
+
+
+def test_questions_without_entities_are_not_cached(clock):
+    """未识别出医学实体的问题既不查找也不写入（所指不明，依赖上下文）"""
+    cache = make_cache()
+    cache.add("平时需要注意什么", "答案", "detailed")
+    assert cache.stats()["entries"] == {}
+    cache.add("湿疹平时需要注意什么", "湿疹的答案", "detailed")
+    assert cache.lookup("平时需要注意什么", "detailed") is None
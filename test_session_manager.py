@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试多会话管理器（离线，使用本地替身模型）
+"""
+import sys
+import os
+import asyncio
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.agents.session_manager import SessionManager
+
+
+def test_sessions_keep_separate_conversations(offline_agent):
+    """不同会话的对话记忆互不影响，共享同一套知识代理"""
+    manager = SessionManager(offline_agent)
+    manager.query("a", "湿疹用什么药")
+    manager.query("b", "荨麻疹用什么药")
+    manager.query("a", "平时需要注意什么")
+    history_a = manager.get_session("a").get_conversation_history()
+    history_b = manager.get_session("b").get_conversation_history()
+    assert [m["content"] for m in history_a if m["role"] == "user"] == ["湿疹用什么药", "平时需要注意什么"]
+    assert [m["content"] for m in history_b if m["role"] == "user"] == ["荨麻疹用什么药"]
+    assert manager.get_session("a").tcm_agent is manager.get_session("b").tcm_agent
+
+
+def test_overflow_evicts_least_recent_idle_session(offline_agent):
+    """超过会话上限时淘汰最久未活动的空闲会话，正在处理请求的会话保留"""
+    manager = SessionManager(offline_agent, max_sessions=2)
+    manager.get_session("busy")
+    manager.get_session("idle")
+    entry = manager._sessions["busy"]
+    with entry.lock:
+        manager.get_session("new")
+        assert manager.list_sessions() == ["busy", "new"]
+        # 其余会话都在处理请求时暂时超出上限，而不是淘汰它们或新会话
+        with manager._sessions["new"].lock:
+            manager.get_session("newer")
+        assert manager.list_sessions() == ["busy", "new", "newer"]
+    manager.get_session("newest")
+    assert len(manager) == 2 and "busy" not in manager.list_sessions()
+
+
+def test_idle_sessions_expire_unless_busy(offline_agent):
+    """空闲超时的会话被清理，正在处理请求的会话不清理"""
+    manager = SessionManager(offline_agent, idle_timeout=0.05)
+    manager.get_session("busy")
+    manager.get_session("idle")
+    time.sleep(0.1)
+    with manager._sessions["busy"].lock:
+        assert manager.evict_idle() == 1
+    assert manager.list_sessions() == ["busy"]
+    time.sleep(0.1)
+    assert manager.evict_idle() == 1 and len(manager) == 0
+
+
+def test_async_lock_follows_event_loop(offline_agent):
+    """同一会话可在先后创建的事件循环中使用异步接口，同一会话的并发请求按顺序执行"""
+    manager = SessionManager(offline_agent)
+
+    async def two_turns(first, second):
+        return await asyncio.gather(manager.aquery("s", first), manager.aquery("s", second))
+
+    asyncio.run(two_turns("湿疹用什么药", "平时需要注意什么"))
+    asyncio.run(two_turns("荨麻疹用什么药", "会传染吗"))
+    history = manager.get_session("s").get_conversation_history()
+    assert [m["role"] for m in history] == ["user", "assistant"] * 4
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试请求合并（离线，无需LLM）
+"""
+import sys
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """同一键的并发调用只执行一次，全部得到相同结果"""
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "k", slow, 21)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "k", slow, 21) for _ in range(3)]
+        release.set()
+        results = [leader.result(5)] + [future.result(5) for future in followers]
+    assert results == [42] * 4
+    assert len(calls) == 1
+
+
+def test_errors_are_shared_and_not_cached():
+    """异常同样传给等待的调用方；请求结束后不缓存，再次调用重新执行"""
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "k", fail)
+        started.wait(5)
+        follower = executor.submit(flight.do, "k", fail)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result(5)
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_forget_releases_key_of_abandoned_call():
+    """放弃的调用仍在执行时，之后的相同请求重新执行；被放弃的调用结束后不移除新调用的合并键"""
+    flight = SingleFlight("test")
+    started_old, started_new = threading.Event(), threading.Event()
+    release_old, release_new = threading.Event(), threading.Event()
+
+    def stuck():
+        started_old.set()
+        release_old.wait(5)
+        return "old"
+
+    def fresh():
+        started_new.set()
+        release_new.wait(5)
+        return "new"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        abandoned = executor.submit(flight.do, "k", stuck)
+        started_old.wait(5)
+        flight.forget("k")
+        leader = executor.submit(flight.do, "k", fresh)
+        assert started_new.wait(5)
+        release_old.set()
+        assert abandoned.result(5) == "old"
+        assert "k" in flight._calls
+        release_new.set()
+        assert leader.result(5) == "new"
+    assert not flight._calls
+
+
+def test_ado_coalesces_coroutines_and_survives_one_cancellation():
+    """协程版本合并同一事件循环中的调用，一个调用方取消不影响其他调用方"""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("k", slow))
+        second = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+    assert len(calls) == 1
+
+
+def test_stream_replays_to_late_joiners_and_closes_source():
+    """后加入的调用方从头回放已产出的片段；所有调用方离开后关闭上游"""
+    flight = SingleFlight("test")
+    produced, closed = [], []
+
+    def source():
+        try:
+            for item in range(5):
+                produced.append(item)
+                yield item
+        finally:
+            closed.append(True)
+
+    first = flight.stream("k", source)
+    assert [next(first), next(first)] == [0, 1]
+    second = flight.stream("k", source)
+    assert list(second) == [0, 1, 2, 3, 4]
+    assert list(first) == [2, 3, 4]
+    assert produced == [0, 1, 2, 3, 4]
+    assert closed == [True]
+
+    abandoned = flight.stream("k2", source)
+    next(abandoned)
+    abandoned.close()
+    assert closed == [True, True]
+
+
+def test_astream_shares_upstream():
+    """异步流在同一事件循环中共享上游"""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def source():
+        calls.append(1)
+        for item in "abc":
+            await asyncio.sleep(0.01)
+            yield item
+
+    async def consume():
+        return "".join([item async for item in flight.astream("k", source)])
+
+    async def main():
+        return await asyncio.gather(consume(), consume())
+
+    assert asyncio.run(main()) == ["abc", "abc"]
+    assert len(calls) == 1
@@ -0,0 +1,43 @@
+"""
+将疾病数据编译为内存映射的二进制存储，并建立持久化的检索索引
+
+用法（在仓库根目录运行）：
+    python tools/build_disease_store.py
+    python tools/build_disease_store.py --source tools/disease.jsonl --output tools/disease.store --index-dir tools/disease.index
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.settings import DISEASE_STORE_CONFIG
+from src.utils.disease_index import DiseaseIndex
+from src.utils.disease_store import DiseaseStore, read_disease_records, write_disease_store
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="编译疾病数据存储")
+    parser.add_argument("--source", default=DISEASE_STORE_CONFIG["source_file"], help="疾病数据JSON文件")
+    parser.add_argument("--output", default=DISEASE_STORE_CONFIG["store_file"], help="输出的存储文件")
+    parser.add_argument("--index-dir", default=DISEASE_STORE_CONFIG["index_dir"], help="输出的检索索引目录")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"未找到疾病数据文件: {args.source}")
+        return 1
+
+    records = read_disease_records(args.source)
+    size = write_disease_store(records, args.output)
+
+    store = DiseaseStore(args.output)
+    assert len(store) == len(records)
+    print(f"已写入 {len(store)} 条疾病数据（字段: {', '.join(store.fields)}），{size / 1024:.1f} KB -> {args.output}")
+    index = DiseaseIndex(store, index_dir=args.index_dir, source_version=store.version)
+    print(f"已建立检索索引（{len(index.terms)} 个词）-> {args.index_dir}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())